@@ -1,9 +1,27 @@
 # aibot/model.py
+import os
+import time
+import queue
+import codecs
 import logging
-import requests
+import threading
 from pathlib import Path
 from typing import Optional, Dict
 
+import requests
+
+from .autotune import default_tuning_path, load_tuning
+from .backends import DEFAULT_BACKEND, get_backend
+from .downloads import DownloadManager
+from .model_registry import ModelRegistry, ModelMemoryError, physical_memory_bytes
+from .response_cache import RESPONSE_CACHE
+from .near_duplicate_cache import NEAR_DUPLICATE_CACHE
+from .prefix_cache import PREFIX_CACHE, common_token_prefix
+from .context_builder import build_conversation_prompt, format_prompt
+from .speculative import DEFAULT_DRAFT_TOKENS, SpeculativeDecoder, supports_speculation
+from .fair_queue import DEFAULT_PRIORITY, SlotArbiter, WeightedFairQueue, priority_class
+from .metrics import record_generation
+
 # ======================================================
 # LOGGING
 # ======================================================
@@ -22,28 +40,48 @@ AVAILABLE_MODELS = {
         "name": "Mistral-7B-Instruct-v0.2",
         "file": "mistral-7b-instruct-v0.2.Q4_K_M.gguf",
         "model_type": "mistral",
+        "backend": "ctransformers",     # inference engine, see aibot/backends.py
         "url": "https://huggingface.co/TheBloke/Mistral-7B-Instruct-v0.2-GGUF/resolve/main/mistral-7b-instruct-v0.2.Q4_K_M.gguf",
+        # SHA-256 of the GGUF (the LFS object id on its Hugging Face file page).
+        # Downloads are verified against it; when unset, against the one
+        # Hugging Face publishes with the file (see downloads.py).
+        "sha256": os.getenv("AIBOT_MISTRAL_SHA256") or None,
         "config": {
             "gpu_layers": 30,           # stable for 4GB VRAM
             "threads": 12,              # CPU threads
             "context_length": 768,      # faster than 1024
+            "kv_cache_bytes_per_token": 131072,  # 32 layers * 2 * 1024 kv dims * f16
             "temperature": 0.6,
             "top_p": 0.85,
             "top_k": 40,
+            "response_cache": True,     # reuse answers to repeated questions
+            "near_duplicate_threshold": 0.9,  # min similarity to reuse a similar question's answer (None = off)
+            "fallback_model": "tinyllama",  # served instead when Mistral is saturated
+            "rate_limit_weight": 4.0,   # cost of a generated token for rate limiting (rate_limit.py)
+            # Speculative decoding (aibot/speculative.py): e.g. "tinyllama";
+            # needs the llama_cpp backend for both models
+            "draft_model": None,
+            "draft_tokens": 4,          # proposals verified per target pass
         }
     },
     "tinyllama": {
         "name": "TinyLlama-1.1B-Chat-v1.0",
         "file": "tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf",
         "model_type": "llama",
+        "backend": "ctransformers",
         "url": "https://huggingface.co/TheBloke/TinyLlama-1.1B-Chat-v1.0-GGUF/resolve/main/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf",
+        "sha256": os.getenv("AIBOT_TINYLLAMA_SHA256") or None,
         "config": {
             "gpu_layers": 50,           # TinyLlama is smaller, can use more layers
             "threads": 12,              # CPU threads
             "context_length": 1024,     # TinyLlama supports 1024
+            "kv_cache_bytes_per_token": 22528,   # 22 layers * 2 * 256 kv dims * f16
             "temperature": 0.6,
             "top_p": 0.85,
             "top_k": 40,
+            "response_cache": True,     # guests repeat the same questions a lot
+            "near_duplicate_threshold": 0.85,  # ...often with small variations
+            "rate_limit_weight": 1.0,
         }
     }
 }
@@ -52,8 +90,73 @@ AVAILABLE_MODELS = {
 DEFAULT_MODEL = "mistral"
 MODEL_NAME = AVAILABLE_MODELS[DEFAULT_MODEL]["name"]
 
-# Singleton model instances (one per model type)
-_MODELS: Dict[str, Optional[object]] = {key: None for key in AVAILABLE_MODELS.keys()}
+# Load state per model, reported by the readiness endpoint:
+# unloaded -> loading -> loaded -> warming -> ready  (or failed)
+MODEL_STATE: Dict[str, dict] = {
+    key: {"state": "unloaded", "error": None} for key in AVAILABLE_MODELS.keys()
+}
+
+# Models to load and warm at process start ("all" or a comma-separated list)
+PRELOAD_MODELS = [
+    key.strip() for key in os.getenv("AIBOT_PRELOAD_MODELS", "").split(",") if key.strip()
+]
+if PRELOAD_MODELS == ["all"]:
+    PRELOAD_MODELS = list(AVAILABLE_MODELS.keys())
+
+# Memory all loaded models may use together; least-recently-used models are
+# unloaded to make room. Defaults to 75% of host RAM (0 disables eviction).
+MODEL_MEMORY_MB = int(os.getenv("AIBOT_MODEL_MEMORY_MB", str(int(physical_memory_bytes() * 0.75) // (1024 * 1024))))
+
+# Models that are never evicted (defaults to the preloaded ones)
+PINNED_MODELS = [
+    key.strip() for key in os.getenv("AIBOT_PINNED_MODELS", ",".join(PRELOAD_MODELS)).split(",") if key.strip()
+]
+
+
+# Per-host settings written by `manage.py autotune_models`
+TUNING_FILE = Path(os.getenv("AIBOT_TUNING_FILE", "") or default_tuning_path(MODEL_DIR))
+_TUNING: Optional[Dict[str, dict]] = None
+
+
+def model_config(model_type: str) -> dict:
+    """
+    A model's config from AVAILABLE_MODELS with this host's tuned
+    overrides (threads, batch_size, context_length, gpu_layers) applied.
+    The tuning file is read once per process.
+    """
+    global _TUNING
+    if _TUNING is None:
+        _TUNING = load_tuning(TUNING_FILE)
+        if _TUNING:
+            logger.info(f"Using tuned settings from {TUNING_FILE}: {_TUNING}")
+    return {**AVAILABLE_MODELS[model_type]["config"], **_TUNING.get(model_type, {})}
+
+
+# Runs every model on one backend regardless of its "backend" key,
+# e.g. "stub" to exercise the app without model files
+BACKEND_OVERRIDE = os.getenv("AIBOT_INFERENCE_BACKEND", "")
+
+
+def model_backend(model_type: str):
+    """The InferenceBackend that loads and runs this model."""
+    return get_backend(BACKEND_OVERRIDE or AVAILABLE_MODELS[model_type].get("backend", DEFAULT_BACKEND))
+
+
+# Draft model per target, overriding the "draft_model" config, e.g.
+# AIBOT_DRAFT_MODELS="mistral=tinyllama" (an empty draft switches it off)
+DRAFT_MODELS = {
+    target.strip(): draft.strip()
+    for target, _, draft in (entry.partition("=") for entry in os.getenv("AIBOT_DRAFT_MODELS", "").split(","))
+    if target.strip()
+}
+
+
+def draft_model_for(model_type: str) -> Optional[str]:
+    """The model that drafts tokens for speculative decoding of model_type, or None."""
+    draft = DRAFT_MODELS.get(model_type, model_config(model_type).get("draft_model"))
+    if not draft or draft == model_type or draft not in AVAILABLE_MODELS:
+        return None
+    return draft
 
 
 # ======================================================
@@ -62,6 +165,10 @@ _MODELS: Dict[str, Optional[object]] = {key: None for key in AVAILABLE_MODELS.ke
 def download_model(model_type: str = DEFAULT_MODEL):
     """
     Downloads a model from Hugging Face if it doesn't exist locally.
+
+    Interrupted downloads resume where they stopped, the file is fetched in
+    parallel segments, checked against the model's "sha256" (or the one
+    Hugging Face publishes) and only then moved to its final name in MODEL_DIR.
     
     Args:
         model_type (str): Which model to download ('mistral' or 'tinyllama').
@@ -72,7 +179,9 @@ def download_model(model_type: str = DEFAULT_MODEL):
     model_info = AVAILABLE_MODELS[model_type]
     model_path = MODEL_DIR / model_info["file"]
     
-    # Skip if already exists
+    # Skip if already exists (or the backend needs no file)
+    if not model_backend(model_type).needs_model_file:
+        return
     if model_path.exists():
         logger.info(f"✓ Model file already exists: {model_path}")
         return
@@ -81,29 +190,17 @@ def download_model(model_type: str = DEFAULT_MODEL):
     logger.info(f"   Source: {model_info['url']}")
     
     try:
-        response = requests.get(model_info['url'], stream=True, timeout=300)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        chunk_size = 8192
-        
-        with open(model_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        logger.info(f"   Progress: {percent:.1f}% ({downloaded / (1024*1024):.1f} MB)")
-        
+        DownloadManager().download(
+            model_info["url"],
+            model_path,
+            sha256=model_info.get("sha256"),
+            label=model_info["name"],
+        )
         logger.info(f"✅ Model downloaded successfully to {model_path}")
         
     except Exception as e:
+        # The partial file is kept so the next attempt can resume it
         logger.error(f"Failed to download model: {e}")
-        # Clean up partial file if download failed
-        if model_path.exists():
-            model_path.unlink()
         raise
 
 
@@ -113,7 +210,8 @@ def download_model(model_type: str = DEFAULT_MODEL):
 def get_model(model_type: str = DEFAULT_MODEL):
     """
     Loads an AI model only once (lazy loading per model type).
-    Subsequent calls with same model_type reuse the cached model.
+    Subsequent calls with same model_type reuse the cached model, unless it
+    was evicted from MODEL_REGISTRY to make room for another one.
     
     Args:
         model_type (str): Which model to load ('mistral' or 'tinyllama').
@@ -123,46 +221,836 @@ def get_model(model_type: str = DEFAULT_MODEL):
         
     Raises:
         ValueError: If model_type is not supported.
+        ModelMemoryError: If the model does not fit the memory budget.
     """
-    global _MODELS
-    
+    _check_model_type(model_type)
+    return MODEL_REGISTRY.get(model_type)
+
+
+def _check_model_type(model_type: str):
     if model_type not in AVAILABLE_MODELS:
         raise ValueError(
             f"Unsupported model type: {model_type}. "
             f"Available models: {list(AVAILABLE_MODELS.keys())}"
         )
-    
-    # Return cached model if already loaded
-    if _MODELS[model_type] is not None:
-        return _MODELS[model_type]
-    
+
+
+def _registry_load(model_type: str):
+    """Loads a model for MODEL_REGISTRY, keeping MODEL_STATE in step."""
+    MODEL_STATE[model_type] = {"state": "loading", "error": None}
+    try:
+        model = _load_model(model_type)
+    except Exception as e:
+        MODEL_STATE[model_type] = {"state": "failed", "error": str(e)}
+        raise
+    MODEL_STATE[model_type] = {"state": "loaded", "error": None}
+    return model
+
+
+def _model_memory_bytes(model_type: str) -> int:
+    """
+    Estimated resident size of a loaded model: the GGUF weights plus its KV
+    cache, or the model's "memory_bytes" config if set. Nothing is
+    downloaded here; that is left to _load_model.
+    """
+    config = model_config(model_type)
+    if config.get("memory_bytes"):
+        return config["memory_bytes"]
+    if not model_backend(model_type).needs_model_file:
+        return 0
+
+    kv_cache = config.get("kv_cache_bytes_per_token", 0) * config["context_length"]
+    # The draft model is a private copy loaded alongside the target
+    draft = draft_model_for(model_type)
+    draft_bytes = _model_memory_bytes(draft) if draft else 0
+    return _weights_bytes(model_type) + kv_cache + draft_bytes
+
+
+_REMOTE_SIZES: Dict[str, int] = {}
+
+
+def _weights_bytes(model_type: str) -> int:
+    """
+    Size of the model's GGUF: the local file, else the Content-Length its
+    URL announces (asked once per process), else 0 if that is unknown.
+    """
+    model_info = AVAILABLE_MODELS[model_type]
+    model_path = MODEL_DIR / model_info["file"]
+    if model_path.exists():
+        return model_path.stat().st_size
+
+    if model_type not in _REMOTE_SIZES:
+        try:
+            response = requests.head(model_info["url"], allow_redirects=True, timeout=(5, 10))
+            response.raise_for_status()
+            _REMOTE_SIZES[model_type] = int(response.headers.get("content-length") or 0)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"Size of {model_info['file']} unknown ({e}); it is measured once loaded")
+            return 0
+    return _REMOTE_SIZES[model_type]
+
+
+def _reserve_context(model_type: str, nbytes: int) -> bool:
+    """
+    Charges another context of model_type to MODEL_REGISTRY: its KV cache,
+    and for the first one also the weights, which the CPU-only instances
+    page in again where the shared instance keeps layers in VRAM.
+    """
+    if not PREFIX_CACHE.extra_contexts(model_type) and model_backend(model_type).needs_model_file:
+        nbytes += _weights_bytes(model_type)
+    return MODEL_REGISTRY.charge(model_type, nbytes)
+
+
+def _on_model_unloaded(model_type: str):
+    # The cached contexts are further instances of the same model
+    PREFIX_CACHE.clear(model_type)
+    _DRAFT_INSTANCES.pop(model_type, None)
+    MODEL_STATE[model_type] = {"state": "unloaded", "error": None}
+
+
+MODEL_REGISTRY = ModelRegistry(
+    loader=_registry_load,
+    size_of=_model_memory_bytes,
+    budget_bytes=MODEL_MEMORY_MB * 1024 * 1024,
+    pinned=PINNED_MODELS,
+    on_unload=_on_model_unloaded,
+)
+
+
+def _load_model(model_type: str, **overrides):
+    """
+    Downloads (if needed) and loads a model. Use get_model() for the shared
+    instance; `overrides` replace config values (used by the autotuner).
+    """
     model_info = AVAILABLE_MODELS[model_type]
     model_path = MODEL_DIR / model_info["file"]
+    backend = model_backend(model_type)
     
-    logger.info(f"🚀 Loading {model_info['name']} model (first request only)...")
+    logger.info(f"🚀 Loading {model_info['name']} model with {backend.name} (first request only)...")
     
     # Auto-download if missing
-    if not model_path.exists():
+    if backend.needs_model_file and not model_path.exists():
         logger.info(f"⏳ Model not found. Auto-downloading...")
         download_model(model_type)
     
-    # Note: Import inside the function to keep 'ctransformers' out of global scope
-    from ctransformers import AutoModelForCausalLM
-    
-    config = model_info["config"]
-    _MODELS[model_type] = AutoModelForCausalLM.from_pretrained(
-        str(model_path),
-        model_type=model_info["model_type"],
-        gpu_layers=config["gpu_layers"],
-        threads=config["threads"],
-        context_length=config["context_length"],
-    )
+    config = {**model_config(model_type), **overrides}
+    if draft_model_for(model_type) and not config.get("draft"):
+        config.setdefault("logits_all", True)  # every drafted position is sampled
+    model = backend.load(str(model_path), model_info, config)
     
     logger.info(f"✅ {model_info['name']} loaded successfully")
-    return _MODELS[model_type]
+    return model
+
+
+# Draft model instance per target model, used only by the target's worker
+_DRAFT_INSTANCES: Dict[str, object] = {}
+_speculation_warned = set()
+
+
+def _draft_model(model_type: str, target):
+    """
+    The draft model for speculative decoding of model_type (loaded on first
+    use), or None if none is configured or the models can't do it.
+    """
+    draft_type = draft_model_for(model_type)
+    if draft_type is None:
+        return None
+
+    draft = _DRAFT_INSTANCES.get(model_type)
+    if draft is None:
+        context_length = max(
+            model_config(draft_type)["context_length"],
+            model_config(model_type)["context_length"],
+        )
+        draft = _load_model(draft_type, context_length=context_length, draft=True)
+        _DRAFT_INSTANCES[model_type] = draft
+
+    if not (supports_speculation(target) and hasattr(draft, "rewind")):
+        if model_type not in _speculation_warned:
+            _speculation_warned.add(model_type)
+            logger.warning(
+                f"Speculative decoding of {model_type} with {draft_type} needs the "
+                f"llama_cpp backend for both; decoding one token at a time"
+            )
+        return None
+    return draft
+
+
+def build_prompt(message: str) -> str:
+    """
+    Wraps the user's message in the assistant prompt template.
+
+    Args:
+        message (str): The user's message.
+
+    Returns:
+        str: The full prompt passed to the model.
+    """
+    return format_prompt(message)
+
+
+def _generation_kwargs(model_type: str, max_tokens: int) -> dict:
+    """Builds the sampling keyword arguments shared by all generation calls."""
+    config = model_config(model_type)
+    return {
+        "max_new_tokens": max_tokens,
+        "temperature": config["temperature"],
+        "top_p": config["top_p"],
+        "top_k": config["top_k"],
+        "repetition_penalty": 1.05,
+        "stop": ["User:", "Assistant:"],
+    }
+
+
+FALLBACK_RESPONSE = "Sorry, I couldn't generate a response right now."
+
+# Wall-clock limit per generation, counted from when it is queued
+GENERATION_DEADLINE_SECONDS = float(os.getenv("AIBOT_GENERATION_DEADLINE_SECONDS", "120"))
+
+# Why a generation ended
+STOP_EOS = "eos"                        # the model finished its answer
+STOP_SEQUENCE = "stop"                  # a stop string ("User:") was produced
+STOP_LENGTH = "length"                  # max_new_tokens reached
+STOP_CANCELLED = "cancelled"            # cancelled explicitly
+STOP_DISCONNECT = "client_disconnect"   # nobody is waiting for the answer any more
+STOP_DEADLINE = "deadline"              # GENERATION_DEADLINE_SECONDS passed
+STOP_CACHED = "cached"                  # served from the response cache
+STOP_ERROR = "error"                    # generation failed; FALLBACK_RESPONSE returned
+
+# The answer was cut short; partial output is stored with a "truncated" status
+TRUNCATED_STOP_REASONS = {STOP_CANCELLED, STOP_DISCONNECT, STOP_DEADLINE}
+
+
+class GenerationResult(str):
+    """
+    The generated text (a plain str to callers) plus why generation stopped
+    and its inference stats:
+
+        prompt_tokens, generated_tokens, prompt_eval_ms, decode_ms,
+        tokens_per_sec, queue_wait_ms, stop_reason
+
+    (only stop_reason for answers that ran no inference of their own).
+    """
+
+    def __new__(cls, text: str, stop_reason: Optional[str] = None, stats: Optional[dict] = None):
+        result = super().__new__(cls, text)
+        result.stop_reason = stop_reason
+        result.stats = {**(stats or {}), "stop_reason": stop_reason}
+        return result
+
+    @property
+    def truncated(self) -> bool:
+        return self.stop_reason in TRUNCATED_STOP_REASONS
+
+
+# ======================================================
+# TOKEN-LEVEL GENERATION (WITH PROMPT-PREFIX REUSE)
+# ======================================================
+def _tokenize_continuation(model, text: str):
+    """Tokenizes text that is appended to an existing context (no BOS token)."""
+    try:
+        return model.tokenize(text, add_bos_token=False)
+    except TypeError:
+        # Older ctransformers releases never add BOS in tokenize()
+        return model.tokenize(text)
+
+
+def run_generation(model_type: str, prompt: str, kwargs: dict,
+                   session_key=None, on_chunk=None, stats: Optional[dict] = None,
+                   should_stop=None) -> str:
+    """
+    Generates a completion for `prompt`, evaluating only the part of the
+    prompt that is not already in a cached context (see aibot/prefix_cache.py).
+    Must only be called from the model's scheduler worker.
+
+    Args:
+        model_type (str): Which model to use.
+        prompt (str): Full prompt text.
+        kwargs (dict): Sampling settings from `_generation_kwargs`.
+        session_key: Chat session the prompt belongs to, if any.
+        on_chunk (callable): Called with each chunk of text as it is decoded.
+        stats (dict): If given, filled with token counts, timings and the
+            stop reason.
+        should_stop (callable): Polled after every token; a returned stop
+            reason (e.g. STOP_DEADLINE) ends generation early.
+
+    Returns:
+        str: The generated text, cut at the first stop sequence.
+    """
+    config = model_config(model_type)
+    context_length = config["context_length"]
+    max_new_tokens = kwargs["max_new_tokens"]
+
+    slot, suffix = PREFIX_CACHE.acquire(
+        model_type,
+        prompt,
+        session_key,
+        base_model=get_model(model_type),
+        slot_bytes=config["kv_cache_bytes_per_token"] * context_length,
+        # Extra contexts stay on the CPU so the weights are not offloaded twice
+        open_context=lambda: _load_model(model_type, gpu_layers=0),
+        reserve=lambda nbytes: _reserve_context(model_type, nbytes),
+    )
+    model = slot.model
+    reused_tokens = 0
+
+    try:
+        new_tokens = None
+        if suffix is not None:
+            new_tokens = _tokenize_continuation(model, suffix)
+            if slot.n_tokens + len(new_tokens) + max_new_tokens > context_length:
+                new_tokens = None  # would overflow the context; start over
+            else:
+                reused_tokens = slot.n_tokens
+        elif slot.tokens and hasattr(model, "rewind"):
+            # Keep what the context shares with the prompt (e.g. the system
+            # preamble); at least one token is evaluated for fresh logits
+            prompt_tokens = model.tokenize(prompt)
+            common = common_token_prefix(slot.tokens, prompt_tokens[:-1])
+            if common and len(prompt_tokens) + max_new_tokens <= context_length:
+                model.rewind(common)
+                new_tokens = prompt_tokens[common:]
+                reused_tokens = common
+
+        if new_tokens is None:
+            reset = True
+            new_tokens = model.tokenize(prompt)
+        else:
+            reset = False
+        kept_tokens = slot.tokens[:reused_tokens]
+
+        speculative = None
+        draft = _draft_model(model_type, model)
+        if draft is not None:
+            speculative = SpeculativeDecoder(
+                model,
+                draft,
+                context_text=prompt,
+                tokenize=_tokenize_continuation,
+                draft_tokens=config.get("draft_tokens", DEFAULT_DRAFT_TOKENS),
+            )
+        source = speculative.generate if speculative is not None else model.generate
+        yielded = []
+
+        def generate(tokens, **sampling):
+            for token in source(tokens, **sampling):
+                yielded.append(token)
+                yield token
+
+        started = time.monotonic()
+        text, raw_text, generated, stop_reason, first_token_at = _decode(
+            model, new_tokens, reset, kwargs, on_chunk, should_stop, generate=generate,
+        )
+        finished = time.monotonic()
+
+    except BaseException:
+        PREFIX_CACHE.release(slot, None, [], session_key)
+        raise
+
+    PREFIX_CACHE.release(
+        slot,
+        # The EOS token is evaluated but has no text, so the context can't be continued
+        None if stop_reason == STOP_EOS else prompt + raw_text,
+        kept_tokens + new_tokens + yielded,
+        session_key,
+        reused_tokens=reused_tokens,
+        evaluated_tokens=len(new_tokens),
+    )
+
+    if stats is not None:
+        first_token_at = first_token_at or finished
+        stats.update({
+            "prompt_tokens": reused_tokens + len(new_tokens),
+            "generated_tokens": generated,
+            "prompt_eval_seconds": first_token_at - started,
+            "decode_seconds": finished - first_token_at,
+            "stop_reason": stop_reason,
+        })
+        if speculative is not None:
+            stats.update(speculative.stats())
+    return text
+
+
+def _decode(model, tokens, reset: bool, kwargs: dict, on_chunk=None, should_stop=None,
+            generate=None):
+    """
+    Runs the sampling loop and applies stop sequences. `generate` replaces
+    model.generate as the token source (e.g. a SpeculativeDecoder's).
+
+    Returns:
+        (text, raw_text, generated, stop_reason, first_token_at): the answer
+        without the stop sequence, everything that was decoded into the
+        context, the number of generated tokens, why generation ended (one
+        of the STOP_* reasons), and when the first token arrived (monotonic
+        clock).
+    """
+    stop = kwargs.get("stop") or []
+    hold_back = max((len(s) for s in stop), default=1) - 1
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+    raw_text = ""
+    sent = 0
+    generated = 0
+    stop_reason = STOP_EOS
+    stop_at = None
+    first_token_at = None
+
+    for token in (generate or model.generate)(
+        tokens,
+        top_k=kwargs["top_k"],
+        top_p=kwargs["top_p"],
+        temperature=kwargs["temperature"],
+        repetition_penalty=kwargs["repetition_penalty"],
+        reset=reset,
+    ):
+        if first_token_at is None:
+            first_token_at = time.monotonic()
+        generated += 1
+        raw_text += decoder.decode(model.detokenize([token], decode=False))
+
+        for s in stop:
+            index = raw_text.find(s, max(0, sent - len(s)))
+            if index != -1 and (stop_at is None or index < stop_at):
+                stop_at = index
+        if stop_at is not None:
+            stop_reason = STOP_SEQUENCE
+            break
+
+        # Emit everything that can no longer turn into a stop sequence
+        safe = len(raw_text) - hold_back
+        if on_chunk is not None and safe > sent:
+            on_chunk(raw_text[sent:safe])
+            sent = safe
+
+        if generated >= kwargs["max_new_tokens"]:
+            stop_reason = STOP_LENGTH
+            break
+
+        interrupted = should_stop() if should_stop is not None else None
+        if interrupted:
+            stop_reason = interrupted
+            break
+
+    text = raw_text if stop_at is None else raw_text[:stop_at]
+    if on_chunk is not None and len(text) > sent:
+        on_chunk(text[sent:])
+    return text, raw_text, generated, stop_reason, first_token_at
+
+
+# ======================================================
+# INFERENCE SCHEDULER (QUEUE IN FRONT OF THE MODEL SINGLETONS)
+# ======================================================
+# A llama context can only run one generation at a time, so each model gets
+# exactly one worker thread that owns it. INFERENCE_SLOTS caps how many of
+# those workers may generate at once, because all models share the same CPU
+# threads. Every job carries a priority class (see fair_queue.py): both a
+# model's queue and the slots shared by all models are served in weighted
+# fair order between the classes.
+INFERENCE_SLOTS = int(os.getenv("AIBOT_INFERENCE_SLOTS", "1"))
+MAX_QUEUE_DEPTH = int(os.getenv("AIBOT_MAX_QUEUE_DEPTH", "16"))
+# Jobs arriving within COALESCE_WINDOW_MS of each other are taken as one
+# group (at most MAX_COALESCED_JOBS) so identical prompts in it share a
+# generation. This is coalescing, not batching: a llama context runs one
+# sequence at a time, so the jobs of a group still run one after another.
+# (The old AIBOT_BATCH_WINDOW_MS / AIBOT_MAX_BATCH_SIZE names are still read.)
+COALESCE_WINDOW_MS = int(os.getenv("AIBOT_COALESCE_WINDOW_MS", os.getenv("AIBOT_BATCH_WINDOW_MS", "10")))
+MAX_COALESCED_JOBS = int(os.getenv("AIBOT_MAX_COALESCED_JOBS", os.getenv("AIBOT_MAX_BATCH_SIZE", "4")))
+
+_STREAM_END = object()
+
+
+class InferenceOverloaded(Exception):
+    """Raised when a model's queue is full and the request is shed."""
+
+    def __init__(self, model_type: str, depth: int, retry_after: int):
+        super().__init__(f"{model_type} inference queue is full ({depth} waiting)")
+        self.model_type = model_type
+        self.depth = depth
+        self.retry_after = retry_after
+
 
+class InferenceJob:
+    """One queued generation request and the channel its result comes back on."""
 
-def generate_ai_response(message: str, max_tokens: int = 256, model_type: str = DEFAULT_MODEL) -> str:
+    def __init__(self, message: str, kwargs: dict, stream: bool = False, session_key=None,
+                 history=None, timeout: Optional[float] = None, priority: str = DEFAULT_PRIORITY):
+        self.message = message
+        self.history = [tuple(turn) for turn in history or []]
+        self.kwargs = kwargs
+        self.stream = stream
+        self.session_key = session_key
+        self.priority = priority_class(priority)
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.deadline = self.enqueued_at + timeout if timeout else None
+        self.stop_reason = None
+        self.stats = {}  # see GenerationResult; set when the job finishes
+        self._cancel_reason = None
+
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._chunks = queue.Queue() if stream else None
+
+    @property
+    def coalesce_key(self):
+        """Identical non-streaming prompts in one group share a generation."""
+        if self.stream:
+            return None
+        return (
+            self.message,
+            tuple(self.history),
+            tuple(sorted((k, str(v)) for k, v in self.kwargs.items())),
+        )
+
+    def cancel(self, reason: str = STOP_CANCELLED):
+        """Asks the worker to stop; it does so before the next token (or skips the job)."""
+        if self._cancel_reason is None:
+            self._cancel_reason = reason
+
+    # --- worker side ---
+    def interrupt_reason(self) -> Optional[str]:
+        """Why the job should stop now (cancelled / past its deadline), or None."""
+        if self._cancel_reason is not None:
+            return self._cancel_reason
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return STOP_DEADLINE
+        return None
+
+    def push_chunk(self, chunk: str):
+        self._chunks.put(chunk)
+
+    def finish(self, result: Optional[str] = None, error: Optional[BaseException] = None,
+               stop_reason: Optional[str] = None, stats: Optional[dict] = None):
+        self.stop_reason = stop_reason if error is None else STOP_ERROR
+        self.stats = _job_stats(self, stats or {}, self.stop_reason)
+        self._result = result
+        self._error = error
+        if self.stream:
+            self._chunks.put(_STREAM_END)
+        self._done.set()
+
+    # --- caller side ---
+    def result(self, timeout: Optional[float] = None) -> str:
+        """Blocks until the job is done and returns the generated text."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Inference job did not finish in time")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def chunks(self):
+        """Yields streamed chunks until the worker finishes the job."""
+        while True:
+            chunk = self._chunks.get()
+            if chunk is _STREAM_END:
+                break
+            yield chunk
+        if self._error is not None:
+            raise self._error
+
+
+def _job_stats(job: InferenceJob, stats: dict, stop_reason: Optional[str]) -> dict:
+    """The public inference stats of a finished job, from run_generation's stats."""
+    generated = stats.get("generated_tokens", 0)
+    decode_seconds = stats.get("decode_seconds", 0.0)
+    started_at = job.started_at or time.monotonic()
+    result = {
+        "prompt_tokens": stats.get("prompt_tokens", 0),
+        "generated_tokens": generated,
+        "prompt_eval_ms": round(stats.get("prompt_eval_seconds", 0.0) * 1000),
+        "decode_ms": round(decode_seconds * 1000),
+        # The first token is produced by the prompt pass
+        "tokens_per_sec": round((generated - 1) / decode_seconds, 2) if generated > 1 and decode_seconds > 0 else None,
+        "queue_wait_ms": round((started_at - job.enqueued_at) * 1000),
+        "priority": job.priority,
+        "stop_reason": stop_reason,
+    }
+    for key in ("draft_proposed", "draft_accepted"):
+        if key in stats:
+            result[key] = stats[key]
+    return result
+
+
+class ModelQueue:
+    """
+    Request queue and worker for a single model.
+
+    The worker takes the next job in weighted fair order between priority
+    classes, then keeps collecting jobs that arrive within COALESCE_WINDOW_MS
+    (up to MAX_COALESCED_JOBS) and runs them back-to-back, taking an
+    inference slot from the arbiter for each. Identical prompts in the same
+    group are generated once and the answer is shared; there is no batched
+    forward pass, so distinct prompts gain nothing from being grouped.
+    """
+
+    def __init__(self, model_type: str, slots: SlotArbiter,
+                 max_depth: int = MAX_QUEUE_DEPTH,
+                 coalesce_window_ms: int = COALESCE_WINDOW_MS,
+                 max_coalesced_jobs: int = MAX_COALESCED_JOBS):
+        self.model_type = model_type
+        self.max_depth = max_depth
+        self.coalesce_window = coalesce_window_ms / 1000
+        self.max_coalesced_jobs = max(1, max_coalesced_jobs)
+
+        self._slots = slots
+        self._pending = WeightedFairQueue()
+        self._cond = threading.Condition()
+        self._worker = None
+
+        # Exponentially weighted average of seconds spent per job,
+        # used to tell shed clients when to come back.
+        self.avg_job_seconds = 0.0
+        # Same for decode speed, used by the model router.
+        self.tokens_per_sec = 0.0
+        self.completed = 0
+        self.rejected = 0
+        self.skipped = 0       # cancelled / expired before they started
+        self.interrupted = 0   # cancelled / expired while generating
+        # Speculative decoding totals (draft tokens proposed / accepted)
+        self.draft_steps = 0
+        self.draft_proposed = 0
+        self.draft_accepted = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def depth_by_class(self) -> dict:
+        with self._cond:
+            return self._pending.depths()
+
+    def submit(self, job: InferenceJob) -> InferenceJob:
+        with self._cond:
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                retry_after = max(1, round(self.avg_job_seconds * len(self._pending)))
+                raise InferenceOverloaded(self.model_type, len(self._pending), retry_after)
+
+            self._pending.push(job, job.priority)
+            self._ensure_worker()
+            self._cond.notify()
+        return job
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run,
+                name=f"aibot-inference-{self.model_type}",
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _next_group(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            group = [self._take()]
+            deadline = time.monotonic() + self.coalesce_window
+
+            while len(group) < self.max_coalesced_jobs:
+                if self._pending:
+                    group.append(self._take())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        return group
+
+    def _take(self) -> InferenceJob:
+        """Next pending job; its class is charged the tokens it may generate. Caller holds _cond."""
+        job = self._pending.pop()
+        self._pending.charge(job.priority, job.kwargs.get("max_new_tokens", 1))
+        return job
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            try:
+                self._run_group(group)
+            except Exception as e:
+                logger.exception(f"Inference worker for {self.model_type} failed")
+                for job in group:
+                    if not job._done.is_set():
+                        job.finish(error=e)
+
+    def _run_group(self, group):
+        shared = {}
+        for job in group:
+            key = job.coalesce_key
+            if key is not None and key in shared:
+                job.started_at = time.monotonic()
+                job.finish(result=shared[key][0], stop_reason=shared[key][1])
+                continue
+
+            # Cancelled or expired while queued: leave the CPU to live requests
+            if self._skip_interrupted(job):
+                continue
+
+            with self._slots.slot(job.priority):
+                job.started_at = time.monotonic()
+                if self._skip_interrupted(job):
+                    continue
+                generated = self._generate(job)
+            if generated is None:
+                continue
+            result, stats = generated
+
+            stop_reason = stats.get("stop_reason")
+            if stop_reason in TRUNCATED_STOP_REASONS:
+                self.interrupted += 1
+            elif key is not None:
+                # A cut-short answer is not shared with identical requests
+                shared[key] = (result, stop_reason)
+            job.finish(result=result, stop_reason=stop_reason, stats=stats)
+
+            elapsed = time.monotonic() - job.started_at
+            self.completed += 1
+            self.avg_job_seconds = _ewma(self.avg_job_seconds, elapsed, self.completed == 1)
+
+            if "draft_proposed" in stats:
+                self.draft_steps += stats["draft_steps"]
+                self.draft_proposed += stats["draft_proposed"]
+                self.draft_accepted += stats["draft_accepted"]
+
+            if stats.get("generated_tokens", 0) > 1 and stats["decode_seconds"] > 0:
+                rate = (stats["generated_tokens"] - 1) / stats["decode_seconds"]
+                self.tokens_per_sec = _ewma(self.tokens_per_sec, rate, not self.tokens_per_sec)
+
+    def _skip_interrupted(self, job: InferenceJob) -> bool:
+        interrupted = job.interrupt_reason()
+        if not interrupted:
+            return False
+        job.started_at = job.started_at or time.monotonic()
+        self.skipped += 1
+        job.finish(result="", stop_reason=interrupted)
+        return True
+
+    def _generate(self, job: InferenceJob):
+        """Runs one job. Returns (text, run_generation stats), or None if it failed."""
+        try:
+            config = model_config(self.model_type)
+            # The lease keeps the model from being evicted mid-generation
+            with MODEL_REGISTRY.use(self.model_type) as model:
+                prompt = build_conversation_prompt(
+                    model,
+                    self.model_type,
+                    job.message,
+                    job.history,
+                    context_length=config["context_length"],
+                    max_new_tokens=job.kwargs["max_new_tokens"],
+                    session_key=job.session_key,
+                )
+                stats = {}
+                result = run_generation(
+                    self.model_type,
+                    prompt,
+                    job.kwargs,
+                    session_key=job.session_key,
+                    on_chunk=job.push_chunk if job.stream else None,
+                    stats=stats,
+                    should_stop=job.interrupt_reason,
+                )
+        except Exception as e:
+            job.finish(error=e)
+            return None
+        return result, stats
+
+
+def _ewma(average: float, sample: float, first: bool) -> float:
+    return sample if first else 0.8 * average + 0.2 * sample
+
+
+class InferenceScheduler:
+    """Owns one ModelQueue per entry in AVAILABLE_MODELS."""
+
+    def __init__(self, slots: int = INFERENCE_SLOTS):
+        self._slots = SlotArbiter(slots)
+        self.queues = {
+            key: ModelQueue(key, self._slots)
+            for key in AVAILABLE_MODELS.keys()
+        }
+
+    def submit(self, model_type: str, message: str, kwargs: dict, stream: bool = False,
+               session_key=None, history=None, timeout: Optional[float] = None,
+               priority: str = DEFAULT_PRIORITY) -> InferenceJob:
+        """
+        Queues a generation for the given model. The prompt is assembled in
+        the worker from the message and as much history as fits the model's
+        context. Prompts sharing a session_key are steered to the same
+        cached context. After `timeout` seconds the job stops where it is
+        (or is skipped if it has not started). `priority` is the job's
+        class in the fair queues (see fair_queue.PRIORITY_WEIGHTS).
+
+        Raises:
+            ValueError: If model_type is not supported.
+            InferenceOverloaded: If the model's queue is full.
+        """
+        if model_type not in self.queues:
+            raise ValueError(f"Unsupported model type: {model_type}")
+        return self.queues[model_type].submit(
+            InferenceJob(message, kwargs, stream=stream, session_key=session_key,
+                         history=history, timeout=timeout, priority=priority)
+        )
+
+    def queue_depth(self, model_type: str) -> int:
+        return self.queues[model_type].depth
+
+    def stats(self) -> dict:
+        return {
+            key: {
+                "queue_depth": q.depth,
+                "queue_depth_by_class": q.depth_by_class(),
+                "max_queue_depth": q.max_depth,
+                "completed": q.completed,
+                "rejected": q.rejected,
+                "skipped": q.skipped,
+                "interrupted": q.interrupted,
+                "avg_job_seconds": round(q.avg_job_seconds, 3),
+                "tokens_per_sec": round(q.tokens_per_sec, 2),
+                "speculative": {
+                    "draft_model": draft_model_for(key),
+                    "steps": q.draft_steps,
+                    "proposed": q.draft_proposed,
+                    "accepted": q.draft_accepted,
+                    "acceptance_rate": round(q.draft_accepted / q.draft_proposed, 3) if q.draft_proposed else None,
+                    # Target tokens produced per verification pass (1.0 = plain decoding)
+                    "tokens_per_step": round((q.draft_accepted + q.draft_steps) / q.draft_steps, 2) if q.draft_steps else None,
+                },
+            }
+            for key, q in self.queues.items()
+        }
+
+
+SCHEDULER = InferenceScheduler()
+
+# When set, generations are sent to the out-of-process inference worker
+# listening on this Unix socket instead of loading models in this process.
+INFERENCE_SOCKET = os.getenv("AIBOT_INFERENCE_SOCKET", "")
+
+
+def get_inference_executor():
+    """
+    Returns whatever runs generations for this process: the local
+    SCHEDULER, or a client for the inference worker. Both expose
+    `submit(model_type, message, kwargs, stream=False, session_key=None, history=None,
+    timeout=None, priority=DEFAULT_PRIORITY)`.
+    """
+    if INFERENCE_SOCKET:
+        from .inference_worker import InferenceWorkerClient
+        return InferenceWorkerClient(INFERENCE_SOCKET)
+    return SCHEDULER
+
+
+# ======================================================
+# AI RESPONSE GENERATION
+# ======================================================
+def generate_ai_response(message: str, max_tokens: int = 256, model_type: str = DEFAULT_MODEL,
+                         session_key=None, history=None, timeout: Optional[float] = None,
+                         priority: str = DEFAULT_PRIORITY) -> GenerationResult:
     """
     Generate an AI response using the specified model.
     
@@ -170,36 +1058,330 @@ def generate_ai_response(message: str, max_tokens: int = 256, model_type: str =
         message (str): The user's message.
         max_tokens (int): The maximum number of tokens to generate.
         model_type (str): Which model to use ('mistral' or 'tinyllama').
+        session_key: Chat session the message belongs to, so the model's
+            evaluated context for that chat can be reused.
+        history (list): Earlier (user_message, ai_response) pairs of the
+            chat, oldest first. Older turns are summarized to fit the context.
+        timeout (float): Seconds (from now, queueing included) after which
+            the answer is cut short; defaults to GENERATION_DEADLINE_SECONDS.
+        priority (str): Scheduling class of the request ("authenticated",
+            "guest", ...; see fair_queue.py).
 
     Returns:
-        str: The AI's generated response.
+        GenerationResult: The AI's generated response (a str), with
+        `stop_reason` / `truncated` telling whether it was cut short and
+        `stats` holding token counts and timings.
+
+    Raises:
+        InferenceOverloaded: If the model's queue is full; callers should
+            answer 503 instead of waiting.
     """
-    try:
-        model = get_model(model_type)
-        model_info = AVAILABLE_MODELS[model_type]
-        config = model_info["config"]
-        
-        prompt = (
-            "You are a helpful, accurate, and concise AI assistant.\n\n"
-            f"User: {message}\n"
-            "Assistant:"
-        )
+    kwargs = _generation_kwargs(model_type, max_tokens)
+    # Answers depend on the history, so only first turns are cached
+    use_cache = _response_cache_enabled(model_type) and not history
+
+    if use_cache:
+        cached = _cached_response(message, model_type, kwargs)
+        if cached is not None:
+            return _recorded(model_type, GenerationResult(cached, STOP_CACHED))
 
-        output = model(
-            prompt,
-            max_new_tokens=max_tokens,
-            temperature=config["temperature"],
-            top_p=config["top_p"],
-            top_k=config["top_k"],
-            repetition_penalty=1.05,
-            stop=["User:", "Assistant:"]
+    try:
+        job = get_inference_executor().submit(
+            model_type,
+            message,
+            kwargs,
+            session_key=session_key,
+            history=history,
+            timeout=timeout or GENERATION_DEADLINE_SECONDS,
+            priority=priority,
         )
+        response = GenerationResult(job.result().strip(), job.stop_reason, job.stats)
 
-        return str(output).strip()
+    except InferenceOverloaded:
+        raise
 
     except Exception as e:
         logger.error(f"AI response generation failed with {model_type}", exc_info=True)
-        return "Sorry, I couldn't generate a response right now."
+        return _recorded(model_type, GenerationResult(FALLBACK_RESPONSE, STOP_ERROR))
+
+    if use_cache and response and not response.truncated:
+        _store_response(message, model_type, kwargs, str(response))
+    return _recorded(model_type, response)
+
+
+def _recorded(model_type: str, result: GenerationResult) -> GenerationResult:
+    """Exports the answer's inference stats (see aibot/metrics.py) and returns it."""
+    record_generation(model_type, result.stats)
+    return result
+
+
+def stream_ai_response(message: str, max_tokens: int = 256, model_type: str = DEFAULT_MODEL,
+                       session_key=None, history=None, timeout: Optional[float] = None,
+                       priority: str = DEFAULT_PRIORITY):
+    """
+    Generate an AI response token by token using the specified model.
+
+    The request is queued immediately, so an overloaded model is reported
+    before any response has been sent. The returned stream yields text
+    chunks as soon as the model produces them. Leading whitespace of the
+    answer is dropped to match `generate_ai_response`.
+
+    Args:
+        message (str): The user's message.
+        max_tokens (int): The maximum number of tokens to generate.
+        model_type (str): Which model to use ('mistral' or 'tinyllama').
+        session_key: Chat session the message belongs to.
+        history (list): Earlier (user_message, ai_response) pairs of the chat.
+        timeout (float): Seconds after which the answer is cut short;
+            defaults to GENERATION_DEADLINE_SECONDS.
+        priority (str): Scheduling class of the request.
+
+    Returns:
+        ResponseStream: Iterable of text chunks. Call `cancel()` when nobody
+        will read the rest; `stop_reason` is set once it is exhausted.
+
+    Raises:
+        InferenceOverloaded: If the model's queue is full.
+    """
+    kwargs = _generation_kwargs(model_type, max_tokens)
+    use_cache = _response_cache_enabled(model_type) and not history
+
+    if use_cache:
+        cached = _cached_response(message, model_type, kwargs)
+        if cached is not None:
+            return ResponseStream.of(cached, STOP_CACHED, model_type)
+
+    try:
+        job = get_inference_executor().submit(
+            model_type,
+            message,
+            kwargs,
+            stream=True,
+            session_key=session_key,
+            history=history,
+            timeout=timeout or GENERATION_DEADLINE_SECONDS,
+            priority=priority,
+        )
+    except InferenceOverloaded:
+        raise
+    except Exception:
+        logger.error(f"AI response streaming failed with {model_type}", exc_info=True)
+        return ResponseStream.of(FALLBACK_RESPONSE, STOP_ERROR, model_type)
+
+    on_complete = None
+    if use_cache:
+        def on_complete(response):
+            _store_response(message, model_type, kwargs, response)
+
+    return ResponseStream(job, model_type, on_complete)
+
+
+class ResponseStream:
+    """
+    The chunks of a streamed answer. Iterate it once; `cancel()` (or
+    closing it part-way, as a WSGI server does when the client goes away)
+    stops the generation at the next token. `stop_reason` and `stats` (see
+    GenerationResult) are complete once it is exhausted.
+    """
+
+    def __init__(self, job, model_type: str, on_complete=None):
+        self.job = job
+        self.model_type = model_type
+        self._on_complete = on_complete
+        self._stop_reason = None
+        self._chunks = self._iter_chunks()
+
+    @classmethod
+    def of(cls, text: str, stop_reason: str, model_type: str) -> "ResponseStream":
+        """A stream with a single, already known chunk."""
+        stream = cls(None, model_type, None)
+        stream._stop_reason = stop_reason
+        stream._chunks = iter([text])
+        record_generation(model_type, stream.stats)
+        return stream
+
+    @property
+    def stop_reason(self) -> Optional[str]:
+        if self._stop_reason is None and self.job is not None:
+            return self.job.stop_reason
+        return self._stop_reason
+
+    @property
+    def truncated(self) -> bool:
+        return self.stop_reason in TRUNCATED_STOP_REASONS
+
+    @property
+    def stats(self) -> dict:
+        stats = dict(self.job.stats) if self.job is not None else {}
+        stats["stop_reason"] = self.stop_reason
+        return stats
+
+    def cancel(self, reason: str = STOP_CANCELLED):
+        if self.job is not None:
+            self.job.cancel(reason)
+
+    def close(self):
+        """Stops reading; the generation is cancelled if it is still running."""
+        if self.job is not None and self.job.stop_reason is None:
+            self.cancel(STOP_DISCONNECT)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    def _iter_chunks(self):
+        parts = []
+        try:
+            for chunk in self.job.chunks():
+                if not parts:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                parts.append(chunk)
+                yield chunk
+
+        except GeneratorExit:
+            self.job.cancel(STOP_DISCONNECT)
+            self._stop_reason = STOP_DISCONNECT
+            record_generation(self.model_type, self.stats)
+            raise
+
+        except Exception:
+            logger.error(f"AI response streaming failed with {self.model_type}", exc_info=True)
+            self._stop_reason = STOP_ERROR
+            record_generation(self.model_type, self.stats)
+            if not parts:
+                yield FALLBACK_RESPONSE
+            return
+
+        record_generation(self.model_type, self.stats)
+        response = "".join(parts).strip()
+        if self._on_complete is not None and response and not self.truncated:
+            self._on_complete(response)
+
+
+def _response_cache_enabled(model_type: str) -> bool:
+    return bool(AVAILABLE_MODELS[model_type]["config"].get("response_cache"))
+
+
+def _cached_response(message: str, model_type: str, kwargs: dict) -> Optional[str]:
+    """An earlier answer to the same question, or to a near-duplicate of it."""
+    cached = RESPONSE_CACHE.get(message, model_type, kwargs)
+    if cached is not None:
+        return cached
+
+    threshold = AVAILABLE_MODELS[model_type]["config"].get("near_duplicate_threshold")
+    if not threshold:
+        return None
+    match = NEAR_DUPLICATE_CACHE.get(message, model_type, kwargs, threshold)
+    if match is None:
+        return None
+
+    answer, similarity = match
+    logger.info(f"Near-duplicate cache hit for {model_type} (similarity {similarity:.2f})")
+    return answer
+
+
+def _store_response(message: str, model_type: str, kwargs: dict, response: str):
+    RESPONSE_CACHE.set(message, model_type, kwargs, response)
+    if AVAILABLE_MODELS[model_type]["config"].get("near_duplicate_threshold"):
+        NEAR_DUPLICATE_CACHE.set(message, model_type, kwargs, response)
+
+
+# ======================================================
+# MODEL PRELOADING & READINESS
+# ======================================================
+WARMUP_MESSAGE = "Hello"
+
+
+def warm_up_model(model_type: str):
+    """
+    Runs a one-token dummy generation through the scheduler so the model's
+    weights are paged in and its worker thread is running.
+    """
+    MODEL_STATE[model_type] = {"state": "warming", "error": None}
+    SCHEDULER.submit(
+        model_type,
+        WARMUP_MESSAGE,
+        {**_generation_kwargs(model_type, 1), "max_new_tokens": 1},
+    ).result()
+    MODEL_STATE[model_type] = {"state": "ready", "error": None}
+
+
+def preload_models(model_types=None, warm_up: bool = True) -> Dict[str, dict]:
+    """
+    Loads (and optionally warms) models ahead of the first request.
+
+    Args:
+        model_types (list | None): Models to preload; defaults to PRELOAD_MODELS,
+            or every model in AVAILABLE_MODELS if none are configured.
+        warm_up (bool): Run a dummy generation after loading.
+
+    Returns:
+        dict: The load state of each requested model.
+    """
+    model_types = model_types or PRELOAD_MODELS or list(AVAILABLE_MODELS.keys())
+
+    for model_type in model_types:
+        if model_type not in AVAILABLE_MODELS:
+            raise ValueError(f"Unsupported model type: {model_type}")
+        try:
+            get_model(model_type)
+            if warm_up:
+                warm_up_model(model_type)
+            else:
+                MODEL_STATE[model_type] = {"state": "ready", "error": None}
+        except Exception as e:
+            logger.error(f"Preloading {model_type} failed", exc_info=True)
+            MODEL_STATE[model_type] = {"state": "failed", "error": str(e)}
+
+    return {key: MODEL_STATE[key] for key in model_types}
+
+
+def start_background_preload() -> threading.Thread:
+    """Preloads PRELOAD_MODELS in a daemon thread so startup is not blocked."""
+    thread = threading.Thread(
+        target=preload_models,
+        name="aibot-preload",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def readiness() -> dict:
+    """
+    Reports whether this process may receive chat traffic.
+
+    With an inference worker configured, the worker's report is returned.
+    Otherwise see `local_readiness`.
+    """
+    if INFERENCE_SOCKET:
+        from .inference_worker import InferenceWorkerClient, InferenceWorkerError
+        try:
+            return InferenceWorkerClient(INFERENCE_SOCKET).status()
+        except InferenceWorkerError as e:
+            return {"ready": False, "error": str(e), "models": {}}
+    return local_readiness()
+
+
+def local_readiness() -> dict:
+    """
+    Reports the load state of the models owned by this process.
+
+    When models are preloaded, the process is ready once every preloaded
+    model is warm. Without preloading, models load lazily on first use and
+    the process is always ready.
+    """
+    required = PRELOAD_MODELS
+    return {
+        "ready": all(MODEL_STATE[key]["state"] == "ready" for key in required),
+        "preload": required,
+        "models": {key: dict(state) for key, state in MODEL_STATE.items()},
+        "memory": MODEL_REGISTRY.stats(),
+    }
 
 
 # ======================================================
@@ -249,4 +1431,4 @@ def format_time_duration(seconds: float) -> str:
 
 
 # Optionally, expose useful exports
-__all__ = ["generate_ai_response", "get_model", "MODEL_NAME", "AVAILABLE_MODELS", "DEFAULT_MODEL", "format_time_duration"]
+__all__ = ["generate_ai_response", "stream_ai_response", "build_prompt", "get_model", "model_config", "model_backend", "draft_model_for", "GenerationResult", "ResponseStream", "TRUNCATED_STOP_REASONS", "SCHEDULER", "MODEL_REGISTRY", "ModelMemoryError", "InferenceOverloaded", "preload_models", "readiness", "RESPONSE_CACHE", "NEAR_DUPLICATE_CACHE", "PREFIX_CACHE", "MODEL_NAME", "AVAILABLE_MODELS", "DEFAULT_MODEL", "format_time_duration"]
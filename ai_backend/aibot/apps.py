@@ -1,6 +1,52 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Programs whose processes serve requests (matched against argv[0]), and
+# modules only imported inside such servers (covers `python -m gunicorn`)
+SERVER_PROGRAMS = {"gunicorn", "uwsgi", "daphne", "uvicorn", "hypercorn", "waitress-serve"}
+SERVER_MODULES = ("uwsgi", "gunicorn.arbiter")
+
 
 class AibotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'aibot'
+
+    def ready(self):
+        # Opt-in: set AIBOT_PRELOAD_MODELS=all (or e.g. "mistral,tinyllama")
+        # to load and warm models as soon as the web process starts.
+        from .ai_model import PRELOAD_MODELS, INFERENCE_SOCKET, start_background_preload
+
+        if not PRELOAD_MODELS or not self._is_serving_process():
+            return
+
+        # Models live in the inference worker; it preloads them itself.
+        if INFERENCE_SOCKET:
+            return
+
+        start_background_preload()
+
+    @staticmethod
+    def _is_serving_process():
+        """
+        True for processes that will serve requests: gunicorn, uwsgi and the
+        other SERVER_PROGRAMS, or the runserver child. Everything else
+        (migrate, shell, django-admin, pytest, celery, ...) is not one.
+        Set AIBOT_SERVING_PROCESS=1 (or 0) to decide explicitly, e.g. for
+        a server started from a custom script.
+        """
+        explicit = os.environ.get("AIBOT_SERVING_PROCESS")
+        if explicit:
+            return explicit == "1"
+
+        if any(module in sys.modules for module in SERVER_MODULES):
+            return True
+        program = os.path.basename(sys.argv[0]) if sys.argv else ""
+        if program in SERVER_PROGRAMS:
+            return True
+
+        if sys.argv[1:2] != ["runserver"]:
+            return False
+        # runserver's autoreloader imports apps twice; only the child serves.
+        return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
@@ -0,0 +1,213 @@
+# ======================================================
+# aibot/autotune.py
+# Per-host tuning of inference threads, batch size and context length
+# ======================================================
+#
+# `manage.py autotune_models` loads each model with a few context lengths
+# and, for every thread count and batch size, times prompt evaluation and
+# token generation on this machine. The chosen settings are written to a
+# per-host JSON file:
+#
+#   {"host": "...", "cpu_count": 16, "tuned_at": "...",
+#    "models": {"mistral": {"config": {"threads": 8, "batch_size": 128,
+#                                      "context_length": 1024},
+#                           "measurements": [...]}}}
+#
+# At load time the "config" block is layered over AVAILABLE_MODELS (see
+# ai_model.model_config). Thread count and batch size are per-call
+# settings in ctransformers, so there only the context length needs a
+# reload; llama-cpp-python fixes all three when the model is loaded.
+
+import os
+import json
+import time
+import socket
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger("aibot.autotune")
+
+# Config keys a tuning file may override; anything else in it is ignored
+TUNABLE_KEYS = ("threads", "batch_size", "context_length", "gpu_layers")
+
+# A larger context is only chosen if it keeps this share of the best decode speed
+CONTEXT_SPEED_TOLERANCE = 0.9
+
+BENCHMARK_TEXT = (
+    "The quick brown fox jumps over the lazy dog while the committee reviews "
+    "the quarterly report, discusses the budget and plans the next release. "
+)
+
+
+def default_tuning_path(model_dir) -> Path:
+    return Path(model_dir) / f"tuning-{socket.gethostname()}.json"
+
+
+def load_tuning(path) -> dict:
+    """
+    Reads a tuning file. Returns {model_type: {config overrides}}, or {} if
+    the file is missing, unreadable or was written on another host.
+    """
+    path = Path(path)
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        logger.warning(f"Ignoring unreadable tuning file {path}", exc_info=True)
+        return {}
+
+    host = socket.gethostname()
+    if data.get("host") != host:
+        logger.warning(f"Ignoring tuning file {path}: written on {data.get('host')}, this is {host}")
+        return {}
+
+    return {
+        model_type: {
+            key: value
+            for key, value in entry.get("config", {}).items()
+            if key in TUNABLE_KEYS
+        }
+        for model_type, entry in data.get("models", {}).items()
+    }
+
+
+def save_tuning(path, results: dict):
+    """Writes {model_type: sweep result} as this host's tuning file (merging other models)."""
+    path = Path(path)
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        data = {}
+    if data.get("host") != socket.gethostname():
+        data = {}
+
+    data.update(
+        host=socket.gethostname(),
+        cpu_count=os.cpu_count(),
+        tuned_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    )
+    data.setdefault("models", {}).update(results)
+
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+def default_thread_choices():
+    cpus = os.cpu_count() or 1
+    return sorted({max(1, cpus * share // 4) for share in (1, 2, 3, 4)})
+
+
+def benchmark_tokens(model, count: int):
+    """A deterministic prompt of exactly `count` tokens."""
+    text = BENCHMARK_TEXT
+    tokens = model.tokenize(text)
+    while len(tokens) < count:
+        text += BENCHMARK_TEXT
+        tokens = model.tokenize(text)
+    return tokens[:count]
+
+
+def measure(model, prompt_tokens, generate_tokens: int, threads: int, batch_size: int,
+            repeats: int = 2) -> dict:
+    """
+    Times prompt evaluation and token-by-token generation with the given
+    settings. Returns the best of `repeats` runs (tokens/sec).
+    """
+    prompt_tps = 0.0
+    decode_tps = 0.0
+    for _ in range(repeats):
+        model.reset()
+        started = time.perf_counter()
+        model.eval(prompt_tokens, batch_size=batch_size, threads=threads)
+        evaluated = time.perf_counter()
+
+        for _ in range(generate_tokens):
+            token = model.sample()
+            model.eval([token], batch_size=batch_size, threads=threads)
+        finished = time.perf_counter()
+
+        prompt_tps = max(prompt_tps, len(prompt_tokens) / max(evaluated - started, 1e-9))
+        decode_tps = max(decode_tps, generate_tokens / max(finished - evaluated, 1e-9))
+
+    return {
+        "threads": threads,
+        "batch_size": batch_size,
+        "prompt_tokens_per_sec": round(prompt_tps, 2),
+        "generation_tokens_per_sec": round(decode_tps, 2),
+    }
+
+
+def sweep_model(open_model, context_lengths, thread_choices, batch_sizes,
+                prompt_tokens: int = 256, generate_tokens: int = 32, repeats: int = 2,
+                per_call_settings: bool = True, report=None) -> dict:
+    """
+    Measures every (context_length, threads, batch_size) combination.
+
+    Args:
+        open_model (callable): (context_length, threads, batch_size) -> freshly
+            loaded model.
+        context_lengths, thread_choices, batch_sizes: Values to try.
+        prompt_tokens (int): Prompt size for the prompt-eval measurement
+            (capped to fit the smallest context).
+        generate_tokens (int): Tokens to generate per measurement.
+        repeats (int): Runs per combination; the best is kept.
+        per_call_settings (bool): Whether the backend takes threads and batch
+            size per eval() call; if not, the model is reloaded for each pair.
+        report (callable): Called with each measurement as it completes.
+
+    Returns:
+        dict: {"config": chosen overrides, "measurements": [...]}.
+    """
+    measurements = []
+    for context_length in sorted(context_lengths):
+        model = None
+        try:
+            for threads in thread_choices:
+                for batch_size in batch_sizes:
+                    if model is None or not per_call_settings:
+                        model = None
+                        model = open_model(context_length, threads, batch_size)
+                        n_prompt = min(prompt_tokens, context_length - generate_tokens - 1)
+                        tokens = benchmark_tokens(model, n_prompt)
+                        model.eval(tokens[:8])  # page the weights in before timing
+
+                    result = measure(model, tokens, generate_tokens, threads, batch_size, repeats)
+                    result["context_length"] = context_length
+                    measurements.append(result)
+                    if report is not None:
+                        report(result)
+        finally:
+            del model
+
+    return {"config": choose_config(measurements), "measurements": measurements}
+
+
+def choose_config(measurements) -> dict:
+    """
+    Picks the settings to run with:
+      * threads: fastest generation (decoding dominates chat latency),
+      * batch_size: fastest prompt evaluation at that thread count,
+      * context_length: the largest one that keeps CONTEXT_SPEED_TOLERANCE
+        of the best generation speed.
+    """
+    if not measurements:
+        return {}
+
+    best = max(measurements, key=lambda m: m["generation_tokens_per_sec"])
+    threads = best["threads"]
+
+    with_threads = [m for m in measurements if m["threads"] == threads]
+    batch_size = max(with_threads, key=lambda m: m["prompt_tokens_per_sec"])["batch_size"]
+
+    floor = best["generation_tokens_per_sec"] * CONTEXT_SPEED_TOLERANCE
+    fast_enough = [
+        m["context_length"]
+        for m in with_threads
+        if m["batch_size"] == batch_size and m["generation_tokens_per_sec"] >= floor
+    ]
+    context_length = max(fast_enough, default=best["context_length"])
+
+    return {"threads": threads, "batch_size": batch_size, "context_length": context_length}
@@ -0,0 +1,299 @@
+# ======================================================
+# aibot/backends.py
+# Inference engines behind get_model() / generate_ai_response()
+# ======================================================
+#
+# Each entry in AVAILABLE_MODELS names the engine that runs it with its
+# "backend" key ("ctransformers" when absent), so models can be moved to
+# another engine one at a time and benchmarked side by side.
+#
+# A backend turns a model file into a model object with the small
+# ctransformers-style API the rest of aibot uses:
+#
+#   tokenize(text, add_bos_token=True) -> [int]
+#   detokenize(tokens, decode=True)    -> str (bytes if decode=False)
+#   generate(tokens, *, top_k, top_p, temperature, repetition_penalty, reset=True)
+#       yields sampled tokens; each token is evaluated into the context
+#       before it is yielded and the EOS token ends the loop unyielded.
+#       reset=False appends `tokens` to what the context already holds.
+#   eval(tokens, batch_size=None, threads=None), sample(), reset(),
+#   is_eos_token(token)
+#
+# Models that can verify draft tokens (see speculative.py) also have
+# n_tokens, rewind(n_tokens) and sample_at(position, ...).
+#
+# The engines are imported when a model is loaded, so only the ones
+# actually configured need to be installed.
+
+import time
+import hashlib
+import threading
+from typing import Dict
+
+DEFAULT_BACKEND = "ctransformers"
+
+
+class InferenceBackend:
+    """Loads models for one inference engine."""
+
+    name = ""
+    # Whether the model's GGUF file has to be downloaded and loaded
+    needs_model_file = True
+    # Whether eval() honours per-call threads / batch_size (else they are fixed at load)
+    per_call_settings = True
+
+    def load(self, model_path: str, model_info: dict, config: dict):
+        """
+        Loads a model.
+
+        Args:
+            model_path (str): The GGUF file.
+            model_info (dict): The AVAILABLE_MODELS entry.
+            config (dict): Its effective config (see ai_model.model_config).
+        """
+        raise NotImplementedError
+
+
+# ======================================================
+# CTRANSFORMERS
+# ======================================================
+class CTransformersBackend(InferenceBackend):
+    name = "ctransformers"
+
+    def load(self, model_path, model_info, config):
+        # Note: Import inside the function to keep 'ctransformers' out of global scope
+        from ctransformers import AutoModelForCausalLM
+
+        options = {}
+        if config.get("batch_size"):
+            options["batch_size"] = config["batch_size"]
+        # The returned LLM implements the model API natively
+        return AutoModelForCausalLM.from_pretrained(
+            model_path,
+            model_type=model_info["model_type"],
+            gpu_layers=config["gpu_layers"],
+            threads=config["threads"],
+            context_length=config["context_length"],
+            **options,
+        )
+
+
+# ======================================================
+# LLAMA-CPP-PYTHON
+# ======================================================
+class LlamaCppModel:
+    """Adapts llama_cpp.Llama to the model API."""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.eos_token_id = llm.token_eos()
+
+    def tokenize(self, text: str, add_bos_token: bool = True):
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=add_bos_token)
+
+    def detokenize(self, tokens, decode: bool = True):
+        data = self.llm.detokenize(list(tokens))
+        return data.decode("utf-8", errors="ignore") if decode else data
+
+    def is_eos_token(self, token: int) -> bool:
+        return token == self.eos_token_id
+
+    def reset(self):
+        self.llm.reset()
+
+    def eval(self, tokens, batch_size=None, threads=None):
+        # Thread count and batch size are fixed when the context is created
+        self.llm.eval(list(tokens))
+
+    def sample(self, top_k: int = 40, top_p: float = 0.95, temperature: float = 0.8,
+               repetition_penalty: float = 1.0) -> int:
+        return self.llm.sample(
+            top_k=top_k,
+            top_p=top_p,
+            temp=temperature,
+            repeat_penalty=repetition_penalty,
+        )
+
+    @property
+    def n_tokens(self) -> int:
+        return self.llm.n_tokens
+
+    def rewind(self, n_tokens: int):
+        # The KV cache past n_tokens is dropped by the next eval()
+        self.llm.n_tokens = n_tokens
+
+    def sample_at(self, position: int, top_k: int = 40, top_p: float = 0.95,
+                  temperature: float = 0.8, repetition_penalty: float = 1.0) -> int:
+        # Needs logits for every position (loaded with logits_all)
+        return self.llm.sample(
+            top_k=top_k,
+            top_p=top_p,
+            temp=temperature,
+            repeat_penalty=repetition_penalty,
+            idx=position,
+        )
+
+    def generate(self, tokens, *, top_k=40, top_p=0.95, temperature=0.8,
+                 repetition_penalty=1.0, reset=True):
+        # llama_cpp.Llama.generate() neither stops at EOS nor evaluates the
+        # last token it yields, so the loop is driven here instead
+        if reset:
+            self.reset()
+        self.eval(tokens)
+        while True:
+            token = self.sample(top_k, top_p, temperature, repetition_penalty)
+            self.eval([token])
+            if self.is_eos_token(token):
+                return
+            yield token
+
+
+class LlamaCppBackend(InferenceBackend):
+    name = "llama_cpp"
+    per_call_settings = False
+
+    def load(self, model_path, model_info, config):
+        # Note: Import inside the function to keep 'llama_cpp' out of global scope
+        from llama_cpp import Llama
+
+        options = {}
+        if config.get("batch_size"):
+            options["n_batch"] = config["batch_size"]
+        llm = Llama(
+            model_path=model_path,
+            n_ctx=config["context_length"],
+            n_threads=config["threads"],
+            n_gpu_layers=config["gpu_layers"],
+            # Speculative decoding samples every drafted position
+            logits_all=bool(config.get("logits_all")),
+            verbose=False,
+            **options,
+        )
+        return LlamaCppModel(llm)
+
+
+# ======================================================
+# STUB (TESTS / CI)
+# ======================================================
+STUB_WORDS = (
+    "the model answers with a steady stream of plain words so that timing "
+    "depends only on how many tokens are requested and never on what was asked"
+).split()
+
+
+class StubModel:
+    """
+    Deterministic stand-in for a real model.
+
+    Tokens are words. Evaluating a token takes `prompt_seconds_per_token`,
+    generating one takes `decode_seconds_per_token` (both sleep, so like the
+    native engines they release the GIL); an eval() pass never takes less
+    than one decode step. Each sampled token is a word (or, about once per
+    `answer_tokens`, EOS) picked by a hash of the text of the last few
+    tokens, so answers are a pure function of the prompt and stubs agree
+    with each other when one drafts for another.
+    """
+
+    eos_token_id = 0
+
+    def __init__(self, prompt_seconds_per_token: float = 0.0,
+                 decode_seconds_per_token: float = 0.0, answer_tokens: int = 48):
+        self.prompt_seconds_per_token = prompt_seconds_per_token
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self.answer_tokens = answer_tokens
+        self._vocab = {"": self.eos_token_id}
+        self._words = [""]
+        self._lock = threading.Lock()
+        self._context = []
+
+    def _id(self, piece: str) -> int:
+        with self._lock:
+            if piece not in self._vocab:
+                self._vocab[piece] = len(self._words)
+                self._words.append(piece)
+            return self._vocab[piece]
+
+    def tokenize(self, text: str, add_bos_token: bool = True):
+        pieces = [piece for piece in text.replace("\n", " \n ").split(" ") if piece]
+        return [self._id(" " + piece) for piece in pieces]
+
+    def detokenize(self, tokens, decode: bool = True):
+        text = "".join(self._words[token] for token in tokens)
+        return text if decode else text.encode("utf-8")
+
+    def is_eos_token(self, token: int) -> bool:
+        return token == self.eos_token_id
+
+    def reset(self):
+        self._context = []
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self._context)
+
+    def rewind(self, n_tokens: int):
+        del self._context[n_tokens:]
+
+    def eval(self, tokens, batch_size=None, threads=None):
+        time.sleep(max(len(tokens) * self.prompt_seconds_per_token, self.decode_seconds_per_token))
+        self._context.extend(tokens)
+
+    def sample(self, **kwargs) -> int:
+        return self.sample_at(len(self._context) - 1)
+
+    def sample_at(self, position: int, **kwargs) -> int:
+        recent = self.detokenize(self._context[max(0, position - 15):position + 1])
+        seed = hashlib.sha256(recent.encode()).digest()
+        if int.from_bytes(seed[1:4], "big") % max(1, self.answer_tokens) == 0:
+            return self.eos_token_id
+        return self._id(" " + STUB_WORDS[seed[0] % len(STUB_WORDS)])
+
+    def generate(self, tokens, *, top_k=None, top_p=None, temperature=None,
+                 repetition_penalty=None, reset=True):
+        if reset:
+            self.reset()
+        self.eval(tokens)
+        while True:
+            token = self.sample()
+            self.eval([token])
+            if self.is_eos_token(token):
+                return
+            yield token
+
+
+class StubBackend(InferenceBackend):
+    """Serves StubModels; needs no model file or native library."""
+
+    name = "stub"
+    needs_model_file = False
+
+    def __init__(self, draft_timings=None, **timings):
+        self.timings = timings
+        self.draft_timings = draft_timings or timings
+
+    def load(self, model_path, model_info, config):
+        # Draft models are loaded with draft=True (see ai_model._draft_model)
+        return StubModel(**(self.draft_timings if config.get("draft") else self.timings))
+
+
+# ======================================================
+# LOOKUP
+# ======================================================
+BACKENDS = {
+    backend.name: backend
+    for backend in (CTransformersBackend, LlamaCppBackend, StubBackend)
+}
+
+_instances: Dict[str, InferenceBackend] = {}
+
+
+def get_backend(backend) -> InferenceBackend:
+    """Returns the backend for a name (instances are passed through)."""
+    if isinstance(backend, InferenceBackend):
+        return backend
+    name = backend or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name}. Available: {', '.join(BACKENDS)}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
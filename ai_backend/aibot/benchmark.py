@@ -0,0 +1,505 @@
+# ======================================================
+# aibot/benchmark.py
+# Latency / throughput benchmark of the inference path
+# ======================================================
+#
+# Drives the same entry points production traffic uses at several
+# concurrency levels:
+#
+#   generate     generate_ai_response()          latency
+#   stream       stream_ai_response()            time to first token + latency
+#   view         POST /aibot/chat/               latency through the view
+#   view-stream  POST /aibot/chat-stream/        time to first token + latency
+#
+# and reports p50/p95/p99 of each metric per model as JSON, so runs can be
+# kept and compared (`manage.py benchmark_inference --compare old.json`).
+#
+# Each run can be repeated per decoding mode: "plain" (one token per pass),
+# "speculative" (a draft model proposes tokens, see speculative.py) or
+# "configured" (whatever AVAILABLE_MODELS / AIBOT_DRAFT_MODELS say), and
+# the modes are compared against each other, including the draft
+# acceptance rate.
+#
+# Each model runs on the backend named in AVAILABLE_MODELS, so engines can
+# be compared by benchmarking the same model with a different "backend".
+# With `fake_backend()` every model runs on the stub backend instead, which
+# "evaluates" and "generates" word tokens at a fixed pace (draft models at
+# their own pace). Its output is a
+# pure function of the prompt, so the harness (and the scheduler, caches
+# and views around the model) can be exercised in CI without model files.
+
+import json
+import time
+import socket
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from . import ai_model, rate_limit
+from .ai_model import (
+    AVAILABLE_MODELS,
+    MODEL_REGISTRY,
+    NEAR_DUPLICATE_CACHE,
+    RESPONSE_CACHE,
+    SCHEDULER,
+    InferenceOverloaded,
+    generate_ai_response,
+    model_backend,
+    model_config,
+    stream_ai_response,
+)
+from .backends import StubBackend
+
+logger = logging.getLogger("aibot.benchmark")
+
+TARGETS = ("generate", "stream", "view", "view-stream")
+DEFAULT_TARGETS = ("generate", "stream", "view")
+# View answers counted as "rejected": shed by the scheduler, rate limited
+REJECTED_STATUSES = (503, 429)
+DECODING_MODES = ("configured", "plain", "speculative")
+
+BENCHMARK_QUESTIONS = [
+    "Explain how photosynthesis works in simple terms",
+    "Give me three tips for writing readable Python code",
+    "What is the difference between a process and a thread",
+    "Summarize the causes of the French Revolution",
+    "How does HTTPS keep a connection private",
+    "Suggest a healthy breakfast for a busy morning",
+]
+
+
+# ======================================================
+# FAKE BACKEND
+# ======================================================
+@contextmanager
+def fake_backend(prompt_seconds_per_token: float = 0.0005,
+                 decode_seconds_per_token: float = 0.01, answer_tokens: int = 48,
+                 draft_decode_seconds_per_token: float = 0.002):
+    """
+    Serves every model with the deterministic stub backend (see
+    backends.StubModel) for the duration of the block. Loaded models are
+    dropped on entry and exit.
+    """
+    saved = ai_model.BACKEND_OVERRIDE
+    MODEL_REGISTRY.clear()
+    ai_model.BACKEND_OVERRIDE = StubBackend(
+        prompt_seconds_per_token=prompt_seconds_per_token,
+        decode_seconds_per_token=decode_seconds_per_token,
+        answer_tokens=answer_tokens,
+        draft_timings={
+            "prompt_seconds_per_token": prompt_seconds_per_token,
+            "decode_seconds_per_token": draft_decode_seconds_per_token,
+            "answer_tokens": answer_tokens,
+        },
+    )
+    try:
+        yield
+    finally:
+        MODEL_REGISTRY.clear()
+        ai_model.BACKEND_OVERRIDE = saved
+
+
+@contextmanager
+def decoding_mode(mode: str, models, draft_model=None):
+    """
+    Runs the block with the given decoding mode (see DECODING_MODES).
+    "speculative" uses `draft_model` for models that have no draft
+    configured. Models are reloaded, since targets load differently.
+    """
+    saved = ai_model.DRAFT_MODELS
+    if mode == "plain":
+        ai_model.DRAFT_MODELS = {model_type: "" for model_type in AVAILABLE_MODELS}
+    elif mode == "speculative" and draft_model:
+        ai_model.DRAFT_MODELS = {
+            **saved,
+            **{
+                model_type: draft_model
+                for model_type in models
+                if model_type != draft_model and ai_model.draft_model_for(model_type) is None
+            },
+        }
+    MODEL_REGISTRY.clear()
+    try:
+        if mode == "speculative":
+            for model_type in models:
+                if ai_model.draft_model_for(model_type) is None:
+                    logger.warning(f"{model_type} has no draft model; it is benchmarked with plain decoding")
+        yield
+    finally:
+        MODEL_REGISTRY.clear()
+        ai_model.DRAFT_MODELS = saved
+
+
+@contextmanager
+def rate_limits_lifted():
+    """
+    Admits every chat request for the duration of the block: all benchmark
+    clients share one address (and one user), whose bucket would otherwise
+    run dry after a few requests.
+    """
+    limiters = (rate_limit.USER_LIMITER, rate_limit.GUEST_LIMITER)
+    saved = [limiter.capacity for limiter in limiters]
+    for limiter in limiters:
+        limiter.capacity = 0  # disabled, see TokenBucketLimiter.enabled
+    try:
+        yield
+    finally:
+        for limiter, capacity in zip(limiters, saved):
+            limiter.capacity = capacity
+
+
+def _speculation_counts(models) -> dict:
+    stats = SCHEDULER.stats()
+    return {model_type: dict(stats[model_type]["speculative"]) for model_type in models}
+
+
+def _speculation_report(before: dict, after: dict) -> dict:
+    """Draft acceptance between two _speculation_counts() snapshots."""
+    report = {}
+    for model_type, end in after.items():
+        start = before[model_type]
+        steps = end["steps"] - start["steps"]
+        proposed = end["proposed"] - start["proposed"]
+        accepted = end["accepted"] - start["accepted"]
+        report[model_type] = {
+            "draft_model": end["draft_model"],
+            "steps": steps,
+            "proposed": proposed,
+            "accepted": accepted,
+            "acceptance_rate": round(accepted / proposed, 3) if proposed else None,
+            "tokens_per_step": round((accepted + steps) / steps, 2) if steps else None,
+        }
+    return report
+
+
+# ======================================================
+# STATISTICS
+# ======================================================
+def percentile(values, q: float):
+    """Linear-interpolated percentile (q in 0..100) of a list, or None."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "mean": round(sum(values) / len(values), 4),
+    }
+
+
+# ======================================================
+# REQUEST DRIVERS
+# ======================================================
+class _Sample:
+    def __init__(self):
+        self.status = "ok"         # ok | rejected | error
+        self.model = None
+        self.ttft = None
+        self.latency = None
+        self.text = ""
+        self.tokens = 0            # generated_tokens from the inference stats
+
+
+def _drive_generate(model_type, message, max_tokens, token):
+    sample = _Sample()
+    started = time.perf_counter()
+    response = generate_ai_response(message, max_tokens=max_tokens, model_type=model_type)
+    sample.latency = time.perf_counter() - started
+    sample.text = str(response)
+    sample.tokens = response.stats.get("generated_tokens", 0)
+    sample.model = model_type
+    if sample.text == ai_model.FALLBACK_RESPONSE:
+        sample.status = "error"
+    return sample
+
+
+def _drive_stream(model_type, message, max_tokens, token):
+    sample = _Sample()
+    started = time.perf_counter()
+    parts = []
+    stream = stream_ai_response(message, max_tokens=max_tokens, model_type=model_type)
+    for chunk in stream:
+        if not parts:
+            sample.ttft = time.perf_counter() - started
+        parts.append(chunk)
+    sample.latency = time.perf_counter() - started
+    sample.text = "".join(parts)
+    sample.tokens = stream.stats.get("generated_tokens", 0)
+    sample.model = model_type
+    if sample.text == ai_model.FALLBACK_RESPONSE:
+        sample.status = "error"
+    return sample
+
+
+def _view_request(path, model_type, message, token):
+    from django.test import RequestFactory
+    from django.urls import resolve
+
+    headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+    request = RequestFactory().post(
+        path,
+        data=json.dumps({"message": message, "model_type": model_type}),
+        content_type="application/json",
+        **headers,
+    )
+    return resolve(path).func(request)
+
+
+def _drive_view(model_type, message, max_tokens, token):
+    sample = _Sample()
+    started = time.perf_counter()
+    response = _view_request("/aibot/chat/", model_type, message, token)
+    response.render()
+    sample.latency = time.perf_counter() - started
+
+    if response.status_code in REJECTED_STATUSES:
+        sample.status = "rejected"
+        return sample
+    payload = json.loads(response.content)
+    sample.model = payload.get("model_type")
+    sample.text = payload.get("ai_response", "")
+    sample.tokens = (payload.get("inference") or {}).get("generated_tokens", 0)
+    if response.status_code != 200 or sample.text == ai_model.FALLBACK_RESPONSE:
+        sample.status = "error"
+    return sample
+
+
+def _drive_view_stream(model_type, message, max_tokens, token):
+    sample = _Sample()
+    started = time.perf_counter()
+    response = _view_request("/aibot/chat-stream/", model_type, message, token)
+
+    if not getattr(response, "streaming", False):
+        # Answered before any stream was opened (shed, rate limited, bad request)
+        sample.status = "rejected" if response.status_code in REJECTED_STATUSES else "error"
+        sample.latency = time.perf_counter() - started
+        return sample
+
+    for frame in b"".join(_iter_stream(response, sample, started)).decode("utf-8").split("\n\n"):
+        if frame.startswith("event: done"):
+            payload = json.loads(frame.split("data: ", 1)[1])
+            sample.model = payload.get("model_type")
+            sample.text = payload.get("ai_response", "")
+            sample.tokens = (payload.get("inference") or {}).get("generated_tokens", 0)
+    sample.latency = time.perf_counter() - started
+    if sample.text == ai_model.FALLBACK_RESPONSE:
+        sample.status = "error"
+    return sample
+
+
+def _iter_stream(response, sample, started):
+    for part in response.streaming_content:
+        if sample.ttft is None and b"event: token" in part:
+            sample.ttft = time.perf_counter() - started
+        yield part
+
+
+DRIVERS = {
+    "generate": _drive_generate,
+    "stream": _drive_stream,
+    "view": _drive_view,
+    "view-stream": _drive_view_stream,
+}
+
+
+# ======================================================
+# RUNNER
+# ======================================================
+def _message(index: int) -> str:
+    question = BENCHMARK_QUESTIONS[index % len(BENCHMARK_QUESTIONS)]
+    # Unique text per request so the response cache never answers
+    return f"{question} (benchmark request {index})"
+
+
+def _run_one(driver, model_type, index, max_tokens, token):
+    try:
+        return driver(model_type, _message(index), max_tokens, token)
+    except InferenceOverloaded:
+        sample = _Sample()
+        sample.status = "rejected"
+        return sample
+    except Exception:
+        logger.exception("Benchmark request failed")
+        sample = _Sample()
+        sample.status = "error"
+        return sample
+
+
+def run_level(target: str, model_type: str, concurrency: int, requests: int,
+              max_tokens: int = 256, token=None, offset: int = 0) -> dict:
+    """Sends `requests` requests through `target`, `concurrency` at a time."""
+    driver = DRIVERS[target]
+    started = time.perf_counter()
+    with rate_limits_lifted(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(
+            lambda i: _run_one(driver, model_type, offset + i, max_tokens, token),
+            range(requests),
+        ))
+    wall = time.perf_counter() - started
+
+    ok = [s for s in samples if s.status == "ok"]
+    served = {s.model for s in ok if s.model}
+    # From the inference stats, so no model is loaded here (with
+    # AIBOT_INFERENCE_SOCKET the models live in the worker)
+    tokens = [s.tokens for s in ok]
+
+    per_request_tps = [
+        n / (s.latency - (s.ttft or 0))
+        for s, n in zip(ok, tokens)
+        if n and s.latency > (s.ttft or 0)
+    ]
+
+    return {
+        "target": target,
+        "model": model_type,
+        "served_by": sorted(served),
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(ok),
+        "rejected": sum(1 for s in samples if s.status == "rejected"),
+        "errors": sum(1 for s in samples if s.status == "error"),
+        "wall_seconds": round(wall, 3),
+        "throughput_tokens_per_sec": round(sum(tokens) / wall, 2) if wall else 0.0,
+        "ttft_seconds": summarize([s.ttft for s in ok if s.ttft is not None]),
+        "latency_seconds": summarize([s.latency for s in ok]),
+        "tokens_per_sec": summarize(per_request_tps),
+        "generated_tokens": summarize(tokens),
+    }
+
+
+def run_benchmark(models, targets=DEFAULT_TARGETS, concurrency_levels=(1, 2, 4, 8),
+                  requests_per_level: int = 16, max_tokens: int = 256, token=None,
+                  backend: str = "gguf", report=None, decoding=("configured",),
+                  draft_model=None) -> dict:
+    """
+    Runs every (decoding mode, target, model, concurrency) combination.
+
+    Args:
+        models (list): Model keys to benchmark.
+        targets (list): Entries of TARGETS.
+        concurrency_levels (list): Concurrent clients per level.
+        requests_per_level (int): Requests sent at each level.
+        max_tokens (int): Answer length limit.
+        token (str): Bearer token for the view targets; without it the views
+            serve guests, who always get TinyLlama.
+        backend (str): Recorded in the report ("gguf" or "fake"); the engine
+            of each model is recorded in its config.
+        report (callable): Called with each level's result as it completes.
+        decoding (list): Entries of DECODING_MODES, each run in turn.
+        draft_model (str): Draft model for the "speculative" mode where a
+            model has none configured.
+
+    Returns:
+        dict: {"meta": {...}, "results": [...]}, JSON-serializable.
+    """
+    result = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": socket.gethostname(),
+            "backend": backend,
+            "targets": list(targets),
+            "concurrency_levels": list(concurrency_levels),
+            "requests_per_level": requests_per_level,
+            "max_tokens": max_tokens,
+            "authenticated": bool(token),
+            "decoding": list(decoding),
+            "config": {
+                model_type: {"backend": model_backend(model_type).name, **model_config(model_type)}
+                for model_type in models
+            },
+            "speculative": {},
+        },
+        "results": [],
+    }
+
+    offset = 0
+    for mode in decoding:
+        with decoding_mode(mode, models, draft_model):
+            before = _speculation_counts(models)
+            for model_type in models:
+                # Load and warm the model so the first level does not pay for it
+                generate_ai_response("Hello", max_tokens=1, model_type=model_type)
+
+                for target in targets:
+                    for concurrency in concurrency_levels:
+                        level = run_level(target, model_type, concurrency, requests_per_level,
+                                          max_tokens=max_tokens, token=token, offset=offset)
+                        level["decoding"] = mode
+                        offset += requests_per_level
+                        result["results"].append(level)
+                        if report is not None:
+                            report(level)
+            result["meta"]["speculative"][mode] = _speculation_report(before, _speculation_counts(models))
+
+    result["meta"]["response_cache"] = RESPONSE_CACHE.stats()
+    result["meta"]["near_duplicate_cache"] = NEAR_DUPLICATE_CACHE.stats()
+    return result
+
+
+def _level_key(level):
+    return level["target"], level["model"], level["concurrency"]
+
+
+def compare(previous: dict, current: dict):
+    """
+    Lines describing how p50/p95 latency, p50 time to first token and
+    throughput changed between two reports (matched on decoding mode,
+    target, model and concurrency).
+    """
+    def key(level):
+        return (level.get("decoding", "configured"),) + _level_key(level)
+
+    before = {key(level): level for level in previous.get("results", [])}
+    pairs = [(before.get(key(level)), level) for level in current.get("results", [])]
+    return _change_lines(pairs)
+
+
+def compare_decoding(result: dict, baseline: str = "plain"):
+    """
+    Lines comparing each decoding mode of one report against `baseline`
+    (e.g. speculative vs plain decoding).
+    """
+    before = {
+        _level_key(level): level
+        for level in result.get("results", [])
+        if level.get("decoding") == baseline
+    }
+    pairs = [
+        (before.get(_level_key(level)), level)
+        for level in result.get("results", [])
+        if level.get("decoding", baseline) != baseline
+    ]
+    return _change_lines(pairs)
+
+
+def _change_lines(pairs):
+    lines = []
+    for old, level in pairs:
+        if old is None:
+            continue
+        changes = []
+        for label, new_value, old_value in (
+            ("p50", level["latency_seconds"]["p50"], old["latency_seconds"]["p50"]),
+            ("p95", level["latency_seconds"]["p95"], old["latency_seconds"]["p95"]),
+            ("ttft p50", level["ttft_seconds"]["p50"], old["ttft_seconds"]["p50"]),
+            ("tok/s", level["throughput_tokens_per_sec"], old["throughput_tokens_per_sec"]),
+        ):
+            if new_value is None or not old_value:
+                continue
+            changes.append(f"{label} {old_value} -> {new_value} ({(new_value - old_value) / old_value:+.0%})")
+        if changes:
+            target, model, concurrency = _level_key(level)
+            decoding = level.get("decoding", "configured")
+            lines.append(f"{decoding}/{target}/{model}/c={concurrency}: " + ", ".join(changes))
+    return lines
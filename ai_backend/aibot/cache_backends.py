@@ -0,0 +1,177 @@
+# ======================================================
+# aibot/cache_backends.py
+# Pluggable key/value stores shared by the aibot caches
+# ======================================================
+#
+# "local"  -> LocalCacheBackend: in-process LRU with per-entry TTL.
+#             Fast, but every web process keeps its own copy.
+# "django" -> DjangoCacheBackend: whatever cache Django's CACHES setting
+#             points at (memcached, redis, ...), shared between processes.
+#             Eviction is left to the cache server.
+#
+# Both offer get / set / delete only. There is no wholesale clear: the
+# Django cache may be shared with other apps, so entries simply expire.
+#
+# CountingCache is the base of the caches kept in a backend: it adds the
+# hit / miss / store counters they all report.
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("aibot.cache_backends")
+
+
+class LocalCacheBackend:
+    """Thread-safe in-process LRU cache with a TTL on every entry."""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 300):
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self.evictions = 0
+
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """Adapter over a Django cache alias, so entries are shared between workers."""
+
+    def __init__(self, alias: str = "default", prefix: str = "aibot", default_ttl: float = 300):
+        self.alias = alias
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.evictions = 0  # not observable; the cache server evicts on its own
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        return self._cache.get(self._key(key))
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._cache.set(self._key(key), value, timeout=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._cache.delete(self._key(key))
+
+    def __len__(self):
+        raise TypeError("DjangoCacheBackend does not report its size")
+
+
+class CountingCache:
+    """
+    Base of the caches built on a backend (response_cache.py,
+    token_cache.py): counts hits, misses and stores, and treats a failing
+    backend as a miss. Subclasses map their arguments to a key.
+    """
+
+    label = "Cache"  # used in log messages
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """Returns the cached value, or None on a miss."""
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            logger.warning(f"{self.label} lookup failed", exc_info=True)
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _store(self, key, value, ttl: float = None):
+        try:
+            self.backend.set(key, value, ttl=ttl)
+        except Exception:
+            logger.warning(f"{self.label} store failed", exc_info=True)
+            return
+
+        with self._lock:
+            self.stores += 1
+
+    def _discard(self, key):
+        try:
+            self.backend.delete(key)
+        except Exception:
+            logger.warning(f"{self.label} delete failed", exc_info=True)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.backend.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def get_cache_backend(name: str, *, max_entries: int = 1024, default_ttl: float = 300,
+                      prefix: str = "aibot", alias: str = "default"):
+    """
+    Builds a cache backend by name ('local' or 'django').
+
+    Raises:
+        ValueError: If the backend name is unknown.
+    """
+    if name == "local":
+        return LocalCacheBackend(max_entries=max_entries, default_ttl=default_ttl)
+    if name == "django":
+        return DjangoCacheBackend(alias=alias, prefix=prefix, default_ttl=default_ttl)
+    raise ValueError(f"Unsupported cache backend: {name}")
@@ -0,0 +1,227 @@
+# ======================================================
+# aibot/chat_jobs.py
+# Asynchronous chat jobs (POST /aibot/chat/ with "async": true)
+# ======================================================
+#
+# The chat view queues the generation, records a job and answers 202 with
+# its id straight away. A small pool of runner threads (outside the WSGI
+# worker pool) consumes the generated chunks, keeps the job's progress up
+# to date, stores the finished interaction and puts the final payload on
+# the job, where /aibot/chat-job-status/ and /aibot/chat-job-result/ find it.
+#
+# Job records live in a cache backend. With several web processes it must
+# be shared (AIBOT_CHAT_JOB_BACKEND=django with a shared CACHES entry such
+# as Redis or Memcached); the runner thread lives in the process that
+# accepted the job either way.
+#
+# POST /aibot/chat-cancel/ stops a job. In the process running it the
+# generation is cancelled at once; elsewhere a cancel flag is left next to
+# the record, which the runner checks on every chunk the model produces
+# (so the generation stops after at most one more token). A job whose
+# client stopped polling for ABANDON_SECONDS is cancelled the same way. The
+# answer generated so far is stored as a truncated interaction.
+#
+# Jobs belong to the user who started them; guest jobs to the client
+# address (rate_limit.client_ip) they were started from.
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache_backends import get_cache_backend
+
+logger = logging.getLogger("aibot.chat_jobs")
+
+CHAT_JOB_BACKEND = os.getenv("AIBOT_CHAT_JOB_BACKEND", "local")
+CHAT_JOB_TTL = int(os.getenv("AIBOT_CHAT_JOB_TTL", "900"))  # seconds a job can be polled
+CHAT_JOB_THREADS = int(os.getenv("AIBOT_CHAT_JOB_THREADS", "8"))
+CHAT_JOB_ABANDON_SECONDS = float(os.getenv("AIBOT_CHAT_JOB_ABANDON_SECONDS", "60"))  # 0 = never
+PROGRESS_INTERVAL_SECONDS = 0.5  # how often partial text is written back
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ChatJobStore:
+    """Job records keyed by job id."""
+
+    def __init__(self, backend, ttl: int = CHAT_JOB_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(job_id: str, part: str = "") -> str:
+        return f"chatjob:{job_id}{part}"
+
+    def create(self, owner_id, model_type: str, owner_ip: str = None) -> dict:
+        """New job of a user (owner_id), or of a guest at owner_ip."""
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "owner_id": owner_id,
+            "owner_ip": owner_ip if owner_id is None else None,
+            "model_type": model_type,
+            "partial_response": "",
+            "result": None,
+            "error": None,
+            "stop_reason": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.save(job)
+        return job
+
+    def get(self, job_id: str):
+        if not job_id:
+            return None
+        return self.backend.get(self._key(job_id))
+
+    def save(self, job: dict):
+        job["updated_at"] = time.time()
+        self.backend.set(self._key(job["job_id"]), dict(job), ttl=self.ttl)
+
+    # Kept apart from the record, which only the runner writes
+    def request_cancel(self, job_id: str, reason: str):
+        self.backend.set(self._key(job_id, ":cancel"), reason, ttl=self.ttl)
+
+    def cancel_requested(self, job_id: str):
+        return self.backend.get(self._key(job_id, ":cancel"))
+
+    def touch(self, job_id: str):
+        self.backend.set(self._key(job_id, ":seen"), time.time(), ttl=self.ttl)
+
+    def last_seen(self, job_id: str):
+        return self.backend.get(self._key(job_id, ":seen"))
+
+
+CHAT_JOBS = ChatJobStore(
+    get_cache_backend(
+        CHAT_JOB_BACKEND,
+        max_entries=4096,
+        default_ttl=CHAT_JOB_TTL,
+        prefix="aibot",
+    )
+)
+
+_runner = None
+_runner_lock = threading.Lock()
+
+# Chunk streams of the jobs running in this process, by job id
+_running = {}
+_running_lock = threading.Lock()
+
+
+def _get_runner() -> ThreadPoolExecutor:
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = ThreadPoolExecutor(
+                max_workers=max(1, CHAT_JOB_THREADS),
+                thread_name_prefix="aibot-chat-job",
+            )
+        return _runner
+
+
+def start_chat_job(job: dict, chunks, finish):
+    """
+    Runs a queued generation to completion in the background.
+
+    Args:
+        job (dict): Record from CHAT_JOBS.create().
+        chunks (iterator): Text chunks of the answer (see stream_ai_response);
+            cancelled through its `cancel(reason)` if it has one.
+        finish (callable): (ai_response, stop_reason, inference_stats) -> final
+            payload; stores the interaction.
+    """
+    with _running_lock:
+        _running[job["job_id"]] = chunks
+    _get_runner().submit(_run_chat_job, job, chunks, finish)
+
+
+def cancel_chat_job(job: dict, reason: str):
+    """Stops a queued or running job; finished jobs are left alone."""
+    if job["status"] in (DONE, FAILED):
+        return
+    CHAT_JOBS.request_cancel(job["job_id"], reason)
+    with _running_lock:
+        chunks = _running.get(job["job_id"])
+    if chunks is not None and hasattr(chunks, "cancel"):
+        chunks.cancel(reason)
+
+
+def touch_chat_job(job: dict):
+    """Records that the client is still polling the job."""
+    CHAT_JOBS.touch(job["job_id"])
+
+
+def _stop_reason(job: dict):
+    """Why a running job should be cancelled (asked to / abandoned), or None."""
+    reason = CHAT_JOBS.cancel_requested(job["job_id"])
+    if reason:
+        return reason
+    if CHAT_JOB_ABANDON_SECONDS:
+        seen = CHAT_JOBS.last_seen(job["job_id"]) or job["created_at"]
+        if time.time() - seen > CHAT_JOB_ABANDON_SECONDS:
+            from .ai_model import STOP_DISCONNECT
+            return STOP_DISCONNECT
+    return None
+
+
+def _run_chat_job(job: dict, chunks, finish):
+    from django.db import close_old_connections
+
+    parts = []
+    last_saved = 0.0
+    cancelled = not hasattr(chunks, "cancel")  # nothing to stop
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+
+            # Checked per chunk, not per save, so a cancel lands within a token
+            reason = None if cancelled else _stop_reason(job)
+            if reason:
+                logger.info(f"Cancelling chat job {job['job_id']}: {reason}")
+                chunks.cancel(reason)
+                cancelled = True
+
+            now = time.monotonic()
+            if job["status"] == QUEUED or now - last_saved >= PROGRESS_INTERVAL_SECONDS:
+                job.update(status=RUNNING, partial_response="".join(parts))
+                CHAT_JOBS.save(job)
+                last_saved = now
+
+        stop_reason = getattr(chunks, "stop_reason", None)
+        job.update(
+            status=DONE,
+            partial_response="".join(parts),
+            stop_reason=stop_reason,
+            result=finish("".join(parts).strip(), stop_reason, getattr(chunks, "stats", None)),
+        )
+    except Exception as e:
+        logger.exception(f"Chat job {job['job_id']} failed")
+        job.update(status=FAILED, error=str(e))
+    finally:
+        with _running_lock:
+            _running.pop(job["job_id"], None)
+        CHAT_JOBS.save(job)
+        # This thread is not a request thread, so Django will not do it
+        close_old_connections()
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job's progress (without the final payload)."""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "model_type": job["model_type"],
+        "partial_response": job["partial_response"],
+        "error": job["error"],
+        "stop_reason": job.get("stop_reason"),
+        "elapsed_ms": round((job["updated_at"] - job["created_at"]) * 1000),
+    }
@@ -0,0 +1,159 @@
+# ======================================================
+# aibot/context_builder.py
+# Token-budgeted prompt assembly for multi-turn chats
+# ======================================================
+#
+# The prompt for a chat turn is:
+#
+#   <system preamble>
+#   [Summary of the earlier conversation: ...]
+#   User: <turn 1>\nAssistant: <answer 1>\n
+#   ...
+#   User: <message>\nAssistant:
+#
+# Tokens are counted with the model's own tokenizer. The newest turns that
+# fit in context_length - max_new_tokens are sent verbatim; older turns are
+# folded into a short extractive summary. The fold point is remembered per
+# chat session and only moves forward in large steps, so the start of the
+# prompt stays identical for several turns and the prefix cache can keep
+# reusing it.
+
+import hashlib
+import logging
+import threading
+
+from .cache_backends import LocalCacheBackend
+
+logger = logging.getLogger("aibot.context_builder")
+
+SYSTEM_PROMPT = "You are a helpful, accurate, and concise AI assistant.\n\n"
+
+SAFETY_TOKENS = 8           # slack for tokenizer differences at the seams
+SUMMARY_SHARE = 0.25        # at most this share of the budget goes to the summary
+REFOLD_TARGET_SHARE = 0.5   # after folding, verbatim turns use at most this share
+
+SUMMARY_QUESTION_CHARS = 120
+SUMMARY_ANSWER_CHARS = 160
+
+# session_key -> number of turns folded into the summary
+_FOLD_POINTS = LocalCacheBackend(max_entries=4096, default_ttl=3600)
+# sha256(model_type + text) -> token count
+_TOKEN_COUNTS = LocalCacheBackend(max_entries=16384, default_ttl=3600)
+_lock = threading.Lock()
+
+
+def format_turn(user_message: str, ai_response: str) -> str:
+    return f"User: {user_message}\nAssistant: {ai_response.strip()}\n"
+
+
+def format_prompt(message: str, turns=(), summary: str = "") -> str:
+    """Renders the prompt template; with no turns or summary it is the plain single-turn prompt."""
+    parts = [SYSTEM_PROMPT]
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}\n\n")
+    parts.extend(format_turn(user, answer) for user, answer in turns)
+    parts.append(f"User: {message}\nAssistant:")
+    return "".join(parts)
+
+
+def count_tokens(model, model_type: str, text: str) -> int:
+    """Counts tokens with the model's tokenizer, memoised per text."""
+    key = hashlib.sha256(f"{model_type}\0{text}".encode("utf-8")).hexdigest()
+    cached = _TOKEN_COUNTS.get(key)
+    if cached is not None:
+        return cached
+    count = len(model.tokenize(text))
+    _TOKEN_COUNTS.set(key, count)
+    return count
+
+
+def summarize_turns(turns) -> str:
+    """
+    Folds turns into a compact extractive summary: the start of each
+    question and the first sentence of each answer.
+    """
+    lines = []
+    for user, answer in turns:
+        question = " ".join(user.split())[:SUMMARY_QUESTION_CHARS]
+        answer = " ".join(answer.split())
+        first_sentence = answer.split(". ")[0][:SUMMARY_ANSWER_CHARS]
+        lines.append(f"- The user asked: {question} | You answered: {first_sentence}")
+    return "\n".join(lines)
+
+
+def _fit_summary(model, model_type: str, turns, max_tokens: int) -> str:
+    """Summarizes turns, dropping the oldest lines until the summary fits."""
+    lines = summarize_turns(turns).split("\n") if turns else []
+    while lines:
+        summary = "\n".join(lines)
+        if count_tokens(model, model_type, summary) <= max_tokens:
+            return summary
+        lines = ["- (earlier turns omitted)"] + lines[2:] if len(lines) > 1 else []
+    return ""
+
+
+def _truncate_to_tokens(model, text: str, max_tokens: int) -> str:
+    tokens = model.tokenize(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return model.detokenize(tokens[:max(1, max_tokens)])
+
+
+def build_conversation_prompt(model, model_type: str, message: str, history=None,
+                              context_length: int = 1024, max_new_tokens: int = 256,
+                              session_key=None) -> str:
+    """
+    Builds a prompt with as much chat history as fits the token budget.
+
+    Args:
+        model: Loaded model, used for its tokenizer.
+        model_type (str): Model key (token counts are memoised per model).
+        message (str): The new user message.
+        history (list): Earlier (user_message, ai_response) pairs, oldest first.
+        context_length (int): The model's context window.
+        max_new_tokens (int): Tokens reserved for the answer.
+        session_key: Chat session, used to keep the fold point stable.
+
+    Returns:
+        str: The prompt text.
+    """
+    history = list(history or [])
+    budget = context_length - max_new_tokens - SAFETY_TOKENS
+
+    fixed = count_tokens(model, model_type, format_prompt(message))
+    if fixed > budget:
+        # The message alone does not fit: keep its beginning, drop the history
+        overflow = fixed - budget
+        message_tokens = count_tokens(model, model_type, message)
+        message = _truncate_to_tokens(model, message, message_tokens - overflow)
+        return format_prompt(message)
+
+    if not history:
+        return format_prompt(message)
+
+    costs = [count_tokens(model, model_type, format_turn(u, a)) for u, a in history]
+    available = budget - fixed
+
+    # Everything fits: no summary needed
+    if sum(costs) <= available:
+        return format_prompt(message, history)
+
+    summary_budget = int(available * SUMMARY_SHARE)
+    turn_budget = available - summary_budget
+
+    with _lock:
+        folded = _FOLD_POINTS.get(session_key) if session_key else None
+        folded = min(folded or 0, len(history))
+
+        if sum(costs[folded:]) > turn_budget:
+            # Move the fold point forward until the verbatim turns use at most
+            # REFOLD_TARGET_SHARE of the budget, so it stays put for a while.
+            target = int(turn_budget * REFOLD_TARGET_SHARE)
+            while folded < len(history) and sum(costs[folded:]) > target:
+                folded += 1
+
+        if session_key:
+            _FOLD_POINTS.set(session_key, folded)
+
+    summary = _fit_summary(model, model_type, history[:folded], summary_budget)
+    return format_prompt(message, history[folded:], summary)
@@ -0,0 +1,319 @@
+# ======================================================
+# aibot/downloads.py
+# Resumable, parallel, checksum-verified model downloads
+# ======================================================
+#
+# A download writes into "<file>.part" next to the destination and keeps
+# its progress in "<file>.part.json". If the process dies or a segment
+# fails, the next call resumes every segment from where it stopped using
+# HTTP Range requests. Once all bytes are present the file is verified
+# against the expected SHA-256 and renamed into place atomically, so a
+# half-written GGUF never appears under its real name.
+#
+# Without a configured SHA-256 the one the host publishes is used: Hugging
+# Face answers for LFS files with X-Linked-Etag, the object's SHA-256.
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger("aibot.downloads")
+
+DOWNLOAD_SEGMENTS = int(os.getenv("AIBOT_DOWNLOAD_SEGMENTS", "4"))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+DOWNLOAD_MAX_RETRIES = int(os.getenv("AIBOT_DOWNLOAD_MAX_RETRIES", "3"))
+PROGRESS_INTERVAL_SECONDS = 5.0
+STATE_SAVE_INTERVAL_SECONDS = 2.0
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ChecksumMismatch(DownloadError):
+    pass
+
+
+class RangeNotSupported(DownloadError):
+    """The server answered a Range request with the whole file."""
+
+
+class _Progress:
+    """Thread-safe byte counter that logs at most every `interval` seconds."""
+
+    def __init__(self, label: str, total: int, already: int, interval: float):
+        self.label = label
+        self.total = total
+        self.done = already
+        self.interval = interval
+        self._started_at = time.monotonic()
+        self._started_bytes = already
+        self._last_log = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, n: int):
+        with self._lock:
+            self.done += n
+            now = time.monotonic()
+            if now - self._last_log < self.interval:
+                return
+            self._last_log = now
+            self._log(now)
+
+    def _log(self, now: float):
+        elapsed = max(now - self._started_at, 1e-6)
+        rate = (self.done - self._started_bytes) / elapsed / (1024 * 1024)
+        percent = (self.done / self.total * 100) if self.total else 0.0
+        logger.info(
+            f"   {self.label}: {percent:.1f}% "
+            f"({self.done / (1024 * 1024):.1f} / {self.total / (1024 * 1024):.1f} MB, {rate:.1f} MB/s)"
+        )
+
+
+class DownloadManager:
+    """
+    Downloads large files with resume, parallel segments and verification.
+
+    Args:
+        session: requests-compatible session (injectable for tests).
+        segments (int): Parallel Range requests per file.
+        chunk_size (int): Bytes read per iteration.
+        max_retries (int): Attempts per segment before giving up.
+        timeout: requests timeout (connect, read).
+        progress_interval (float): Seconds between progress log lines.
+    """
+
+    def __init__(self, session=None, segments: int = DOWNLOAD_SEGMENTS,
+                 chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                 max_retries: int = DOWNLOAD_MAX_RETRIES,
+                 timeout=(10, 60),
+                 progress_interval: float = PROGRESS_INTERVAL_SECONDS):
+        self.session = session or requests.Session()
+        self.segments = max(1, segments)
+        self.chunk_size = chunk_size
+        self.max_retries = max(1, max_retries)
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+
+    # --------------------------------------------------
+    # PUBLIC API
+    # --------------------------------------------------
+    def download(self, url: str, dest, sha256: str = None, label: str = None) -> Path:
+        """
+        Downloads `url` to `dest`, resuming a previous partial download.
+
+        Args:
+            sha256 (str): Expected SHA-256; defaults to the one the server
+                publishes (X-Linked-Etag), if any.
+
+        Raises:
+            DownloadError: If the download cannot be completed.
+            ChecksumMismatch: If the finished file does not match `sha256`.
+        """
+        dest = Path(dest)
+        label = label or dest.name
+        part = dest.with_name(dest.name + ".part")
+        state_path = dest.with_name(dest.name + ".part.json")
+
+        size, accepts_ranges, published_sha256 = self._probe(url)
+        if not sha256 and published_sha256:
+            logger.info(f"Using the SHA-256 published for {label}: {published_sha256}")
+            sha256 = published_sha256
+
+        state = self._load_state(state_path, url, size)
+        if state is None or not part.exists():
+            state = self._new_state(url, size, accepts_ranges)
+            with open(part, "wb") as f:
+                if size:
+                    f.truncate(size)
+        else:
+            logger.info(f"⏯ Resuming download of {label}")
+
+        self._save_state(state_path, state)
+
+        try:
+            self._fetch_segments(url, part, state, state_path, label)
+        except RangeNotSupported:
+            # HEAD promised ranges but GET ignores them: one stream from byte 0
+            logger.warning(f"Server ignored Range requests for {label}; downloading it in one stream")
+            state = self._new_state(url, size, accepts_ranges=False)
+            self._save_state(state_path, state)
+            self._fetch_segments(url, part, state, state_path, label)
+
+        actual_size = part.stat().st_size
+        if size and actual_size != size:
+            raise DownloadError(f"Downloaded {actual_size} bytes of {label}, expected {size}")
+
+        if sha256:
+            digest = self.file_sha256(part)
+            if digest.lower() != sha256.lower():
+                part.unlink()
+                state_path.unlink(missing_ok=True)
+                raise ChecksumMismatch(f"SHA-256 of {label} is {digest}, expected {sha256}")
+            logger.info(f"🔒 Verified SHA-256 of {label}")
+        else:
+            logger.warning(f"No SHA-256 configured for {label}; skipping verification")
+
+        os.replace(part, dest)
+        state_path.unlink(missing_ok=True)
+        return dest
+
+    @staticmethod
+    def file_sha256(path, block_size: int = 8 * 1024 * 1024) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # --------------------------------------------------
+    # INTERNALS
+    # --------------------------------------------------
+    def _fetch_segments(self, url: str, part: Path, state: dict, state_path: Path, label: str):
+        """Fetches the unfinished segments of `state` in parallel, saving progress as it goes."""
+        already = sum(seg["done"] for seg in state["segments"])
+        progress = _Progress(label, state["size"] or 0, already, self.progress_interval)
+        state_lock = threading.Lock()
+        last_save = [time.monotonic()]
+
+        def checkpoint(force=False):
+            with state_lock:
+                now = time.monotonic()
+                if force or now - last_save[0] >= STATE_SAVE_INTERVAL_SECONDS:
+                    self._save_state(state_path, state)
+                    last_save[0] = now
+
+        pending = [seg for seg in state["segments"] if not self._segment_complete(seg)]
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="aibot-download") as pool:
+            futures = [
+                pool.submit(self._fetch_segment, url, part, seg, progress, checkpoint)
+                for seg in pending
+            ]
+            errors = [f.exception() for f in futures if f.exception() is not None]
+        checkpoint(force=True)
+        for error in errors:
+            if isinstance(error, RangeNotSupported):
+                raise error
+        if errors:
+            raise DownloadError(f"Download of {label} failed: {errors[0]}") from errors[0]
+
+    def _probe(self, url: str):
+        """
+        Returns (size or None, whether the server honours Range requests,
+        the file's published SHA-256 or None).
+        """
+        response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        response.raise_for_status()
+        size = int(response.headers.get("content-length") or 0) or None
+        accepts_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+        return size, accepts_ranges, self._published_sha256(response)
+
+    @staticmethod
+    def _published_sha256(response):
+        """The X-Linked-Etag of the response or a redirect before it, if it is a SHA-256."""
+        for hop in [*getattr(response, "history", []), response]:
+            etag = hop.headers.get("x-linked-etag", "")
+            etag = etag.removeprefix("W/").strip('"').lower()
+            if _SHA256_HEX.fullmatch(etag):
+                return etag
+        return None
+
+    def _new_state(self, url: str, size, accepts_ranges: bool) -> dict:
+        if not size or not accepts_ranges:
+            # One sequential stream; resumable only if ranges are supported
+            segments = [{"start": 0, "end": (size - 1) if size else None, "done": 0}]
+        else:
+            count = min(self.segments, max(1, size // self.chunk_size))
+            step = size // count
+            segments = []
+            for i in range(count):
+                start = i * step
+                end = size - 1 if i == count - 1 else start + step - 1
+                segments.append({"start": start, "end": end, "done": 0})
+        return {"url": url, "size": size, "ranges": accepts_ranges, "segments": segments}
+
+    @staticmethod
+    def _load_state(state_path: Path, url: str, size):
+        try:
+            state = json.loads(state_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != size or not state.get("ranges"):
+            return None
+        return state
+
+    @staticmethod
+    def _save_state(state_path: Path, state: dict):
+        tmp = state_path.with_name(state_path.name + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, state_path)
+
+    @staticmethod
+    def _segment_complete(seg: dict) -> bool:
+        return seg["end"] is not None and seg["start"] + seg["done"] > seg["end"]
+
+    def _fetch_segment(self, url: str, part: Path, seg: dict, progress: _Progress, checkpoint):
+        last_error = None
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._stream_segment(url, part, seg, progress, checkpoint)
+                return
+            except RangeNotSupported:
+                raise  # every retry would get the whole file again
+            except (requests.RequestException, OSError, DownloadError) as e:
+                last_error = e
+                logger.warning(
+                    f"Segment {seg['start']}-{seg['end']} failed "
+                    f"(attempt {attempt}/{self.max_retries}): {e}"
+                )
+                if attempt < self.max_retries:
+                    time.sleep(min(2 ** attempt, 10))
+        raise last_error
+
+    def _stream_segment(self, url: str, part: Path, seg: dict, progress: _Progress, checkpoint):
+        offset = seg["start"] + seg["done"]
+        headers = {}
+        if seg["end"] is not None:
+            headers["Range"] = f"bytes={offset}-{seg['end']}"
+        elif offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if headers and response.status_code != 206 and offset:
+                if seg["start"] != 0:
+                    raise RangeNotSupported("Server ignored the Range request")
+                # The body starts at byte 0, which is where this segment starts
+                progress.add(-seg["done"])
+                seg["done"] = 0
+                offset = 0
+            # Otherwise the whole body for a segment starting at 0 is fine
+
+            # Unbuffered, so bytes counted in the saved state are really in the file
+            with open(part, "r+b", buffering=0) as f:
+                f.seek(offset)
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if not chunk:
+                        continue
+                    if seg["end"] is not None:
+                        chunk = chunk[:seg["end"] - (seg["start"] + seg["done"]) + 1]
+                    f.write(chunk)
+                    seg["done"] += len(chunk)
+                    progress.add(len(chunk))
+                    checkpoint()
+                    if self._segment_complete(seg):
+                        break
+
+        if seg["end"] is not None and not self._segment_complete(seg):
+            raise DownloadError("Connection closed before the segment was complete")
@@ -0,0 +1,147 @@
+# ======================================================
+# aibot/fair_queue.py
+# Weighted fair queuing between priority classes
+# ======================================================
+#
+# Requests belong to a priority class (signed-in users, subscribers,
+# guests). Each class keeps a virtual time: the service it has received
+# divided by its weight. The next request is always taken from the waiting
+# class with the smallest virtual time, so over any busy period a class of
+# weight 4 gets four times the service of a class of weight 1 - but a class
+# of weight 1 still gets its share and never waits forever.
+#
+# A class that was idle rejoins at the virtual time of the classes already
+# waiting, so it cannot save up credit while nobody from it was asking.
+#
+# Two places in the scheduler use this (see ai_model.py):
+#   * each ModelQueue orders its own waiting jobs, charging every job the
+#     tokens it may generate when it is taken;
+#   * the SlotArbiter hands out the inference slots all models share,
+#     charging each class the seconds it actually held a slot.
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Weight per class, highest priority first. Nothing assigns "subscriber"
+# yet; it is reserved for a paid tier.
+PRIORITY_WEIGHTS = {"subscriber": 8.0, "authenticated": 4.0, "guest": 1.0}
+for _item in os.getenv("AIBOT_PRIORITY_WEIGHTS", "").split(","):  # e.g. "authenticated=6,guest=1"
+    if "=" in _item:
+        _name, _weight = _item.split("=", 1)
+        PRIORITY_WEIGHTS[_name.strip()] = float(_weight)
+        if not PRIORITY_WEIGHTS[_name.strip()] > 0:  # service is divided by the weight
+            raise ValueError(f"AIBOT_PRIORITY_WEIGHTS: weight of {_name.strip()} must be positive")
+
+PRIORITY_CLASSES = tuple(PRIORITY_WEIGHTS)
+DEFAULT_PRIORITY = "authenticated"
+
+
+def priority_class(name) -> str:
+    """A known priority class; unknown names get DEFAULT_PRIORITY."""
+    return name if name in PRIORITY_WEIGHTS else DEFAULT_PRIORITY
+
+
+class WeightedFairQueue:
+    """
+    FIFO queues per priority class, served by virtual time. Not thread-safe:
+    callers hold their own lock.
+    """
+
+    def __init__(self, weights: dict = None):
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        for name, weight in self.weights.items():
+            if not weight > 0:
+                raise ValueError(f"Priority weight of {name} must be positive, got {weight}")
+        self._queues = {name: deque() for name in self.weights}
+        self._vtime = {name: 0.0 for name in self.weights}
+        self._clock = 0.0  # virtual time of the last class served
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def __bool__(self) -> bool:
+        return any(self._queues.values())
+
+    def push(self, item, klass: str):
+        klass = priority_class(klass)
+        if not self._queues[klass]:
+            # Rejoining: catch up with the classes that kept waiting
+            waiting = [self._vtime[name] for name, q in self._queues.items() if q]
+            self._vtime[klass] = max(self._vtime[klass], min(waiting, default=self._clock))
+        self._queues[klass].append(item)
+
+    def _next_class(self):
+        waiting = [name for name, q in self._queues.items() if q]
+        if not waiting:
+            return None
+        # Ties go to the heavier class
+        return min(waiting, key=lambda name: (self._vtime[name], -self.weights[name]))
+
+    def peek(self):
+        klass = self._next_class()
+        return None if klass is None else self._queues[klass][0]
+
+    def pop(self):
+        """Takes the next item (IndexError if empty); charge() its class for it."""
+        klass = self._next_class()
+        if klass is None:
+            raise IndexError("pop from an empty WeightedFairQueue")
+        self._clock = self._vtime[klass]
+        return self._queues[klass].popleft()
+
+    def remove(self, item, klass: str):
+        """Drops a waiting item, e.g. when its waiter gives up."""
+        self._queues[priority_class(klass)].remove(item)
+
+    def charge(self, klass: str, cost: float):
+        """Records `cost` units of service given to a class."""
+        klass = priority_class(klass)
+        self._vtime[klass] += cost / self.weights[klass]
+
+    def depths(self) -> dict:
+        return {name: len(q) for name, q in self._queues.items()}
+
+
+class SlotArbiter:
+    """
+    Shares a fixed number of inference slots between the model workers.
+    A worker asks for a slot on behalf of the class of the job it is about
+    to run; free slots go to the waiting classes in weighted fair order and
+    every class is charged the seconds its jobs held one.
+    """
+
+    def __init__(self, slots: int, weights: dict = None):
+        self.slots = max(1, slots)
+        self._free = self.slots
+        self._waiting = WeightedFairQueue(weights)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, klass: str):
+        ticket = object()
+        taken = False
+        with self._cond:
+            self._waiting.push(ticket, klass)
+            try:
+                while not (self._free and self._waiting.peek() is ticket):
+                    self._cond.wait()
+                self._waiting.pop()
+                self._free -= 1
+                taken = True
+            finally:
+                if not taken:
+                    # Interrupted: a ticket left at the head would block everyone
+                    self._waiting.remove(ticket, klass)
+                    self._cond.notify_all()
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free += 1
+                self._waiting.charge(klass, time.monotonic() - started)
+                self._cond.notify_all()
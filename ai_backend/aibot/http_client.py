@@ -0,0 +1,267 @@
+# ======================================================
+# aibot/http_client.py
+# Outbound HTTP clients: pooling, retries and a circuit breaker per upstream
+# ======================================================
+#
+# Every upstream service (today only "auth") gets one HttpClient shared by
+# all threads of the process:
+#
+#   * a requests.Session with its own keep-alive connection pool of
+#     `pool_size` connections,
+#   * (connect, read) timeouts unless the caller passes its own,
+#   * up to `retries` retries of idempotent calls after connection errors,
+#     timeouts and 502/503/504 answers, sleeping a random ("full jitter")
+#     share of an exponentially growing backoff in between,
+#   * a circuit breaker: after `failure_threshold` failed calls in a row
+#     (a call and its retries count once) the upstream is considered down
+#     and calls fail at once with CircuitOpenError for `reset_seconds`;
+#     then one trial call decides whether it closes again.
+#
+# Settings come from AIBOT_HTTP_<UPSTREAM>_<SETTING> environment variables,
+# e.g. AIBOT_HTTP_AUTH_POOL_SIZE=20. Per-upstream latency, outcomes,
+# retries and breaker trips are exported through metrics.py.
+#
+# CircuitOpenError is a requests.ConnectionError, so code that already
+# handles requests.RequestException treats an open circuit like an
+# unreachable service. Clients take absolute URLs and hold no other state,
+# so a test can point them at a local stub server.
+
+import os
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import REGISTRY, LATENCY_BUCKETS
+
+logger = logging.getLogger("aibot.http_client")
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+# Defaults for every upstream; override per upstream with AIBOT_HTTP_<NAME>_<KEY>
+DEFAULT_SETTINGS = {
+    "pool_size": 10,            # keep-alive connections kept per upstream
+    "connect_timeout": 1.0,     # seconds
+    "read_timeout": 3.0,        # seconds
+    "retries": 2,               # extra attempts for idempotent calls
+    "backoff": 0.1,             # seconds; doubles per retry (jittered)
+    "max_backoff": 1.0,         # seconds
+    "failure_threshold": 5,     # failed calls in a row that open the circuit
+    "reset_seconds": 30.0,      # how long the circuit stays open
+}
+
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "aibot_upstream_requests_total",
+    "Outbound calls by outcome (2xx, 4xx, 5xx, error, circuit_open).",
+    ("upstream", "outcome"))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "aibot_upstream_request_seconds", "Duration of outbound calls, retries included.",
+    ("upstream", "method"), LATENCY_BUCKETS)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "aibot_upstream_retries_total", "Outbound attempts repeated after a failure.", ("upstream",))
+CIRCUIT_OPENED = REGISTRY.counter(
+    "aibot_upstream_circuit_opened_total", "Times an upstream's circuit breaker opened.", ("upstream",))
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without calling the upstream while its circuit is open."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed -> (failure_threshold failures) -> open -> (reset_seconds) -> half-open -> one trial."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (in half-open state only the trial call)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        """Ends a call that reached no verdict (e.g. interrupted); another may try."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """Counts a failed call. Returns True if this opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+                return opened
+            return False
+
+
+def upstream_settings(name: str) -> dict:
+    """DEFAULT_SETTINGS with the AIBOT_HTTP_<NAME>_* overrides applied."""
+    settings = dict(DEFAULT_SETTINGS)
+    for key, default in DEFAULT_SETTINGS.items():
+        value = os.getenv(f"AIBOT_HTTP_{name.upper()}_{key.upper()}")
+        if value is not None:
+            settings[key] = type(default)(value)
+    return settings
+
+
+class HttpClient:
+    """
+    Thread-safe client for one upstream service.
+
+    Args:
+        name (str): Upstream name, used in metrics and errors.
+        headers (dict): Sent with every request.
+        **settings: Any of DEFAULT_SETTINGS.
+    """
+
+    def __init__(self, name: str, headers: dict = None, **settings):
+        self.name = name
+        self.settings = {**DEFAULT_SETTINGS, **settings}
+        self.breaker = CircuitBreaker(self.settings["failure_threshold"], self.settings["reset_seconds"])
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # Retries are done here, where they can be jittered and counted
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.settings["pool_size"], max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def timeout(self):
+        return (self.settings["connect_timeout"], self.settings["read_timeout"])
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, *, retry: bool = None, **kwargs) -> requests.Response:
+        """
+        Sends a request like requests.Session.request.
+
+        Args:
+            retry (bool): Whether failed attempts may be repeated; defaults
+                to True for idempotent methods.
+
+        Raises:
+            CircuitOpenError: If the upstream is considered down.
+            requests.RequestException: If the last attempt failed.
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.settings["retries"] if retry else 0)
+        kwargs.setdefault("timeout", self.timeout)
+
+        # One breaker verdict per call, retries included
+        if not self.breaker.allow():
+            UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="circuit_open")
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        started = time.monotonic()
+        succeeded = None
+        try:
+            for attempt in range(attempts):
+                last_attempt = attempt == attempts - 1
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.RequestException as e:
+                    transient = isinstance(e, (requests.ConnectionError, requests.Timeout))
+                    if last_attempt or not transient:
+                        UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="error")
+                        raise
+                else:
+                    if last_attempt or response.status_code not in RETRY_STATUSES:
+                        succeeded = response.status_code < 500
+                        UPSTREAM_REQUESTS.inc(upstream=self.name, outcome=f"{response.status_code // 100}xx")
+                        return response
+                    response.close()
+
+                UPSTREAM_RETRIES.inc(upstream=self.name)
+                time.sleep(self._backoff(attempt))
+        except Exception:
+            # Request errors, but also anything else session.request raised
+            succeeded = False
+            raise
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            elif succeeded is False:
+                self._failed()
+            else:
+                # Interrupted (KeyboardInterrupt, SystemExit): no verdict, but
+                # a half-open breaker must not wait for this trial forever
+                self.breaker.release_trial()
+            UPSTREAM_LATENCY.observe(time.monotonic() - started, upstream=self.name, method=method)
+
+    def _failed(self):
+        if self.breaker.record_failure():
+            CIRCUIT_OPENED.inc(upstream=self.name)
+            logger.warning(
+                f"{self.name} circuit opened after {self.breaker.failures} failures; "
+                f"failing fast for {self.settings['reset_seconds']:.0f}s"
+            )
+
+    def _backoff(self, attempt: int) -> float:
+        ceiling = min(self.settings["max_backoff"], self.settings["backoff"] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str) -> HttpClient:
+    """The shared client for an upstream, configured from its environment settings."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = HttpClient(
+                name,
+                headers={"Content-Type": "application/json"},
+                **upstream_settings(name),
+            )
+        return client
@@ -0,0 +1,312 @@
+# ======================================================
+# aibot/inference_worker.py
+# Out-of-process inference worker and its Unix socket client
+# ======================================================
+#
+# One worker process (`manage.py run_inference_worker`) owns the models and
+# the inference scheduler. Web processes set AIBOT_INFERENCE_SOCKET and talk
+# to it instead of loading their own copy of every GGUF.
+#
+# Wire format: newline-delimited JSON, one request per connection.
+#
+#   client -> {"op": "generate", "model_type": ..., "message": ..., "kwargs": {...},
+#              "stream": bool, "session_key": ..., "history": [[user, answer], ...],
+#              "timeout": seconds, "priority": class}
+#   worker -> {"accepted": true, "job_id": ...}       (or an error frame)
+#   worker -> {"chunk": "..."}                        (stream only, repeated)
+#   worker -> {"result": "...", "stop_reason": ..., "stats": {...}} | {"error": "..."}
+#
+#   client -> {"op": "cancel", "job_id": ..., "reason": ...}
+#   worker -> {"cancel": found}
+#
+# A streaming job is also cancelled when its client disconnects (noticed
+# at the next chunk).
+#
+#   client -> {"op": "status"}
+#   worker -> {"status": {...readiness report...}}
+#
+#   client -> {"op": "stats"}
+#   worker -> {"stats": {...scheduler stats per model...}}
+
+import os
+import json
+import uuid
+import socket
+import logging
+import threading
+import socketserver
+
+logger = logging.getLogger("aibot.inference_worker")
+
+DEFAULT_SOCKET_PATH = "/tmp/aibot-inference.sock"
+CONNECT_TIMEOUT = float(os.getenv("AIBOT_INFERENCE_CONNECT_TIMEOUT", "2"))
+RESULT_TIMEOUT = float(os.getenv("AIBOT_INFERENCE_TIMEOUT", "300"))
+
+
+class InferenceWorkerError(Exception):
+    """Raised when the inference worker is unreachable or a generation failed."""
+    pass
+
+
+def _send_frame(stream, payload: dict):
+    stream.write(json.dumps(payload).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def _read_frame(stream) -> dict:
+    line = stream.readline()
+    if not line:
+        raise InferenceWorkerError("Inference worker closed the connection")
+    return json.loads(line)
+
+
+# ======================================================
+# SERVER (RUNS IN THE WORKER PROCESS)
+# ======================================================
+
+# Jobs that have been accepted and not yet answered, by job id
+_live_jobs = {}
+_live_jobs_lock = threading.Lock()
+
+class _InferenceRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        from .ai_model import SCHEDULER, STOP_CANCELLED, STOP_DISCONNECT, InferenceOverloaded, local_readiness
+
+        try:
+            request = _read_frame(self.rfile)
+        except (InferenceWorkerError, ValueError):
+            return
+
+        op = request.get("op")
+        if op == "status":
+            _send_frame(self.wfile, {"status": local_readiness()})
+            return
+
+        if op == "stats":
+            _send_frame(self.wfile, {"stats": SCHEDULER.stats()})
+            return
+
+        if op == "cancel":
+            with _live_jobs_lock:
+                job = _live_jobs.get(request.get("job_id"))
+            if job is not None:
+                job.cancel(request.get("reason") or STOP_CANCELLED)
+            _send_frame(self.wfile, {"cancel": job is not None})
+            return
+
+        if op != "generate":
+            _send_frame(self.wfile, {"error": f"Unknown op: {op}"})
+            return
+
+        try:
+            job = SCHEDULER.submit(
+                request["model_type"],
+                request["message"],
+                request.get("kwargs", {}),
+                stream=bool(request.get("stream")),
+                session_key=request.get("session_key"),
+                history=request.get("history"),
+                timeout=request.get("timeout"),
+                priority=request.get("priority"),
+            )
+        except InferenceOverloaded as e:
+            _send_frame(self.wfile, {
+                "error": str(e),
+                "overloaded": True,
+                "depth": e.depth,
+                "retry_after": e.retry_after,
+            })
+            return
+        except (KeyError, ValueError) as e:
+            _send_frame(self.wfile, {"error": str(e)})
+            return
+
+        job_id = uuid.uuid4().hex
+        with _live_jobs_lock:
+            _live_jobs[job_id] = job
+        try:
+            _send_frame(self.wfile, {"accepted": True, "job_id": job_id})
+            if job.stream:
+                for chunk in job.chunks():
+                    _send_frame(self.wfile, {"chunk": chunk})
+                _send_frame(self.wfile, {"result": None, "stop_reason": job.stop_reason, "stats": job.stats})
+            else:
+                result = job.result()
+                _send_frame(self.wfile, {"result": result, "stop_reason": job.stop_reason, "stats": job.stats})
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("Client disconnected before the generation finished")
+            job.cancel(STOP_DISCONNECT)
+        except Exception as e:
+            logger.error("Generation failed in inference worker", exc_info=True)
+            try:
+                _send_frame(self.wfile, {"error": str(e)})
+            except OSError:
+                pass
+        finally:
+            with _live_jobs_lock:
+                _live_jobs.pop(job_id, None)
+
+
+class InferenceWorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server; the scheduler serialises work per model."""
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # stale socket from a previous run
+        super().__init__(socket_path, _InferenceRequestHandler)
+        os.chmod(socket_path, 0o660)
+        self.socket_path = socket_path
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+# ======================================================
+# CLIENT (RUNS IN THE WEB PROCESSES)
+# ======================================================
+
+class RemoteInferenceJob:
+    """Client-side handle with the same interface as ai_model.InferenceJob."""
+
+    def __init__(self, client: "InferenceWorkerClient", sock: socket.socket, stream: bool):
+        self.stream = stream
+        self.job_id = None
+        self.stop_reason = None
+        self.stats = {}
+        self._client = client
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+
+    def cancel(self, reason: str = None):
+        """Asks the worker to stop the generation at its next token."""
+        if self.job_id is None or self.stop_reason is not None:
+            return
+        try:
+            self._client._query("cancel", job_id=self.job_id, reason=reason)
+        except InferenceWorkerError:
+            logger.warning(f"Could not cancel job {self.job_id} on the inference worker", exc_info=True)
+
+    def _close(self):
+        try:
+            self._file.close()
+        finally:
+            self._sock.close()
+
+    def result(self, timeout=None) -> str:
+        try:
+            frame = _read_frame(self._file)
+        except (OSError, ValueError) as e:
+            raise InferenceWorkerError(f"Inference worker failed: {e}") from None
+        finally:
+            self._close()
+
+        if "error" in frame:
+            raise InferenceWorkerError(frame["error"])
+        self.stop_reason = frame.get("stop_reason")
+        self.stats = frame.get("stats") or {}
+        return frame["result"]
+
+    def chunks(self):
+        try:
+            while True:
+                frame = _read_frame(self._file)
+                if "chunk" in frame:
+                    yield frame["chunk"]
+                    continue
+                if "error" in frame:
+                    raise InferenceWorkerError(frame["error"])
+                self.stop_reason = frame.get("stop_reason")
+                self.stats = frame.get("stats") or {}
+                return
+        except (OSError, ValueError) as e:
+            raise InferenceWorkerError(f"Inference worker failed: {e}") from None
+        finally:
+            self._close()
+
+
+class InferenceWorkerClient:
+    """
+    Talks to the inference worker over its Unix socket.
+
+    Exposes the same `submit` interface as ai_model.InferenceScheduler so
+    generate_ai_response does not care where the model runs.
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise InferenceWorkerError(
+                f"Inference worker unreachable at {self.socket_path}: {e}"
+            ) from None
+        sock.settimeout(RESULT_TIMEOUT)
+        return sock
+
+    def submit(self, model_type: str, message: str, kwargs: dict, stream: bool = False,
+               session_key=None, history=None, timeout=None,
+               priority=None) -> RemoteInferenceJob:
+        """
+        Queues a generation on the worker.
+
+        Raises:
+            InferenceOverloaded: If the worker shed the request.
+            InferenceWorkerError: If the worker is unreachable or rejected it.
+        """
+        from .ai_model import InferenceOverloaded
+
+        sock = self._connect()
+        job = RemoteInferenceJob(self, sock, stream)
+        try:
+            _send_frame(job._file, {
+                "op": "generate",
+                "model_type": model_type,
+                "message": message,
+                "kwargs": kwargs,
+                "stream": stream,
+                "session_key": session_key,
+                "history": [list(turn) for turn in history or []],
+                "timeout": timeout,
+                "priority": priority,
+            })
+            frame = _read_frame(job._file)
+        except (OSError, ValueError) as e:
+            job._close()
+            raise InferenceWorkerError(f"Inference worker failed: {e}") from None
+
+        if frame.get("overloaded"):
+            job._close()
+            raise InferenceOverloaded(model_type, frame["depth"], frame["retry_after"])
+        if "error" in frame:
+            job._close()
+            raise InferenceWorkerError(frame["error"])
+        job.job_id = frame.get("job_id")
+        return job
+
+    def _query(self, op: str, **params):
+        sock = self._connect()
+        try:
+            stream = sock.makefile("rwb")
+            _send_frame(stream, {"op": op, **params})
+            return _read_frame(stream)[op]
+        except (OSError, ValueError, KeyError) as e:
+            raise InferenceWorkerError(f"Inference worker failed: {e}") from None
+        finally:
+            sock.close()
+
+    def status(self) -> dict:
+        """Returns the worker's readiness report."""
+        return self._query("status")
+
+    def stats(self) -> dict:
+        """Returns the worker's scheduler stats per model."""
+        return self._query("stats")
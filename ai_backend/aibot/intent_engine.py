@@ -0,0 +1,112 @@
+# ======================================================
+# aibot/intent_engine.py
+# Keyword automaton for intent detection
+# ======================================================
+#
+# An Aho-Corasick automaton over the intent vocabulary (action verbs,
+# profile field names, question words, ...). One pass over the message
+# finds every keyword, however many there are, so detection stays linear
+# in the message length as the vocabulary grows.
+#
+# Matches must start and end on word boundaries ("bio" does not match in
+# "biology", "name" not in "rename"), and overlapping matches resolve to
+# the leftmost, then longest one ("phone number" wins over "phone" and
+# "number").
+
+from collections import deque
+from typing import Dict, List, NamedTuple
+
+
+class KeywordMatch(NamedTuple):
+    start: int
+    end: int
+    keyword: str
+    kind: str
+    value: object
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def fold_case(text: str) -> str:
+    """Lower-cases `text` without changing its length, so offsets stay valid in the original."""
+    return "".join(
+        lowered if len(lowered) == 1 else char
+        for char, lowered in ((char, char.lower()) for char in text)
+    )
+
+
+class KeywordAutomaton:
+    """
+    Finds whole-word keywords in one pass.
+
+    Args:
+        vocabulary (dict): {kind: {keyword: value}}, e.g.
+            {"field": {"phone number": "phone_number"}, "verb": {"set": "set"}}.
+            Keywords are matched case-insensitively; a keyword listed under
+            several kinds keeps the last one.
+    """
+
+    def __init__(self, vocabulary: Dict[str, Dict[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[list] = [[]]  # (keyword, kind, value) ending at each state
+
+        for kind, keywords in vocabulary.items():
+            for keyword, value in keywords.items():
+                self._add(keyword.lower(), kind, value)
+        self._link()
+
+    def _add(self, keyword: str, kind: str, value):
+        state = 0
+        for char in keyword:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = following
+        self._output[state] = [entry for entry in self._output[state] if entry[0] != keyword]
+        self._output[state].append((keyword, kind, value))
+
+    def _link(self):
+        """Breadth-first failure links; outputs of the fallback state are inherited."""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, following in self._goto[state].items():
+                pending.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[following] = link if link != following else 0
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """Non-overlapping whole-word matches in `text`, left to right."""
+        folded = fold_case(text)
+        candidates = []
+        state = 0
+        for end, char in enumerate(folded, start=1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword, kind, value in self._output[state]:
+                start = end - len(keyword)
+                if start > 0 and _is_word_char(folded[start - 1]) and _is_word_char(keyword[0]):
+                    continue
+                if end < len(folded) and _is_word_char(folded[end]) and _is_word_char(keyword[-1]):
+                    continue
+                candidates.append(KeywordMatch(start, end, keyword, kind, value))
+
+        matches = []
+        covered = 0
+        for match in sorted(candidates, key=lambda m: (m.start, -m.end)):
+            if match.start >= covered:
+                matches.append(match)
+                covered = match.end
+        return matches
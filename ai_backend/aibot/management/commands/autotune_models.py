@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from aibot.ai_model import AVAILABLE_MODELS, TUNING_FILE, _load_model, model_backend, model_config
+from aibot.autotune import default_thread_choices, save_tuning, sweep_model
+
+
+def _int_list(value: str):
+    try:
+        return sorted({int(v) for v in value.split(",") if v.strip()})
+    except ValueError:
+        raise CommandError(f"Expected a comma-separated list of integers, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures prompt-evaluation and generation speed of each model for a "
+        "range of thread counts, batch sizes and context lengths on this "
+        "host, and writes the fastest settings to the per-host tuning file "
+        "that models load with. Run it on an otherwise idle machine; it "
+        "loads the models itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help=f"Models to tune (default: all). Choices: {', '.join(AVAILABLE_MODELS)}",
+        )
+        parser.add_argument(
+            "--threads",
+            default=",".join(str(t) for t in default_thread_choices()),
+            help="Thread counts to try (default: a quarter to all of the CPUs).",
+        )
+        parser.add_argument("--batch-sizes", default="8,32,128,512", help="Prompt batch sizes to try.")
+        parser.add_argument(
+            "--context-lengths",
+            default="512,1024,2048",
+            help="Context lengths to try (each one reloads the model).",
+        )
+        parser.add_argument(
+            "--gpu-layers",
+            type=int,
+            default=None,
+            help="Layers to offload to the GPU (use 0 on CPU-only hosts); stored with the results.",
+        )
+        parser.add_argument("--prompt-tokens", type=int, default=256, help="Prompt size for measurements.")
+        parser.add_argument("--generate-tokens", type=int, default=32, help="Tokens generated per measurement.")
+        parser.add_argument("--repeats", type=int, default=2, help="Runs per combination (best is kept).")
+        parser.add_argument("--output", default=str(TUNING_FILE), help="Tuning file to write.")
+        parser.add_argument("--dry-run", action="store_true", help="Print the results without writing them.")
+
+    def handle(self, *args, **options):
+        model_types = options["models"] or list(AVAILABLE_MODELS.keys())
+
+        unknown = [m for m in model_types if m not in AVAILABLE_MODELS]
+        if unknown:
+            raise CommandError(f"Unsupported model type(s): {', '.join(unknown)}")
+
+        threads = _int_list(options["threads"])
+        batch_sizes = _int_list(options["batch_sizes"])
+        context_lengths = _int_list(options["context_lengths"])
+        gpu_layers = options["gpu_layers"]
+
+        results = {}
+        for model_type in model_types:
+            self.stdout.write(f"Tuning {model_type} ({model_backend(model_type).name})...")
+
+            overrides = {} if gpu_layers is None else {"gpu_layers": gpu_layers}
+
+            def open_model(context_length, threads, batch_size):
+                return _load_model(
+                    model_type,
+                    context_length=context_length,
+                    threads=threads,
+                    batch_size=batch_size,
+                    **overrides,
+                )
+
+            def report(m):
+                self.stdout.write(
+                    f"  ctx={m['context_length']:<5} threads={m['threads']:<3} batch={m['batch_size']:<4} "
+                    f"prompt={m['prompt_tokens_per_sec']:>8.1f} tok/s  "
+                    f"generation={m['generation_tokens_per_sec']:>6.1f} tok/s"
+                )
+
+            try:
+                result = sweep_model(
+                    open_model,
+                    context_lengths,
+                    threads,
+                    batch_sizes,
+                    prompt_tokens=options["prompt_tokens"],
+                    generate_tokens=options["generate_tokens"],
+                    repeats=options["repeats"],
+                    per_call_settings=model_backend(model_type).per_call_settings,
+                    report=report,
+                )
+            except Exception as e:
+                raise CommandError(f"Tuning {model_type} failed: {e}")
+
+            result["config"].update(overrides)
+            results[model_type] = result
+
+            before = model_config(model_type)
+            changes = ", ".join(
+                f"{key} {before.get(key)} -> {value}" for key, value in result["config"].items()
+            )
+            self.stdout.write(self.style.SUCCESS(f"{model_type}: {changes}"))
+
+        if options["dry_run"]:
+            return
+
+        save_tuning(options["output"], results)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}; restart the app to apply it."))
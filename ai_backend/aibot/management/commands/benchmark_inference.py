@@ -0,0 +1,159 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aibot.ai_model import AVAILABLE_MODELS, INFERENCE_SOCKET
+from aibot.benchmark import (
+    DECODING_MODES,
+    DEFAULT_TARGETS,
+    TARGETS,
+    compare,
+    compare_decoding,
+    fake_backend,
+    run_benchmark,
+)
+
+
+def _int_list(value: str):
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise CommandError(f"Expected a comma-separated list of integers, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks generate_ai_response, stream_ai_response and the chat "
+        "views at several concurrency levels and reports time to first "
+        "token, tokens/sec and p50/p95/p99 latency per model as JSON. "
+        "--fake swaps the GGUF models for a deterministic fake so the "
+        "harness runs without model files (e.g. in CI). "
+        "--decoding plain,speculative compares speculative decoding "
+        "against plain decoding."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help=f"Models to benchmark (default: all). Choices: {', '.join(AVAILABLE_MODELS)}",
+        )
+        parser.add_argument(
+            "--targets",
+            default=",".join(DEFAULT_TARGETS),
+            help=f"Comma-separated entry points to drive. Choices: {', '.join(TARGETS)}",
+        )
+        parser.add_argument("--concurrency", default="1,2,4,8", help="Concurrency levels.")
+        parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level.")
+        parser.add_argument("--max-tokens", type=int, default=256, help="Answer length limit.")
+        parser.add_argument(
+            "--token",
+            default=None,
+            help="Bearer token for the view targets (without it they run as a guest, served by TinyLlama).",
+        )
+        parser.add_argument("--fake", action="store_true", help="Use the deterministic fake backend.")
+        parser.add_argument(
+            "--fake-decode-ms",
+            type=float,
+            default=10.0,
+            help="Per-token generation time of the fake backend.",
+        )
+        parser.add_argument(
+            "--fake-draft-decode-ms",
+            type=float,
+            default=2.0,
+            help="Per-token generation time of fake draft models.",
+        )
+        parser.add_argument(
+            "--decoding",
+            default="configured",
+            help=f"Comma-separated decoding modes to run in turn. Choices: {', '.join(DECODING_MODES)}",
+        )
+        parser.add_argument(
+            "--draft-model",
+            default=None,
+            help="Draft model for --decoding speculative where a model has none configured.",
+        )
+        parser.add_argument("--output", default=None, help="Write the JSON report to this file.")
+        parser.add_argument("--compare", default=None, help="Earlier JSON report to compare against.")
+
+    def handle(self, *args, **options):
+        model_types = options["models"] or list(AVAILABLE_MODELS.keys())
+        unknown = [m for m in model_types if m not in AVAILABLE_MODELS]
+        if unknown:
+            raise CommandError(f"Unsupported model type(s): {', '.join(unknown)}")
+
+        targets = [t.strip() for t in options["targets"].split(",") if t.strip()]
+        bad_targets = [t for t in targets if t not in TARGETS]
+        if bad_targets:
+            raise CommandError(f"Unknown target(s): {', '.join(bad_targets)}")
+
+        decoding = [d.strip() for d in options["decoding"].split(",") if d.strip()]
+        bad_modes = [d for d in decoding if d not in DECODING_MODES]
+        if bad_modes:
+            raise CommandError(f"Unknown decoding mode(s): {', '.join(bad_modes)}")
+        if options["draft_model"] and options["draft_model"] not in AVAILABLE_MODELS:
+            raise CommandError(f"Unsupported draft model: {options['draft_model']}")
+        if decoding != ["configured"] and INFERENCE_SOCKET:
+            raise CommandError("--decoding switches models in this process; unset AIBOT_INFERENCE_SOCKET")
+
+        if options["fake"] and INFERENCE_SOCKET:
+            raise CommandError("--fake runs models in this process; unset AIBOT_INFERENCE_SOCKET")
+
+        def report(level):
+            latency = level["latency_seconds"]
+            ttft = level["ttft_seconds"]["p50"]
+            self.stdout.write(
+                f"{level['decoding']:<12}{level['target']:<12}{level['model']:<10} c={level['concurrency']:<3} "
+                f"ok={level['ok']}/{level['requests']} rejected={level['rejected']} "
+                f"p50={latency['p50']}s p95={latency['p95']}s p99={latency['p99']}s "
+                f"ttft={ttft if ttft is not None else '-'}s "
+                f"throughput={level['throughput_tokens_per_sec']} tok/s"
+            )
+
+        backend = (
+            fake_backend(
+                decode_seconds_per_token=options["fake_decode_ms"] / 1000,
+                draft_decode_seconds_per_token=options["fake_draft_decode_ms"] / 1000,
+            )
+            if options["fake"] else nullcontext()
+        )
+        with backend:
+            result = run_benchmark(
+                model_types,
+                targets=targets,
+                concurrency_levels=_int_list(options["concurrency"]),
+                requests_per_level=options["requests"],
+                max_tokens=options["max_tokens"],
+                token=options["token"],
+                backend="fake" if options["fake"] else "gguf",
+                report=report,
+                decoding=decoding,
+                draft_model=options["draft_model"],
+            )
+
+        for mode, models in result["meta"]["speculative"].items():
+            for model_type, counts in models.items():
+                if counts["proposed"]:
+                    self.stdout.write(
+                        f"{mode}/{model_type}: draft {counts['draft_model']} "
+                        f"acceptance={counts['acceptance_rate']:.0%} "
+                        f"tokens/pass={counts['tokens_per_step']}"
+                    )
+        if "plain" in decoding and len(decoding) > 1:
+            for line in compare_decoding(result):
+                self.stdout.write(line)
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+            for line in compare(previous, result):
+                self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(result, indent=2))
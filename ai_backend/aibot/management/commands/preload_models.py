@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from aibot.ai_model import AVAILABLE_MODELS, preload_models
+
+
+class Command(BaseCommand):
+    help = (
+        "Downloads, loads and warms AI models with a dummy generation. "
+        "Useful at deploy time so the GGUF files are present and loadable "
+        "before web workers start; web processes preload their own copies "
+        "when AIBOT_PRELOAD_MODELS is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help=f"Models to preload (default: all). Choices: {', '.join(AVAILABLE_MODELS)}",
+        )
+        parser.add_argument(
+            "--no-warmup",
+            action="store_true",
+            help="Only load the models, skip the dummy generation.",
+        )
+
+    def handle(self, *args, **options):
+        model_types = options["models"] or list(AVAILABLE_MODELS.keys())
+
+        unknown = [m for m in model_types if m not in AVAILABLE_MODELS]
+        if unknown:
+            raise CommandError(f"Unsupported model type(s): {', '.join(unknown)}")
+
+        states = preload_models(model_types, warm_up=not options["no_warmup"])
+
+        failed = False
+        for model_type, state in states.items():
+            if state["state"] == "ready":
+                self.stdout.write(self.style.SUCCESS(f"{model_type}: ready"))
+            else:
+                failed = True
+                self.stdout.write(self.style.ERROR(f"{model_type}: {state['state']} ({state['error']})"))
+
+        if failed:
+            raise CommandError("One or more models failed to preload")
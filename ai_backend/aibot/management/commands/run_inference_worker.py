@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from aibot.ai_model import INFERENCE_SOCKET, start_background_preload
+from aibot.inference_worker import DEFAULT_SOCKET_PATH, InferenceWorkerServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the inference worker that owns the AI models. Web processes "
+        "started with AIBOT_INFERENCE_SOCKET pointing at the same socket send "
+        "their generations here instead of loading the models themselves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=INFERENCE_SOCKET or DEFAULT_SOCKET_PATH,
+            help="Unix socket path to listen on (default: $AIBOT_INFERENCE_SOCKET).",
+        )
+        parser.add_argument(
+            "--preload",
+            action="store_true",
+            help="Load and warm AIBOT_PRELOAD_MODELS (or all models) at startup.",
+        )
+
+    def handle(self, *args, **options):
+        server = InferenceWorkerServer(options["socket"])
+
+        if options["preload"]:
+            start_background_preload()
+
+        self.stdout.write(self.style.SUCCESS(f"Inference worker listening on {options['socket']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
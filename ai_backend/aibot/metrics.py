@@ -0,0 +1,205 @@
+# ======================================================
+# aibot/metrics.py
+# Prometheus-style counters and histograms (GET /aibot/metrics/)
+# ======================================================
+#
+# A small in-process registry rendered in the Prometheus text exposition
+# format, so capacity can be planned from real traffic without pulling in
+# a client library. Metrics are kept per process: with several web
+# workers, scrape each one (or run a single web process per host).
+#
+#   aibot_generations_total{model,stop_reason}        counter
+#   aibot_prompt_tokens_total{model}                   counter
+#   aibot_generated_tokens_total{model}                counter
+#   aibot_queue_wait_seconds{model,priority}           histogram
+#   aibot_prompt_eval_seconds{model}                   histogram
+#   aibot_decode_seconds{model}                        histogram
+#   aibot_decode_tokens_per_second{model}              histogram
+#   aibot_generated_tokens{model}                      histogram
+#   aibot_rate_limited_total{client,intent}            counter
+#   aibot_token_cache_total{event}                     counter  (token_cache.py)
+#   aibot_upstream_*{upstream,...}                     outbound calls (http_client.py)
+
+import math
+import threading
+from typing import Dict, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(state[-2], 6))}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}"
+
+
+class CounterFunc:
+    """Counter whose values are read at scrape time from fn() -> {label values tuple: value}."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], fn):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def samples(self):
+        for key, value in sorted(self.fn().items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def counter_func(self, name: str, help_text: str, labels: Sequence[str], fn) -> CounterFunc:
+        """A counter kept elsewhere (e.g. a cache's own stats), read when rendering."""
+        return self._register(CounterFunc(name, help_text, labels, fn))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+GENERATIONS = REGISTRY.counter(
+    "aibot_generations_total", "Answers returned, by how generation ended.", ("model", "stop_reason"))
+PROMPT_TOKENS = REGISTRY.counter(
+    "aibot_prompt_tokens_total", "Prompt tokens in the model context (evaluated or reused).", ("model",))
+GENERATED_TOKENS = REGISTRY.counter(
+    "aibot_generated_tokens_total", "Tokens generated.", ("model",))
+QUEUE_WAIT = REGISTRY.histogram(
+    "aibot_queue_wait_seconds", "Time a generation waited for the model and an inference slot.",
+    ("model", "priority"))
+PROMPT_EVAL = REGISTRY.histogram(
+    "aibot_prompt_eval_seconds", "Time to evaluate the prompt (until the first token).", ("model",))
+DECODE = REGISTRY.histogram(
+    "aibot_decode_seconds", "Time spent generating after the first token.", ("model",))
+DECODE_RATE = REGISTRY.histogram(
+    "aibot_decode_tokens_per_second", "Generation speed of each answer.", ("model",), RATE_BUCKETS)
+ANSWER_TOKENS = REGISTRY.histogram(
+    "aibot_generated_tokens", "Tokens generated per answer.", ("model",), TOKEN_BUCKETS)
+RATE_LIMITED = REGISTRY.counter(
+    "aibot_rate_limited_total", "Chat requests refused with 429.", ("client", "intent"))
+
+
+def record_generation(model_type: str, stats: dict):
+    """Records the inference stats of one answer (see ai_model.GenerationResult.stats)."""
+    GENERATIONS.inc(model=model_type, stop_reason=stats.get("stop_reason") or "unknown")
+    if stats.get("queue_wait_ms") is not None:
+        QUEUE_WAIT.observe(stats["queue_wait_ms"] / 1000, model=model_type,
+                           priority=stats.get("priority") or "unknown")
+    if not stats.get("prompt_tokens"):
+        return  # cached, shared or skipped: no inference of its own
+
+    PROMPT_TOKENS.inc(stats["prompt_tokens"], model=model_type)
+    GENERATED_TOKENS.inc(stats.get("generated_tokens", 0), model=model_type)
+    ANSWER_TOKENS.observe(stats.get("generated_tokens", 0), model=model_type)
+    PROMPT_EVAL.observe(stats.get("prompt_eval_ms", 0) / 1000, model=model_type)
+    DECODE.observe(stats.get("decode_ms", 0) / 1000, model=model_type)
+    if stats.get("tokens_per_sec"):
+        DECODE_RATE.observe(stats["tokens_per_sec"], model=model_type)
@@ -0,0 +1,293 @@
+# ======================================================
+# aibot/model_registry.py
+# Loaded models under a shared memory budget
+# ======================================================
+#
+# Every loaded model is charged its resident size: the GGUF weights (which
+# are memory-mapped and end up fully paged in) plus its KV cache. Before a
+# model loads, the least-recently-used idle models are unloaded until the
+# new one fits the budget. Models that are generating hold a lease and are
+# never evicted; pinned models (the preloaded ones by default) are never
+# evicted either. If nothing can be evicted the load waits for a lease to
+# be released and finally fails with ModelMemoryError.
+
+import os
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("aibot.model_registry")
+
+EVICTION_WAIT_SECONDS = float(os.getenv("AIBOT_MODEL_EVICTION_WAIT_SECONDS", "30"))
+
+
+class ModelMemoryError(Exception):
+    """A model cannot be loaded without exceeding the memory budget."""
+
+
+def physical_memory_bytes() -> int:
+    """Total RAM of the host, or 0 if it cannot be determined."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def resident_bytes() -> int:
+    """Resident set size of this process, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _LoadedModel:
+    def __init__(self, model, nbytes: int):
+        self.model = model
+        self.nbytes = nbytes
+        self.leases = 0
+        self.loaded_at = time.monotonic()
+        self.last_used = self.loaded_at
+
+
+class ModelRegistry:
+    """
+    Loads models on demand and keeps them within `budget_bytes`.
+
+    Args:
+        loader (callable): model_type -> loaded model.
+        size_of (callable): model_type -> estimated resident bytes.
+        budget_bytes (int): Memory all loaded models may use; 0 disables eviction.
+        pinned (iterable): Models that are never evicted.
+        on_unload (callable): Called with the model_type after a model is dropped.
+    """
+
+    def __init__(self, loader: Callable, size_of: Callable, budget_bytes: int = 0,
+                 pinned: Iterable[str] = (), on_unload: Optional[Callable] = None):
+        self.loader = loader
+        self.size_of = size_of
+        self.budget_bytes = budget_bytes
+        self.pinned = set(pinned)
+        self._on_unload = on_unload
+
+        self._models: "OrderedDict[str, _LoadedModel]" = OrderedDict()  # LRU first
+        self._reserved: Dict[str, int] = {}  # models being loaded -> bytes
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._cond = threading.Condition()
+
+        self.loads = 0
+        self.unloads = 0
+        self.evictions = 0
+        self.load_failures = 0
+
+    # --------------------------------------------------
+    # PUBLIC API
+    # --------------------------------------------------
+    def get(self, model_type: str):
+        """Returns the loaded model, loading it (and evicting others) if needed."""
+        return self._acquire(model_type, lease=False)
+
+    @contextmanager
+    def use(self, model_type: str):
+        """Holds a lease on the model so it cannot be evicted while in use."""
+        model = self._acquire(model_type, lease=True)
+        try:
+            yield model
+        finally:
+            with self._cond:
+                entry = self._models.get(model_type)
+                if entry is not None and entry.model is model:
+                    entry.leases -= 1
+                self._cond.notify_all()
+
+    def charge(self, model_type: str, nbytes: int) -> bool:
+        """
+        Adds `nbytes` (e.g. another context of the model) to a loaded
+        model's footprint, evicting idle models to make room. Returns False,
+        charging nothing, if it does not fit; it never waits.
+        """
+        evicted = False
+        with self._cond:
+            entry = self._models.get(model_type)
+            if entry is None:
+                return False
+            while self.budget_bytes and self.used_bytes + nbytes > self.budget_bytes:
+                victim = self._pick_victim(exclude=model_type)
+                if victim is None:
+                    return False
+                logger.info(f"Evicting {victim} to make room for another {model_type} context")
+                self._drop(victim)
+                self.evictions += 1
+                evicted = True
+            entry.nbytes += nbytes
+        if evicted:
+            self._collect()
+        return True
+
+    def is_loaded(self, model_type: str) -> bool:
+        with self._cond:
+            return model_type in self._models
+
+    def unload(self, model_type: str) -> bool:
+        """Drops a model that is not in use. Returns False if it is busy or not loaded."""
+        with self._cond:
+            entry = self._models.get(model_type)
+            if entry is None or entry.leases:
+                return False
+            self._drop(model_type)
+        self._collect()
+        return True
+
+    def clear(self):
+        """Drops every model that is not in use, pinned ones included."""
+        with self._cond:
+            for model_type in [key for key, entry in self._models.items() if not entry.leases]:
+                self._drop(model_type)
+        self._collect()
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(entry.nbytes for entry in self._models.values()) + sum(self._reserved.values())
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "budget_bytes": self.budget_bytes,
+                "used_bytes": self.used_bytes,
+                "loaded": {
+                    key: {
+                        "bytes": entry.nbytes,
+                        "leases": entry.leases,
+                        "pinned": key in self.pinned,
+                        "idle_seconds": round(now - entry.last_used, 1),
+                    }
+                    for key, entry in self._models.items()
+                },
+                "loading": list(self._reserved),
+                "loads": self.loads,
+                "unloads": self.unloads,
+                "evictions": self.evictions,
+                "load_failures": self.load_failures,
+            }
+
+    # --------------------------------------------------
+    # INTERNALS
+    # --------------------------------------------------
+    def _hit(self, model_type: str, lease: bool):
+        """Returns the model if loaded (marking it recently used). Caller holds _cond."""
+        entry = self._models.get(model_type)
+        if entry is None:
+            return None
+        entry.last_used = time.monotonic()
+        if lease:
+            entry.leases += 1
+        self._models.move_to_end(model_type)
+        return entry.model
+
+    def _acquire(self, model_type: str, lease: bool):
+        with self._cond:
+            model = self._hit(model_type, lease)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(model_type, threading.Lock())
+
+        with load_lock:
+            with self._cond:
+                # Another thread may have finished loading while we waited
+                model = self._hit(model_type, lease)
+                if model is not None:
+                    return model
+
+            estimate = self.size_of(model_type)
+            self._reserve(model_type, estimate)
+
+            rss_before = resident_bytes()
+            try:
+                model = self.loader(model_type)
+            except BaseException:
+                with self._cond:
+                    self._reserved.pop(model_type, None)
+                    self.load_failures += 1
+                    self._cond.notify_all()
+                raise
+
+            # mmap'd weights are paged in lazily, so the measured growth is a
+            # lower bound; never charge less than the estimate
+            nbytes = max(estimate, resident_bytes() - rss_before)
+            with self._cond:
+                self._reserved.pop(model_type, None)
+                entry = _LoadedModel(model, nbytes)
+                entry.leases = 1 if lease else 0
+                self._models[model_type] = entry
+                self.loads += 1
+                self._cond.notify_all()
+
+            logger.info(
+                f"Loaded {model_type} ({nbytes / (1024 * 1024):.0f} MB, "
+                f"{self.used_bytes / (1024 * 1024):.0f} / {self.budget_bytes / (1024 * 1024):.0f} MB in use)"
+            )
+            return model
+
+    def _reserve(self, model_type: str, nbytes: int):
+        """Evicts idle models until `nbytes` fits, then reserves it for model_type."""
+        deadline = time.monotonic() + EVICTION_WAIT_SECONDS
+        evicted = False
+        with self._cond:
+            while True:
+                if not self.budget_bytes or self.used_bytes + nbytes <= self.budget_bytes:
+                    break
+                if not self._models and not self._reserved:
+                    # Nothing else is resident: a model larger than the budget
+                    # still loads rather than never being servable
+                    logger.warning(
+                        f"{model_type} needs {nbytes / (1024 * 1024):.0f} MB, "
+                        f"more than the whole budget of {self.budget_bytes / (1024 * 1024):.0f} MB"
+                    )
+                    break
+
+                victim = self._pick_victim()
+                if victim is not None:
+                    logger.info(f"Evicting {victim} to make room for {model_type}")
+                    self._drop(victim)
+                    self.evictions += 1
+                    evicted = True
+                    continue
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ModelMemoryError(
+                        f"Cannot load {model_type}: needs {nbytes / (1024 * 1024):.0f} MB, "
+                        f"{self.used_bytes / (1024 * 1024):.0f} of "
+                        f"{self.budget_bytes / (1024 * 1024):.0f} MB held by models in use or pinned"
+                    )
+                self._cond.wait(remaining)
+
+            self._reserved[model_type] = nbytes
+
+        if evicted:
+            self._collect()
+
+    def _pick_victim(self, exclude: Optional[str] = None) -> Optional[str]:
+        """Least recently used model that is neither pinned nor in use. Caller holds _cond."""
+        for key, entry in self._models.items():
+            if not entry.leases and key not in self.pinned and key != exclude:
+                return key
+        return None
+
+    def _drop(self, model_type: str):
+        """Forgets a loaded model. Caller holds _cond."""
+        del self._models[model_type]
+        self.unloads += 1
+        if self._on_unload is not None:
+            self._on_unload(model_type)
+
+    @staticmethod
+    def _collect():
+        # ctransformers frees the native model when the Python object dies
+        gc.collect()
@@ -0,0 +1,231 @@
+# ======================================================
+# aibot/near_duplicate_cache.py
+# Answers for questions that are almost, but not exactly, repeated
+# ======================================================
+#
+# The exact response cache (response_cache.py) only matches a question
+# that normalizes to the same text. Guests often ask the same thing with
+# different punctuation or a word changed, so this cache finds earlier
+# questions that are merely similar:
+#
+#   * a question is cut into overlapping character shingles (after case
+#     folding and dropping punctuation and filler words such as "please"),
+#   * its MinHash signature is split into bands; questions sharing any
+#     band land in the same LSH bucket and become candidates,
+#   * a candidate is served only if the Jaccard similarity of the two
+#     shingle sets reaches the model's threshold and both mention the same
+#     numbers ("what is 2+2" must not answer "what is 2+3").
+#
+# The index lives in this process and holds at most `max_entries`
+# questions; the least recently used is dropped first and entries expire
+# after `ttl` seconds like the exact cache.
+
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("aibot.near_duplicate_cache")
+
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("AIBOT_NEAR_DUPLICATE_MAX_ENTRIES", "2048"))
+NEAR_DUPLICATE_TTL = int(os.getenv("AIBOT_NEAR_DUPLICATE_TTL", os.getenv("AIBOT_RESPONSE_CACHE_TTL", "600")))
+
+SHINGLE_SIZE = 4
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 4 rows per band: candidates from a Jaccard similarity of roughly 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_APOSTROPHE = re.compile(r"['\u2019]")
+_NON_WORD = re.compile(r"[^\w\s]+")
+# Words that do not change what is being asked
+FILLER_WORDS = frozenset({"please", "pls", "plz", "kindly", "hey", "hi", "hello", "thanks"})
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# (a, b) of the universal hash functions h(x) = (a * x + b) mod p
+_PERMUTATIONS = [
+    (_stable_hash(f"a{i}") % (_MERSENNE_PRIME - 1) + 1, _stable_hash(f"b{i}") % _MERSENNE_PRIME)
+    for i in range(NUM_PERMUTATIONS)
+]
+
+
+def shingles(message: str) -> frozenset:
+    """Hashed character shingles of the case-folded message without punctuation."""
+    words = _NON_WORD.sub(" ", _APOSTROPHE.sub("", message.casefold())).split()
+    text = " ".join(word for word in words if word not in FILLER_WORDS)
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([_stable_hash(text)])
+    return frozenset(
+        _stable_hash(text[i:i + SHINGLE_SIZE])
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    )
+
+
+def minhash(shingle_set) -> tuple:
+    """MinHash signature of a shingle set."""
+    return tuple(
+        min((a * x + b) % _MERSENNE_PRIME for x in shingle_set)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def jaccard(a, b) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("scope", "shingles", "numbers", "bands", "response", "expires_at")
+
+    def __init__(self, scope, shingle_set, numbers, bands, response, expires_at):
+        self.scope = scope
+        self.shingles = shingle_set
+        self.numbers = numbers
+        self.bands = bands
+        self.response = response
+        self.expires_at = expires_at
+
+
+class NearDuplicateCache:
+    """
+    MinHash/LSH index of answered questions.
+
+    Entries are scoped by model and sampling settings, like the exact
+    response cache, so an answer is only reused for the same generation
+    parameters.
+    """
+
+    def __init__(self, max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES, ttl: float = NEAR_DUPLICATE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.rows = NUM_PERMUTATIONS // BANDS
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # LRU first
+        self._buckets = {}   # (scope, band, band hash) -> set of entry ids
+        self._by_key = {}    # (scope, shingles) -> entry id, to replace re-stored questions
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.candidates = 0  # candidates compared, to see how selective the LSH buckets are
+
+    @staticmethod
+    def scope(model_type: str, sampling: dict) -> str:
+        return model_type + ":" + repr(sorted((k, str(v)) for k, v in sampling.items()))
+
+    def _bands(self, scope: str, signature: tuple):
+        return [
+            (scope, band, hash(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(BANDS)
+        ]
+
+    def get(self, message: str, model_type: str, sampling: dict, threshold: float):
+        """
+        Returns (answer, similarity) for the most similar earlier question
+        at or above `threshold`, or None.
+        """
+        query = shingles(message)
+        numbers = sorted(_NUMBER.findall(message))
+        bands = self._bands(self.scope(model_type, sampling), minhash(query))
+        now = time.monotonic()
+
+        with self._lock:
+            candidates = set()
+            for band in bands:
+                candidates.update(self._buckets.get(band, ()))
+            self.candidates += len(candidates)
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                if entry.numbers != numbers:
+                    continue
+                similarity = jaccard(query, entry.shingles)
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None or best_similarity < threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].response, best_similarity
+
+    def set(self, message: str, model_type: str, sampling: dict, response: str):
+        if self.ttl <= 0:
+            return
+        scope = self.scope(model_type, sampling)
+        shingle_set = shingles(message)
+        entry = _Entry(
+            scope,
+            shingle_set,
+            sorted(_NUMBER.findall(message)),
+            self._bands(scope, minhash(shingle_set)),
+            response,
+            time.monotonic() + self.ttl,
+        )
+
+        with self._lock:
+            previous = self._by_key.get((scope, shingle_set))
+            if previous is not None:
+                self._remove(previous)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._by_key[(scope, shingle_set)] = entry_id
+            for band in entry.bands:
+                self._buckets.setdefault(band, set()).add(entry_id)
+            self.stores += 1
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        """Drops an entry from the index. Caller holds _lock."""
+        entry = self._entries.pop(entry_id)
+        self._by_key.pop((entry.scope, entry.shingles), None)
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._by_key.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "candidates_per_lookup": round(self.candidates / lookups, 2) if lookups else 0.0,
+        }
+
+
+NEAR_DUPLICATE_CACHE = NearDuplicateCache()
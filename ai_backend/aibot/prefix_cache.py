@@ -0,0 +1,234 @@
+# ======================================================
+# aibot/prefix_cache.py
+# Reuse of evaluated prompt prefixes (KV cache) between generations
+# ======================================================
+#
+# A model context remembers every token it has evaluated. If the next
+# prompt starts with exactly that text (a continuing chat whose prompt is
+# the previous prompt + answer + the new message), only the new suffix has
+# to be evaluated. Models that can rewind their context (llama_cpp, see
+# backends.py) also keep the longest run of tokens the new prompt shares
+# with the context, e.g. the system preamble of one-off prompts.
+#
+# ctransformers can only append to a context or reset it, so one live
+# context per model would be thrown away as soon as another chat uses the
+# model. Instead each model gets a small pool of contexts ("slots"), one per
+# active chat session. Extra slots are further instances of the same GGUF,
+# opened on the CPU only (gpu_layers=0): offloading layers again would put
+# a second copy of them in VRAM, which a 4 GB card cannot hold. On the CPU
+# the weights are memory-mapped and shared with the first instance, so a
+# slot costs its KV cache (kv_cache_bytes_per_token * context_length) in
+# RAM. Slots share a byte budget and the least-recently-used slot is
+# recycled when the budget is full. Each new slot is also charged to its
+# model in the model registry (see ai_model), so it counts against the
+# memory budget of all loaded models; if that has no room, a slot is
+# recycled instead.
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from .model_registry import physical_memory_bytes
+
+logger = logging.getLogger("aibot.prefix_cache")
+
+# Budget for the KV caches of extra slots: 512 MB, but at most 10% of RAM
+_RAM_MB = physical_memory_bytes() // (1024 * 1024)
+PREFIX_CACHE_MB = int(os.getenv("AIBOT_PREFIX_CACHE_MB", str(min(512, _RAM_MB // 10) if _RAM_MB else 512)))
+
+
+class ContextSlot:
+    """One model context and the exact text evaluated in it so far."""
+
+    def __init__(self, model_type: str, model, nbytes: int, primary: bool = False):
+        self.model_type = model_type
+        self.model = model
+        self.nbytes = nbytes
+        self.primary = primary  # the shared get_model() instance, never closed
+
+        self.text: Optional[str] = None  # None -> state unknown, must reset
+        self.tokens: List[int] = []      # the tokens evaluated for `text`
+        self.session_key = None
+        self.last_used = time.monotonic()
+        self.busy = False
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self.tokens)
+
+    def forget(self):
+        self.text = None
+        self.tokens = []
+        self.session_key = None
+
+
+class PrefixCache:
+    """Pools of context slots per model with a shared memory budget."""
+
+    def __init__(self, budget_bytes: int = PREFIX_CACHE_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._slots: Dict[str, List[ContextSlot]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+        self.evaluated_tokens = 0
+
+    @property
+    def extra_bytes(self) -> int:
+        return sum(
+            slot.nbytes
+            for slots in self._slots.values()
+            for slot in slots
+            if not slot.primary
+        )
+
+    def acquire(self, model_type: str, prompt: str, session_key, base_model,
+                slot_bytes: int, open_context, reserve=None):
+        """
+        Picks the context to run `prompt` in and marks it busy.
+
+        Args:
+            model_type (str): Model the prompt is for.
+            prompt (str): Full prompt text.
+            session_key: Chat session the prompt belongs to (None for one-off prompts).
+            base_model: The shared get_model() instance, used as the first slot.
+            slot_bytes (int): KV cache size of one extra context.
+            open_context (callable): Loads a new context of this model
+                (without GPU offload, see above).
+            reserve (callable): Charges the memory of a new context
+                (slot_bytes) elsewhere; returns False if it does not fit.
+
+        Returns:
+            (ContextSlot, str | None): The slot, and the part of the prompt
+            still to evaluate if the slot's history is a prefix of the prompt.
+            None means the slot must be given the whole prompt: reset, or
+            rewound to the tokens it shares with the prompt if the model can.
+        """
+        with self._lock:
+            slots = self._slots.setdefault(model_type, [])
+            if not slots or slots[0].model is not base_model:
+                # First use, or the shared instance was reloaded
+                slots[:] = [ContextSlot(model_type, base_model, slot_bytes, primary=True)]
+
+            idle = [slot for slot in slots if not slot.busy]
+
+            # 1. A context whose history the prompt continues
+            best = None
+            for slot in idle:
+                if slot.text and prompt.startswith(slot.text) and len(prompt) > len(slot.text):
+                    if best is None or len(slot.text) > len(best.text):
+                        best = slot
+            if best is not None:
+                self.hits += 1
+                return self._take(best), prompt[len(best.text):]
+
+            # 2. The session's own context or a context nobody owns, the one
+            #    sharing the longest start with the prompt (kept if the
+            #    model can rewind to it)
+            free = [slot for slot in idle if slot.session_key is None or slot.session_key == session_key]
+            if free:
+                slot = max(free, key=lambda slot: (len(_common_prefix(slot.text, prompt)), slot.last_used))
+                if hasattr(slot.model, "rewind") and _common_prefix(slot.text, prompt):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                return self._take(slot), None
+
+            self.misses += 1
+
+            # 3. A new context, if the budget allows it
+            can_open = self.extra_bytes + slot_bytes <= self.budget_bytes
+            victim = min(idle, key=lambda slot: slot.last_used) if idle else None
+            if not can_open and victim is not None:
+                # 4. Otherwise recycle the least recently used one
+                return self._recycle(victim), None
+
+        if reserve is not None and not reserve(slot_bytes) and victim is not None:
+            # No room among the loaded models either; only this model's
+            # worker takes its slots, so the victim is still idle
+            with self._lock:
+                return self._recycle(victim), None
+
+        slot = ContextSlot(model_type, open_context(), slot_bytes)
+        with self._lock:
+            slot.busy = True
+            self._slots[model_type].append(slot)
+        logger.info(f"Opened prefix cache context #{len(self._slots[model_type])} for {model_type}")
+        return slot, None
+
+    @staticmethod
+    def _take(slot: ContextSlot) -> ContextSlot:
+        slot.busy = True
+        return slot
+
+    def _recycle(self, slot: ContextSlot) -> ContextSlot:
+        """Takes a slot over from its session. Caller holds _lock."""
+        self.evictions += 1
+        slot.forget()
+        return self._take(slot)
+
+    def extra_contexts(self, model_type: str) -> int:
+        """Contexts opened for model_type besides the shared instance."""
+        with self._lock:
+            return sum(1 for slot in self._slots.get(model_type, []) if not slot.primary)
+
+    def release(self, slot: ContextSlot, text: Optional[str], tokens: List[int], session_key,
+                reused_tokens: int = 0, evaluated_tokens: int = 0):
+        """
+        Records what the context now holds (its text and evaluated tokens)
+        and makes it available again. Pass text=None when the evaluated
+        state is unknown (errors, EOS).
+        """
+        with self._lock:
+            slot.text = text
+            slot.tokens = list(tokens) if text is not None else []
+            slot.session_key = session_key if text is not None else None
+            slot.last_used = time.monotonic()
+            slot.busy = False
+
+            self.reused_tokens += reused_tokens
+            self.evaluated_tokens += evaluated_tokens
+
+    def clear(self, model_type: Optional[str] = None):
+        """Drops all slots (of one model), e.g. when the model is unloaded."""
+        with self._lock:
+            if model_type is None:
+                self._slots.clear()
+            else:
+                self._slots.pop(model_type, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "contexts": {key: len(slots) for key, slots in self._slots.items()},
+            "extra_bytes": self.extra_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "reused_tokens": self.reused_tokens,
+            "evaluated_tokens": self.evaluated_tokens,
+        }
+
+
+def _common_prefix(text: Optional[str], prompt: str) -> str:
+    return os.path.commonprefix([text, prompt]) if text else ""
+
+
+def common_token_prefix(tokens: List[int], other: List[int]) -> int:
+    """Number of leading tokens two token lists share."""
+    count = 0
+    for a, b in zip(tokens, other):
+        if a != b:
+            break
+        count += 1
+    return count
+
+
+PREFIX_CACHE = PrefixCache()
@@ -0,0 +1,155 @@
+# ======================================================
+# aibot/rate_limit.py
+# Cost-aware admission control for the chat endpoints
+# ======================================================
+#
+# Every client has a token bucket: signed-in users are keyed by their user
+# id, guests by IP address. A chat message costs the tokens it may generate
+# (plus a share for its prompt, as in routing.estimate_seconds) times the
+# `rate_limit_weight` of the model serving it, so a Mistral answer drains
+# the bucket faster than a TinyLlama one. Action intents (profile updates)
+# never reach a model and cost a small flat amount.
+#
+# A request that does not fit in the bucket is refused with 429 and a
+# Retry-After telling the client when it will. Buckets refill continuously
+# up to their capacity; a full bucket is simply absent from the store.
+#
+# Bucket state lives in a cache backend. With several web processes it
+# must be shared (AIBOT_RATE_LIMIT_BACKEND=django); the read-modify-write
+# is then not atomic across processes, so a client racing itself from two
+# workers may get slightly more than its share.
+
+import os
+import math
+import time
+import threading
+
+from .ai_model import AVAILABLE_MODELS
+from .cache_backends import get_cache_backend
+from .routing import CHARS_PER_TOKEN
+
+RATE_LIMIT_BACKEND = os.getenv("AIBOT_RATE_LIMIT_BACKEND", "local")
+# Bucket size and refill per second, in weighted tokens (0 capacity = no limit)
+RATE_LIMIT_CAPACITY = float(os.getenv("AIBOT_RATE_LIMIT_CAPACITY", "8192"))
+RATE_LIMIT_REFILL = float(os.getenv("AIBOT_RATE_LIMIT_REFILL", "32"))
+GUEST_RATE_LIMIT_CAPACITY = float(os.getenv("AIBOT_GUEST_RATE_LIMIT_CAPACITY", "2048"))
+GUEST_RATE_LIMIT_REFILL = float(os.getenv("AIBOT_GUEST_RATE_LIMIT_REFILL", "8"))
+# Proxies in front of Django that append to X-Forwarded-For (0 = use REMOTE_ADDR)
+TRUSTED_PROXY_COUNT = int(os.getenv("AIBOT_TRUSTED_PROXY_COUNT", "0"))
+
+ACTION_COST = 16  # profile updates: intent matching and one auth-service call
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by client.
+
+    Args:
+        backend: Cache backend holding {"tokens", "updated"} per key.
+        capacity (float): Tokens a full bucket holds (the largest burst).
+        refill_per_second (float): Tokens added back per second.
+    """
+
+    def __init__(self, backend, capacity: float, refill_per_second: float):
+        self.backend = backend
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._lock = threading.Lock()  # serializes updates within this process
+
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.refill_per_second > 0
+
+    def _ttl(self) -> float:
+        # After this long an untouched bucket is full again and can be forgotten
+        return math.ceil(self.capacity / self.refill_per_second) + 1
+
+    def acquire(self, key: str, cost: float) -> float:
+        """
+        Takes `cost` tokens from the bucket of `key` if it holds enough.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until
+            the bucket will hold `cost` tokens.
+        """
+        if not self.enabled:
+            return 0.0
+        # A request larger than the whole bucket is admitted when it is full
+        cost = min(cost, self.capacity)
+
+        with self._lock:
+            now = time.time()
+            state = self.backend.get(key)
+            if state is None:
+                tokens = self.capacity
+            else:
+                elapsed = max(0.0, now - state["updated"])
+                tokens = min(self.capacity, state["tokens"] + elapsed * self.refill_per_second)
+
+            if tokens < cost:
+                self.limited += 1
+                return (cost - tokens) / self.refill_per_second
+
+            self.backend.set(key, {"tokens": tokens - cost, "updated": now}, ttl=self._ttl())
+            self.allowed += 1
+            return 0.0
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "refill_per_second": self.refill_per_second,
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+_backend = get_cache_backend(
+    RATE_LIMIT_BACKEND,
+    max_entries=16384,
+    default_ttl=600,
+    prefix="aibot",
+)
+
+USER_LIMITER = TokenBucketLimiter(_backend, RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL)
+GUEST_LIMITER = TokenBucketLimiter(_backend, GUEST_RATE_LIMIT_CAPACITY, GUEST_RATE_LIMIT_REFILL)
+
+
+def client_ip(request) -> str:
+    """The client's address, read behind TRUSTED_PROXY_COUNT proxies."""
+    if TRUSTED_PROXY_COUNT:
+        forwarded = [
+            part.strip()
+            for part in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+            if part.strip()
+        ]
+        if len(forwarded) >= TRUSTED_PROXY_COUNT:
+            return forwarded[-TRUSTED_PROXY_COUNT]
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def request_cost(model_type: str, message: str, max_tokens: int, is_action: bool) -> float:
+    """Weighted tokens a chat message may use."""
+    if is_action:
+        return ACTION_COST
+    weight = AVAILABLE_MODELS[model_type]["config"].get("rate_limit_weight", 1.0)
+    prompt_tokens = len(message) / CHARS_PER_TOKEN
+    return (max_tokens + prompt_tokens / 10) * weight
+
+
+def check_rate_limit(request, user_id, model_type: str, message: str, max_tokens: int,
+                     is_action: bool = False) -> float:
+    """
+    Charges one chat message to its client's bucket.
+
+    Returns:
+        float: 0 if the message may be served, otherwise the seconds the
+        client should wait before retrying.
+    """
+    if user_id is not None:
+        limiter, key = USER_LIMITER, f"ratelimit:user:{user_id}"
+    else:
+        limiter, key = GUEST_LIMITER, f"ratelimit:ip:{client_ip(request)}"
+    return limiter.acquire(key, request_cost(model_type, message, max_tokens, is_action))
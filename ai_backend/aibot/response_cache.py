@@ -0,0 +1,57 @@
+# ======================================================
+# aibot/response_cache.py
+# Cache of finished generations for repeated questions
+# ======================================================
+
+import os
+import json
+import hashlib
+
+from .cache_backends import CountingCache, get_cache_backend
+
+RESPONSE_CACHE_BACKEND = os.getenv("AIBOT_RESPONSE_CACHE_BACKEND", "local")
+RESPONSE_CACHE_TTL = int(os.getenv("AIBOT_RESPONSE_CACHE_TTL", "600"))  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AIBOT_RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+
+
+def normalize_message(message: str) -> str:
+    """Case-folds and collapses whitespace so trivial variations share a key."""
+    return " ".join(message.casefold().split())
+
+
+class ResponseCache(CountingCache):
+    """
+    Caches generated answers keyed on the normalized message, the model and
+    the sampling settings that produced them.
+    """
+
+    label = "Response cache"
+
+    @staticmethod
+    def make_key(message: str, model_type: str, sampling: dict) -> str:
+        payload = json.dumps(
+            {
+                "message": normalize_message(message),
+                "model": model_type,
+                "sampling": sampling,
+            },
+            sort_keys=True,
+        )
+        return "resp:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, message: str, model_type: str, sampling: dict):
+        """Returns the cached answer, or None on a miss."""
+        return self._lookup(self.make_key(message, model_type, sampling))
+
+    def set(self, message: str, model_type: str, sampling: dict, response: str):
+        self._store(self.make_key(message, model_type, sampling), response)
+
+
+RESPONSE_CACHE = ResponseCache(
+    get_cache_backend(
+        RESPONSE_CACHE_BACKEND,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        default_ttl=RESPONSE_CACHE_TTL,
+        prefix="aibot",
+    )
+)
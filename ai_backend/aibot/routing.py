@@ -0,0 +1,130 @@
+# ======================================================
+# aibot/routing.py
+# Load-aware model routing for chat requests
+# ======================================================
+#
+# Guests are always served by TinyLlama. Authenticated users get the model
+# they asked for (Mistral by default) unless it is saturated, in which case
+# they are degraded to the model's `fallback_model` instead of waiting in a
+# long queue. The decision and its reason are stored on the interaction.
+
+import os
+import time
+import logging
+import threading
+
+from .ai_model import AVAILABLE_MODELS, get_inference_executor
+
+logger = logging.getLogger("aibot.routing")
+
+# Degrade when the work queued ahead of a request would take longer than this
+ROUTING_MAX_WAIT_SECONDS = float(os.getenv("AIBOT_ROUTING_MAX_WAIT_SECONDS", "20"))
+# ...or when queued work + this request's own generation would exceed this
+ROUTING_MAX_EXPECTED_SECONDS = float(os.getenv("AIBOT_ROUTING_MAX_EXPECTED_SECONDS", "120"))
+# ...or when the queue is at least this full (share of max_queue_depth)
+ROUTING_MAX_QUEUE_SHARE = float(os.getenv("AIBOT_ROUTING_MAX_QUEUE_SHARE", "0.5"))
+# Scheduler stats are re-read at most this often
+ROUTING_STATS_TTL = float(os.getenv("AIBOT_ROUTING_STATS_TTL", "1"))
+
+CHARS_PER_TOKEN = 4  # rough prompt-size estimate before the tokenizer sees it
+
+_stats_cache = {"at": 0.0, "stats": {}}
+_stats_lock = threading.Lock()
+
+
+def _load_stats() -> dict:
+    with _stats_lock:
+        if time.monotonic() - _stats_cache["at"] < ROUTING_STATS_TTL:
+            return _stats_cache["stats"]
+        try:
+            stats = get_inference_executor().stats()
+        except Exception:
+            logger.warning("Could not read inference load; routing without it", exc_info=True)
+            stats = {}
+        _stats_cache.update(at=time.monotonic(), stats=stats)
+        return stats
+
+
+def estimate_seconds(load: dict, message: str, max_tokens: int):
+    """
+    Rough timing of a new request on this model.
+
+    Returns:
+        (wait, total): seconds of work queued ahead of the request, and that
+        plus its own prompt evaluation and decoding. Both are 0 while the
+        model has not served anything yet.
+    """
+    tokens_per_sec = load.get("tokens_per_sec") or 0
+    if not tokens_per_sec:
+        return 0.0, 0.0
+
+    wait = load.get("queue_depth", 0) * load.get("avg_job_seconds", 0)
+    # Prompt evaluation is much faster than decoding; count it at a tenth
+    prompt_tokens = len(message) / CHARS_PER_TOKEN
+    own = (max_tokens + prompt_tokens / 10) / tokens_per_sec
+    return wait, wait + own
+
+
+def is_saturated(load: dict, message: str, max_tokens: int):
+    """Returns (saturated, detail) for one model's load snapshot."""
+    depth = load.get("queue_depth", 0)
+    max_depth = load.get("max_queue_depth") or 0
+    wait, expected = estimate_seconds(load, message, max_tokens)
+
+    detail = (
+        f"queue={depth}, wait={wait:.1f}s, est={expected:.1f}s, "
+        f"tps={load.get('tokens_per_sec', 0)}"
+    )
+
+    if max_depth and depth >= max_depth * ROUTING_MAX_QUEUE_SHARE:
+        return True, detail
+    if wait > ROUTING_MAX_WAIT_SECONDS or expected > ROUTING_MAX_EXPECTED_SECONDS:
+        return True, detail
+    return False, detail
+
+
+def route_model(model_type: str, is_authenticated: bool, message: str, max_tokens: int = 256) -> dict:
+    """
+    Decides which model serves a chat message.
+
+    Args:
+        model_type (str): The model picked from auth state / the request.
+        is_authenticated (bool): Whether the user is signed in.
+        message (str): The user's message (its length feeds the estimate).
+        max_tokens (int): Tokens the answer may use.
+
+    Returns:
+        dict: {"requested", "model", "reason", "degraded"}.
+    """
+    decision = {
+        "requested": model_type,
+        "model": model_type,
+        "reason": "default",
+        "degraded": False,
+    }
+
+    if not is_authenticated:
+        decision["reason"] = "guest"
+        return decision
+
+    fallback = AVAILABLE_MODELS[model_type]["config"].get("fallback_model")
+    if not fallback:
+        return decision
+
+    stats = _load_stats()
+    saturated, detail = is_saturated(stats.get(model_type, {}), message, max_tokens)
+    if not saturated:
+        return decision
+
+    fallback_saturated, fallback_detail = is_saturated(stats.get(fallback, {}), message, max_tokens)
+    if fallback_saturated:
+        decision["reason"] = f"{model_type} and {fallback} saturated ({detail}; {fallback_detail})"
+        return decision
+
+    decision.update(
+        model=fallback,
+        reason=f"{model_type} saturated ({detail})",
+        degraded=True,
+    )
+    logger.info(f"Routing {model_type} -> {fallback}: {decision['reason']}")
+    return decision
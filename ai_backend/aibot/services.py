@@ -4,72 +4,165 @@
 # ======================================================
 
 import os
-import time
 import re
 import logging
-from functools import wraps
+from functools import partial, wraps
 
 import requests
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
 
 # Assuming aibot/ai_model.py exists with these functions/constants
 from .ai_model import generate_ai_response, AVAILABLE_MODELS 
+from .token_cache import TOKEN_CACHE
+from .single_flight import SingleFlight
+from .http_client import get_client
+from .intent_engine import KeywordAutomaton
 
 
 # ======================================================
-# LOGGING & HTTP SESSION
+# LOGGING & HTTP CLIENT
 # ======================================================
 
 logger = logging.getLogger("aibot.services")
 
-HTTP_SESSION = requests.Session()
-HTTP_SESSION.headers.update({"Content-Type": "application/json"})
+# Pooled, retrying, circuit-broken client for the auth service (http_client.py)
+AUTH_CLIENT = get_client("auth")
+
+# Profile updates are never retried, so they get a longer read timeout
+PROFILE_UPDATE_TIMEOUT = float(os.getenv("AIBOT_PROFILE_UPDATE_TIMEOUT", "5"))  # seconds
+
+# Concurrent identical GETs / profile fetches share one upstream call
+HTTP_GET_FLIGHTS = SingleFlight("http_get")
+PROFILE_FLIGHTS = SingleFlight("profile")
+
+
+def session_get(url: str, *, headers=None):
+    """
+    AUTH_CLIENT.get, coalesced with identical GETs already in flight.
+    The body is read before the response is shared between callers.
+    """
+    def fetch():
+        response = AUTH_CLIENT.get(url, headers=headers)
+        response.content  # read the body once, before it is shared
+        return response
+
+    key = (url, tuple(sorted((headers or {}).items())))
+    return HTTP_GET_FLIGHTS.do(key, fetch)
 
 # ======================================================
-# TOKEN CACHE
+# TOKEN VERIFICATION SETTINGS
 # ======================================================
 
-TOKEN_CACHE = {}
-TOKEN_CACHE_TTL = 60  # seconds
+# Verify access tokens here with the shared SIMPLE_JWT signing key instead of
+# asking the auth service. The auth service puts the profile id into the
+# token, which is all most views need. Names and emails can change while a
+# token is valid, so views that show them ask for the profile, which is
+# fetched (and cached, see token_cache.py) as before; so are tokens without
+# the claim.
+LOCAL_JWT_VERIFICATION = os.getenv("AIBOT_LOCAL_JWT", "1") != "0"
 
 
 class TokenValidationError(Exception):
     pass
 
 
+class AuthServiceUnavailable(TokenValidationError):
+    """The auth service could not be asked (unreachable, circuit open, 5xx)."""
+
+
 # ======================================================
 # TOKEN VALIDATION
 # ======================================================
 
-def validate_bearer_token(auth_header: str):
-    """Validates the token against the external auth service (with caching)."""
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise TokenValidationError("Authorization header missing")
+def verify_access_token(token: str) -> dict:
+    """Checks signature, expiry and token type locally. Returns the token's claims."""
+    try:
+        return dict(AccessToken(token).payload)
+    except TokenError as e:
+        raise TokenValidationError("Invalid token") from e
+
+
+def claims_user_data(claims: dict):
+    """
+    The identity part of the profile payload ("id", "user_id"), built from
+    token claims; None if the token predates the profile_id claim.
+    """
+    if claims.get("profile_id") is None:
+        return None
+    return {
+        "id": claims["profile_id"],
+        "user_id": claims.get("user_id"),
+    }
+
+
+def token_expiry(token: str):
+    """The token's `exp` claim, read without verifying it (only used to bound caching)."""
+    try:
+        return AccessToken(token, verify=False).payload.get("exp")
+    except TokenError:
+        return None
 
-    token = auth_header.split(" ")[1]
 
-    # Check cache
+def fetch_profile(token: str, expires_at=None) -> dict:
+    """
+    Fetches the user's profile from the external auth service. Cached per
+    token (see token_cache.py), never beyond `expires_at`.
+    """
     cached = TOKEN_CACHE.get(token)
-    if cached and time.time() - cached[1] < TOKEN_CACHE_TTL:
-        return token, cached[0]
+    if cached is not None:
+        return cached
+    # Page loads validate the same token several times at once
+    return PROFILE_FLIGHTS.do(TOKEN_CACHE.make_key(token), lambda: _fetch_profile(token, expires_at))
+
 
-    # Call Auth Service
+def _fetch_profile(token: str, expires_at) -> dict:
     try:
-        response = HTTP_SESSION.get(
+        response = session_get(
             os.getenv("AUTH_SERVICE_URL", "http://localhost:8000/api/auth/profile/"),
             headers={"Authorization": f"Bearer {token}"},
-            timeout=3,
         )
     except requests.RequestException:
         logger.warning("AUTH_SERVICE_URL is unreachable or timed out.")
-        raise TokenValidationError("Auth service unreachable") from None
-
+        raise AuthServiceUnavailable("Auth service unreachable") from None
 
+    if response.status_code >= 500:
+        raise AuthServiceUnavailable(f"Auth service error {response.status_code}")
     if response.status_code != 200:
         raise TokenValidationError("Invalid token")
 
     user_data = response.json()
-    # Update cache
-    TOKEN_CACHE[token] = (user_data, time.time())
+    TOKEN_CACHE.set(token, user_data, expires_at=expires_at)
+    return user_data
+
+
+def validate_bearer_token(auth_header: str, profile: bool = False):
+    """
+    Validates the bearer token. Returns (token, user_data).
+
+    The token is verified locally; user_data holds the ids from its claims
+    unless `profile` asks for the full profile (username, names, ...) or
+    the claims are missing, in which case it is fetched from the auth
+    service. A locally verified token stays valid while the auth service
+    is down: user_data then falls back to the claims.
+    """
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise TokenValidationError("Authorization header missing")
+
+    token = auth_header.split(" ")[1]
+
+    if not LOCAL_JWT_VERIFICATION:
+        return token, fetch_profile(token, expires_at=token_expiry(token))
+
+    claims = verify_access_token(token)
+    user_data = claims_user_data(claims)
+    if profile or user_data is None:
+        try:
+            user_data = fetch_profile(token, expires_at=claims.get("exp"))
+        except AuthServiceUnavailable:
+            if user_data is None:
+                raise
+            logger.warning("Profile unavailable; using the token claims")
     return token, user_data
 
 
@@ -77,8 +170,15 @@ def validate_bearer_token(auth_header: str):
 # AUTH DECORATORS
 # ======================================================
 
-def optional_bearer_token(view_func):
-    """Adds `is_authenticated`, `user_data`, and `token` to the request object."""
+def optional_bearer_token(view_func=None, *, profile: bool = False):
+    """
+    Adds `is_authenticated`, `user_data`, and `token` to the request object.
+    Use as @optional_bearer_token, or @optional_bearer_token(profile=True) when
+    the view needs the full profile from the auth service.
+    """
+    if view_func is None:
+        return partial(optional_bearer_token, profile=profile)
+
     @wraps(view_func)
     def wrapper(self, request, *args, **kwargs):
         request.is_authenticated = False
@@ -88,7 +188,7 @@ def optional_bearer_token(view_func):
         auth = request.META.get("HTTP_AUTHORIZATION", "")
         if auth.startswith("Bearer "):
             try:
-                token, user_data = validate_bearer_token(auth)
+                token, user_data = validate_bearer_token(auth, profile=profile)
                 request.is_authenticated = True
                 request.user_data = user_data
                 request.token = token
@@ -99,13 +199,20 @@ def optional_bearer_token(view_func):
     return wrapper
 
 
-def require_bearer_token(view_func):
-    """Validates the token and halts if invalid (returns 401 response)."""
+def require_bearer_token(view_func=None, *, profile: bool = False):
+    """
+    Validates the token and halts if invalid (returns 401 response).
+    `profile=True` fetches the full profile, as for optional_bearer_token.
+    """
+    if view_func is None:
+        return partial(require_bearer_token, profile=profile)
+
     @wraps(view_func)
     def wrapper(self, request, *args, **kwargs):
         try:
             token, user_data = validate_bearer_token(
-                request.META.get("HTTP_AUTHORIZATION", "")
+                request.META.get("HTTP_AUTHORIZATION", ""),
+                profile=profile,
             )
             request.is_authenticated = True
             request.user_data = user_data
@@ -217,21 +324,81 @@ def validate_field_value(field, value):
 # ======================================================
 # INTENT DETECTION
 # ======================================================
+INTENT_KEYWORDS = KeywordAutomaton({
+    "question": {word: word for word in QUESTION_WORDS},
+    "verb": {verb: verb for verb in ACTION_VERBS},
+    "field": PROFILE_FIELD_MAP,
+    "to": {"to": "to"},
+})
+
+# An explicit break between two updates: ",", ";" or "and", optionally
+# followed by "also", "my", "set", ... right before the next field
+_CLAUSE_BREAK = re.compile(
+    r"(?:[,;]|\band\b)(?:\s*(?:[,;]|\b(?:and|also|then|my|the|" + "|".join(sorted(ACTION_VERBS)) + r")\b))*\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_profile_updates(message: str, matches=None):
+    """
+    Pulls every "<field> ... to <value>" part out of a message, e.g.
+    "set my name to Jane Doe and phone to 9876543210" ->
+    {"full_name": "Jane Doe", "phone_number": "9876543210"}.
+
+    A value is free text: it runs to the end of the message unless an
+    explicit break (", and my phone to ...") starts an update of another
+    field. A field is updated at most once; a repeated "<field> to" stays
+    part of the value before it.
+
+    Returns:
+        dict: {profile field: value} in message order (empty values kept).
+    """
+    if matches is None:
+        matches = INTENT_KEYWORDS.find(message)
+
+    # The first field mentioned takes the first "to" after it
+    first = next((i for i, match in enumerate(matches) if match.kind == "field"), None)
+    if first is None:
+        return {}
+    to = next((i for i in range(first + 1, len(matches)) if matches[i].kind == "to"), None)
+    if to is None:
+        return {}
+
+    clauses = [(matches[first].value, matches[to].end)]  # (field, value start)
+    ends = []
+    for field, following in zip(matches[to + 1:], matches[to + 2:]):
+        if field.kind != "field" or following.kind != "to":
+            continue
+        if message[field.end:following.start].strip() or field.value in dict(clauses):
+            continue
+        separator = _CLAUSE_BREAK.search(message, clauses[-1][1], field.start)
+        if separator is None:
+            continue
+        ends.append(separator.start())
+        clauses.append((field.value, following.end))
+    ends.append(len(message))
+
+    return {field: message[start:end].strip() for (field, start), end in zip(clauses, ends)}
+
+
 def detect_intent(message: str):
-    """Determines if the message is a chat or a profile update command."""
-    msg = message.lower().strip()
-    words = set(msg.split())
+    """
+    Determines if the message is a chat or a profile update command.
+    Profile updates carry every requested field in data["updates"]; "field"
+    and "value" hold the first of them.
+    """
+    msg = message.strip()
+    matches = INTENT_KEYWORDS.find(msg)
+    kinds = {match.kind for match in matches}
 
-    is_question = (
-        "?" in msg or
-        words.intersection(QUESTION_WORDS)
-    )
+    is_question = "?" in msg or "question" in kinds
+    starts_with_action = bool(matches) and matches[0].kind == "verb" and matches[0].start == 0
 
-    has_action = any(v in msg for v in ACTION_VERBS)
-    has_field = any(k in msg for k in PROFILE_FIELD_MAP)
+    has_action = "verb" in kinds
+    has_field = "field" in kinds
 
     # If it's a question, treat as CHAT unless it explicitly starts with an action verb
-    if is_question and not msg.startswith(tuple(ACTION_VERBS)):
+    if is_question and not starts_with_action:
         return {"intent": "CHAT"}
 
     if has_field and not has_action:
@@ -241,33 +408,38 @@ def detect_intent(message: str):
         }
 
     if has_action:
-        to_index = msg.find(" to ")
-        if to_index == -1:
+        if "to" not in kinds:
             return {
                 "intent": "INCOMPLETE_ACTION",
                 "reason": "Missing 'to <value>' part"
             }
 
-        value = message[to_index + 4:].strip()
-        if not value:
+        if not has_field:
+            return {
+                "intent": "POSSIBLE_PROFILE_UPDATE",
+                "reason": "Unknown profile field"
+            }
+
+        updates = parse_profile_updates(msg, matches)
+        if not updates:
+            return {
+                "intent": "INCOMPLETE_ACTION",
+                "reason": "Missing 'to <value>' part"
+            }
+        if not all(updates.values()):
             return {
                 "intent": "INCOMPLETE_ACTION",
                 "reason": "Value after 'to' is missing"
             }
 
-        for keyword, field in PROFILE_FIELD_MAP.items():
-            if keyword in msg:
-                return {
-                    "intent": "UPDATE_PROFILE",
-                    "data": {
-                        "field": field,
-                        "value": value
-                    }
-                }
-
+        field, value = next(iter(updates.items()))
         return {
-            "intent": "POSSIBLE_PROFILE_UPDATE",
-            "reason": "Unknown profile field"
+            "intent": "UPDATE_PROFILE",
+            "data": {
+                "field": field,
+                "value": value,
+                "updates": updates,
+            }
         }
 
     return {"intent": "CHAT"}
@@ -276,22 +448,27 @@ def detect_intent(message: str):
 # ======================================================
 # PROFILE UPDATE EXECUTION
 # ======================================================
-def execute_update_profile(request, field: str, value: str):
-    """Calls the external authentication service to update a profile field."""
+def execute_update_profile(request, updates: dict):
+    """
+    Calls the external authentication service to update profile fields,
+    all of them ({field: value}) in a single request.
+    """
     if not request.is_authenticated:
         return {"error": "You must be logged in to update your profile."}
 
-    payload = {field: value}
+    payload = dict(updates)
 
     try:
-        response = HTTP_SESSION.put(
+        response = AUTH_CLIENT.put(
             os.getenv(
                 "AUTH_PROFILE_UPDATE_URL",
                 "http://localhost:8000/api/auth/profile/update/"
             ),
             json=payload,
             headers={"Authorization": f"Bearer {request.token}"},
-            timeout=5,
+            # Re-sending after a timeout could apply an update twice
+            retry=False,
+            timeout=(AUTH_CLIENT.settings["connect_timeout"], PROFILE_UPDATE_TIMEOUT),
         )
     except requests.RequestException:
         logger.exception("Profile update request failed")
@@ -300,4 +477,6 @@ def execute_update_profile(request, field: str, value: str):
     if response.status_code != 200:
         return {"error": response.text or "Profile update failed."}
 
+    # The cached profile still has the old values
+    TOKEN_CACHE.delete(request.token)
     return {"success": True}
\ No newline at end of file
@@ -0,0 +1,77 @@
+# ======================================================
+# aibot/single_flight.py
+# Coalescing of identical concurrent calls
+# ======================================================
+#
+# When the chat page loads, the frontend fires several requests with the
+# same token at once. Without coalescing each of them misses the token
+# cache and calls the auth service. With a SingleFlight the first caller
+# for a key runs the call; callers arriving while it is in flight wait for
+# it and get the same result (or the same exception). Nothing is cached:
+# once the call returns, the next caller starts a new one.
+#
+# Only for idempotent reads. Writes (profile updates) must not be shared.
+
+import threading
+
+from .metrics import REGISTRY
+
+COALESCED = REGISTRY.counter(
+    "aibot_coalesced_calls_total", "Calls answered by an identical call already in flight.", ("call",))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time within this process.
+
+    Args:
+        name (str): Label of the coalesced-calls metric.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0       # calls actually made
+        self.shared = 0      # callers that waited for someone else's call
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Returns fn(), or the result of the identical call already in flight."""
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            COALESCED.inc(call=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared}
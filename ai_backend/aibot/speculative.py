@@ -0,0 +1,153 @@
+# ======================================================
+# aibot/speculative.py
+# Speculative decoding: a small draft model proposes, the target verifies
+# ======================================================
+#
+# On CPU a decode step of a 7B model is bound by reading its weights, so
+# evaluating a handful of tokens in one pass costs about as much as
+# evaluating one. Each step here lets the draft model (TinyLlama for
+# Mistral) greedily propose `draft_tokens` tokens, evaluates all of them in
+# the target with a single eval() and then samples the target at every
+# proposed position. Proposals are accepted while the target's own sample
+# agrees with them; the first disagreement (or, if all were accepted, the
+# next position) supplies one more token from the target. Every emitted
+# token is therefore sampled from the target's distribution exactly as in
+# plain decoding; the draft only decides how many come out of one pass.
+#
+# The two models have different vocabularies, so proposals travel as text:
+# the draft's tokens are detokenized and re-tokenized for the target.
+#
+# Besides the basic model API (see backends.py) the target must provide:
+#
+#   n_tokens                            tokens currently in the context
+#   rewind(n_tokens)                    drop everything after the first n tokens
+#   sample_at(position, top_k=, top_p=, temperature=, repetition_penalty=)
+#       sample from the logits computed after the token at `position`
+#
+# and the draft n_tokens and rewind(). The llama_cpp backend provides them
+# (the target is loaded with logits for every position); ctransformers does
+# not, and models on it keep decoding one token at a time.
+
+import logging
+
+logger = logging.getLogger("aibot.speculative")
+
+DEFAULT_DRAFT_TOKENS = 4
+
+
+def supports_speculation(model) -> bool:
+    return all(hasattr(model, name) for name in ("n_tokens", "rewind", "sample_at"))
+
+
+class SpeculativeDecoder:
+    """
+    Token source with the same contract as model.generate(): yielded tokens
+    are already evaluated into the target's context and EOS ends the loop.
+
+    Args:
+        target: The model whose answer is generated.
+        draft: A separate draft model instance (its context is reset).
+        context_text (str): Text of everything the target context will hold
+            before the first generated token (cached prefix + new tokens);
+            the draft evaluates it to start from the same place.
+        tokenize (callable): (model, text) -> tokens, without a BOS token.
+        draft_tokens (int): Tokens proposed per step.
+    """
+
+    def __init__(self, target, draft, context_text: str, tokenize,
+                 draft_tokens: int = DEFAULT_DRAFT_TOKENS):
+        self.target = target
+        self.draft = draft
+        self.context_text = context_text
+        self.tokenize = tokenize
+        self.draft_tokens = max(1, draft_tokens)
+
+        self.steps = 0        # target verification passes
+        self.proposed = 0     # draft tokens offered to the target
+        self.accepted = 0     # of those, tokens the target agreed with
+
+    def stats(self) -> dict:
+        return {
+            "draft_steps": self.steps,
+            "draft_proposed": self.proposed,
+            "draft_accepted": self.accepted,
+        }
+
+    def generate(self, tokens, *, top_k=40, top_p=0.95, temperature=0.8,
+                 repetition_penalty=1.0, reset=True):
+        target, draft = self.target, self.draft
+        sampling = {
+            "top_k": top_k,
+            "top_p": top_p,
+            "temperature": temperature,
+            "repetition_penalty": repetition_penalty,
+        }
+
+        if reset:
+            target.reset()
+        target.eval(tokens)
+        draft.reset()
+        draft.eval(draft.tokenize(self.context_text))
+
+        committed = target.n_tokens   # context length up to the last yielded token
+        pending = []                  # target tokens the draft has not seen yet
+        try:
+            while True:
+                if pending:
+                    draft.eval(self.tokenize(draft, target.detokenize(pending)))
+                    pending = []
+
+                # Draft: greedy proposals, then forget them again
+                base = draft.n_tokens
+                drafted = []
+                for _ in range(self.draft_tokens):
+                    token = draft.sample(top_k=1, top_p=1.0, temperature=temperature,
+                                         repetition_penalty=repetition_penalty)
+                    if draft.is_eos_token(token):
+                        break
+                    draft.eval([token])
+                    drafted.append(token)
+                proposal = []
+                if drafted:
+                    proposal = self.tokenize(target, draft.detokenize(drafted))[:self.draft_tokens]
+
+                # Target: evaluate every proposal in one pass, then sample each position
+                start = target.n_tokens
+                if proposal:
+                    target.eval(proposal)
+                self.steps += 1
+                self.proposed += len(proposal)
+
+                emitted = []
+                for i in range(len(proposal) + 1):
+                    token = target.sample_at(start - 1 + i, **sampling)
+                    agreed = i < len(proposal) and token == proposal[i]
+                    if not agreed:
+                        # The target's choice replaces the rest of the proposal
+                        target.rewind(start + i)
+                        if target.is_eos_token(token):
+                            return
+                        target.eval([token])
+                    elif target.is_eos_token(token):
+                        target.rewind(start + i)
+                        return
+                    else:
+                        self.accepted += 1
+
+                    emitted.append(token)
+                    committed = start + i + 1
+                    yield token
+                    if not agreed:
+                        break
+
+                all_accepted = len(emitted) > len(proposal)
+                if all_accepted and target.detokenize(proposal) == draft.detokenize(drafted):
+                    # The draft already holds the accepted text; it only lacks the last token
+                    pending = emitted[len(proposal):]
+                else:
+                    draft.rewind(base)
+                    pending = emitted
+        finally:
+            # Stopped early: drop proposals evaluated past the last yielded token
+            if target.n_tokens > committed:
+                target.rewind(committed)
@@ -1,3 +1,1077 @@
-from django.test import TestCase
+import json
+import base64
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import ai_model, model_registry, near_duplicate_cache, rate_limit, services
+from .ai_model import (
+    AVAILABLE_MODELS,
+    MODEL_REGISTRY,
+    SCHEDULER,
+    STOP_CACHED,
+    InferenceJob,
+    InferenceOverloaded,
+    ModelQueue,
+    format_prompt,
+    generate_ai_response,
+    get_model,
+    model_backend,
+    run_generation,
+    stream_ai_response,
+)
+from .backends import CTransformersBackend, StubBackend, StubModel, get_backend
+from .benchmark import fake_backend, run_level
+from .cache_backends import LocalCacheBackend
+from .chat_jobs import CHAT_JOBS, DONE, _run_chat_job
+from .context_builder import SYSTEM_PROMPT
+from .downloads import ChecksumMismatch, DownloadError, DownloadManager
+from .fair_queue import SlotArbiter, WeightedFairQueue
+from .http_client import CircuitOpenError, HttpClient
+from .intent_engine import KeywordAutomaton
+from .model_registry import ModelMemoryError, ModelRegistry
+from .near_duplicate_cache import NearDuplicateCache
+from .prefix_cache import PrefixCache
+from .response_cache import ResponseCache
+from .services import (
+    TokenValidationError,
+    detect_intent,
+    execute_update_profile,
+    optional_bearer_token,
+    parse_profile_updates,
+    validate_bearer_token,
+)
+from .token_cache import TokenCache
+
+
+# ======================================================
+# LOCAL HTTP SERVER STAND-IN
+# ======================================================
+class StubServer:
+    """
+    An http.server on a free local port, served from a thread. Every
+    request is passed to `handle(request)`, a BaseHTTPRequestHandler, and
+    recorded as (method, path, headers) in `requests`.
+
+    Use as a context manager; `url(path)` gives absolute URLs.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self):
+                with stub._lock:
+                    stub.requests.append((self.command, self.path, dict(self.headers)))
+                stub.handle(self)
+
+            do_GET = do_HEAD = do_PUT = do_POST = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def url(self, path: str = "/") -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}{path}"
+
+    def count(self, method: str) -> int:
+        with self._lock:
+            return sum(1 for request in self.requests if request[0] == method)
+
+
+# ======================================================
+# MODEL DOWNLOADS
+# ======================================================
+def reply(status: int, body: bytes = b"ok"):
+    """A StubServer handler answering every request with `status`."""
+    def handle(request):
+        request.send_response(status)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+    return handle
+
+
+def drop_connection(request):
+    """Closes the connection without answering."""
+    request.close_connection = True
+
+
+def in_sequence(*handlers):
+    """Handles the n-th request with the n-th handler, later ones with the last."""
+    calls = iter(handlers)
+    last = [handlers[-1]]
+
+    def handle(request):
+        last[0] = next(calls, last[0])
+        last[0](request)
+    return handle
+
+
+class FileServer:
+    """
+    Serves `content` like a model host, with knobs for the failures the
+    DownloadManager has to survive.
+
+    Args:
+        ranges (bool): Whether GET honours Range (206 Partial Content).
+        advertise_ranges (bool): Whether HEAD sends Accept-Ranges: bytes.
+        fail_first (int): Number of GETs that send only half of their body
+            and then close the connection.
+        linked_etag (str): Sent as X-Linked-Etag (Hugging Face's SHA-256).
+    """
+
+    def __init__(self, content: bytes, ranges: bool = True, advertise_ranges: bool = None,
+                 fail_first: int = 0, linked_etag: str = None):
+        self.content = content
+        self.linked_etag = linked_etag
+        self.ranges = ranges
+        self.advertise_ranges = ranges if advertise_ranges is None else advertise_ranges
+        self.fail_first = fail_first
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.advertise_ranges:
+            headers["Accept-Ranges"] = "bytes"
+
+        if request.command == "HEAD":
+            request.send_response(200)
+            headers["Content-Length"] = str(len(self.content))
+            if self.linked_etag:
+                headers["X-Linked-Etag"] = f'"{self.linked_etag}"'
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.end_headers()
+            return
+
+        body, status = self.content, 200
+        range_header = request.headers.get("Range")
+        if self.ranges and range_header:
+            first, _, last = range_header[len("bytes="):].partition("-")
+            last = int(last) if last else len(self.content) - 1
+            body, status = self.content[int(first):last + 1], 206
+            headers["Content-Range"] = f"bytes {first}-{last}/{len(self.content)}"
+
+        with self._lock:
+            interrupt = self.fail_first > 0
+            self.fail_first -= interrupt
+
+        request.send_response(status)
+        headers["Content-Length"] = str(len(body))
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body[:len(body) // 2] if interrupt else body)
+
+
+class DownloadManagerTests(SimpleTestCase):
+    content = bytes(range(256)) * 64  # 16 KB
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.dest = self.tmp / "model.gguf"
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def manager(self, **kwargs):
+        options = {"segments": 4, "chunk_size": 1024, "max_retries": 1, "timeout": 5}
+        return DownloadManager(**{**options, **kwargs})
+
+    def test_downloads_in_parallel_segments(self):
+        with StubServer(FileServer(self.content)) as server:
+            self.manager().download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+
+        self.assertEqual(self.dest.read_bytes(), self.content)
+        self.assertEqual(server.count("GET"), 4)
+        self.assertFalse(self.dest.with_name("model.gguf.part").exists())
+        self.assertFalse(self.dest.with_name("model.gguf.part.json").exists())
+
+    def test_resumes_an_interrupted_segment(self):
+        files = FileServer(self.content, fail_first=1)
+        with StubServer(files) as server:
+            manager = self.manager(segments=1)
+            with self.assertRaises(DownloadError):
+                manager.download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+            self.assertTrue(self.dest.with_name("model.gguf.part.json").exists())
+
+            manager.download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+
+        self.assertEqual(self.dest.read_bytes(), self.content)
+        ranges = [headers.get("Range") for method, _, headers in server.requests if method == "GET"]
+        # The second request continues where the first one was cut off
+        half, last = len(self.content) // 2, len(self.content) - 1
+        self.assertEqual(ranges, [f"bytes=0-{last}", f"bytes={half}-{last}"])
+
+    def test_rejects_a_checksum_mismatch(self):
+        with StubServer(FileServer(self.content)) as server:
+            with self.assertRaises(ChecksumMismatch):
+                self.manager().download(server.url("/model.gguf"), self.dest, sha256="0" * 64)
+
+        self.assertFalse(self.dest.exists())
+        self.assertFalse(self.dest.with_name("model.gguf.part").exists())
+        self.assertFalse(self.dest.with_name("model.gguf.part.json").exists())
+
+    def test_verifies_against_the_published_checksum(self):
+        with StubServer(FileServer(self.content, linked_etag=self.sha256)) as server:
+            self.manager().download(server.url("/model.gguf"), self.dest)
+        self.assertEqual(self.dest.read_bytes(), self.content)
+
+        self.dest.unlink()
+        with StubServer(FileServer(self.content, linked_etag="0" * 64)) as server:
+            with self.assertRaises(ChecksumMismatch):
+                self.manager().download(server.url("/model.gguf"), self.dest)
+        self.assertFalse(self.dest.exists())
+
+    def test_server_without_range_support(self):
+        with StubServer(FileServer(self.content, ranges=False)) as server:
+            self.manager().download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+
+        self.assertEqual(self.dest.read_bytes(), self.content)
+        self.assertEqual(server.count("GET"), 1)
+
+    def test_restarts_from_zero_when_a_resume_gets_the_whole_file(self):
+        files = FileServer(self.content, ranges=False, fail_first=1)
+        with StubServer(files) as server:
+            self.manager(max_retries=2).download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+
+        self.assertEqual(self.dest.read_bytes(), self.content)
+
+    def test_falls_back_to_one_stream_when_ranges_are_ignored(self):
+        files = FileServer(self.content, ranges=False, advertise_ranges=True)
+        with StubServer(files) as server:
+            self.manager(max_retries=3).download(server.url("/model.gguf"), self.dest, sha256=self.sha256)
+
+        self.assertEqual(self.dest.read_bytes(), self.content)
+        # The segments not starting at 0 fail at once instead of being retried
+        self.assertLessEqual(server.count("GET"), 5)
+
+
+# ======================================================
+# INFERENCE PATH ON THE STUB BACKEND
+# ======================================================
+def stub_answer(message: str, max_tokens: int) -> str:
+    """What a fresh StubModel answers to `message` (first turn, no history)."""
+    model = StubModel()
+    tokens = []
+    for token in model.generate(model.tokenize(format_prompt(message))):
+        tokens.append(token)
+        if len(tokens) >= max_tokens:
+            break
+    return model.detokenize(tokens).strip()
+
+
+class StubInferenceTestCase(SimpleTestCase):
+    """Runs every model on the stub backend, with empty answer caches and rate limits."""
+
+    def setUp(self):
+        self.use(fake_backend(prompt_seconds_per_token=0, decode_seconds_per_token=0.001))
+        self.response_cache = ResponseCache(LocalCacheBackend())
+        self.use(mock.patch.object(ai_model, "RESPONSE_CACHE", self.response_cache))
+        self.use(mock.patch.object(ai_model, "NEAR_DUPLICATE_CACHE", NearDuplicateCache()))
+        for name in ("USER_LIMITER", "GUEST_LIMITER"):
+            limiter = getattr(rate_limit, name)
+            fresh = rate_limit.TokenBucketLimiter(
+                LocalCacheBackend(), limiter.capacity, limiter.refill_per_second)
+            self.use(mock.patch.object(rate_limit, name, fresh))
+
+    def use(self, context):
+        """Enters a context manager until the end of the test."""
+        result = context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        return result
+
+    def without_answer_caches(self, model_type: str):
+        self.use(mock.patch.dict(
+            AVAILABLE_MODELS[model_type]["config"],
+            {"response_cache": False, "near_duplicate_threshold": None},
+        ))
+
+
+class StubInferenceTests(StubInferenceTestCase):
+    message = "Explain how photosynthesis works in simple terms"
+
+    def test_generate_returns_the_stub_answer(self):
+        expected = stub_answer(self.message, 16)
+        self.assertTrue(expected)
+
+        response = generate_ai_response(self.message, max_tokens=16, model_type="tinyllama")
+
+        self.assertEqual(response, expected)
+        self.assertEqual(response.stats["generated_tokens"], len(expected.split()))
+
+    def test_stream_returns_the_stub_answer(self):
+        self.without_answer_caches("tinyllama")
+        expected = stub_answer(self.message, 16)
+
+        stream = stream_ai_response(self.message, max_tokens=16, model_type="tinyllama")
+
+        self.assertEqual("".join(stream).strip(), expected)
+        self.assertEqual(generate_ai_response(self.message, max_tokens=16, model_type="tinyllama"), expected)
+
+    def test_identical_prompts_in_one_group_share_a_generation(self):
+        queue = ModelQueue("tinyllama", SlotArbiter(1), coalesce_window_ms=1000, max_coalesced_jobs=4)
+        kwargs = ai_model._generation_kwargs("tinyllama", 16)
+
+        jobs = [queue.submit(InferenceJob(self.message, kwargs)) for _ in range(4)]
+        results = [job.result(timeout=30).strip() for job in jobs]
+
+        self.assertEqual(results, [stub_answer(self.message, 16)] * 4)
+        self.assertEqual(queue.completed, 1)
+
+    def test_repeated_question_is_served_from_the_response_cache(self):
+        completed = SCHEDULER.queues["tinyllama"].completed
+        first = generate_ai_response(self.message, max_tokens=16, model_type="tinyllama")
+        second = generate_ai_response(self.message, max_tokens=16, model_type="tinyllama")
+
+        self.assertEqual(second, first)
+        self.assertEqual(second.stop_reason, STOP_CACHED)
+        self.assertEqual(self.response_cache.hits, 1)
+        self.assertEqual(SCHEDULER.queues["tinyllama"].completed, completed + 1)
+
+    def test_full_queue_sheds_the_request(self):
+        self.use(mock.patch.object(SCHEDULER.queues["tinyllama"], "max_depth", 0))
+
+        with self.assertRaises(InferenceOverloaded) as raised:
+            generate_ai_response(self.message, max_tokens=16, model_type="tinyllama")
+        self.assertEqual(raised.exception.model_type, "tinyllama")
+
+        response = self.client.post("/aibot/chat/", {"message": self.message}, content_type="application/json")
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response["Retry-After"])
+
+    def test_guest_over_its_rate_limit_gets_429(self):
+        self.use(mock.patch.object(rate_limit.GUEST_LIMITER, "capacity", 1.0))
+        self.use(mock.patch.object(rate_limit.GUEST_LIMITER, "refill_per_second", 0.01))
+
+        first = self.client.post("/aibot/chat/", {"message": self.message}, content_type="application/json")
+        second = self.client.post("/aibot/chat/", {"message": self.message}, content_type="application/json")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["ai_response"], stub_answer(self.message, 256))
+        self.assertEqual(second.status_code, 429)
+        self.assertGreaterEqual(int(second["Retry-After"]), 1)
+
+
+# ======================================================
+# BACKEND SELECTION
+# ======================================================
+class BenchmarkTests(StubInferenceTestCase):
+    def test_guest_views_are_not_rate_limited_while_benchmarking(self):
+        self.without_answer_caches("tinyllama")
+        for target in ("view", "view-stream"):
+            with self.subTest(target=target):
+                level = run_level(target, "tinyllama", concurrency=2, requests=12, max_tokens=256)
+
+                self.assertEqual((level["ok"], level["rejected"], level["errors"]), (12, 0, 0))
+                self.assertGreater(level["generated_tokens"]["p50"], 0)
+        self.assertEqual(rate_limit.GUEST_LIMITER.capacity, rate_limit.GUEST_RATE_LIMIT_CAPACITY)
+
+    def test_tokens_come_from_the_inference_stats(self):
+        level = run_level("generate", "tinyllama", concurrency=1, requests=2, max_tokens=8)
+
+        self.assertEqual(level["ok"], 2)
+        self.assertEqual(level["generated_tokens"]["p50"], 8)
+
+
+class PrefixCacheTests(StubInferenceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = self.use(mock.patch.object(ai_model, "PREFIX_CACHE", PrefixCache(budget_bytes=1 << 30)))
+        self.kwargs = ai_model._generation_kwargs("tinyllama", 4)
+
+    def generate(self, message: str, session_key=None) -> dict:
+        stats = {}
+        text = run_generation(
+            "tinyllama", format_prompt(message), self.kwargs, session_key=session_key, stats=stats)
+        self.assertEqual(stats["stop_reason"], "length")
+        # A reused context must answer exactly like a fresh one
+        self.assertEqual(text.strip(), stub_answer(message, 4))
+        return stats
+
+    def test_one_off_prompts_reuse_the_system_preamble(self):
+        first = self.generate("What is the capital of France")
+        second = self.generate("Name three primary colors")
+
+        preamble = len(StubModel().tokenize(SYSTEM_PROMPT))
+        self.assertGreaterEqual(self.cache.reused_tokens, preamble)
+        self.assertEqual(
+            self.cache.evaluated_tokens,
+            first["prompt_tokens"] + second["prompt_tokens"] - self.cache.reused_tokens,
+        )
+        self.assertEqual(self.cache.stats()["contexts"], {"tinyllama": 1})
+
+    def test_new_contexts_are_charged_to_the_model(self):
+        self.generate("What is the capital of France", session_key="a")
+        before = MODEL_REGISTRY.stats()["loaded"]["tinyllama"]["bytes"]
+
+        self.generate("Name three primary colors", session_key="b")
+
+        slot_bytes = ai_model.model_config("tinyllama")["kv_cache_bytes_per_token"] * 1024
+        self.assertEqual(MODEL_REGISTRY.stats()["loaded"]["tinyllama"]["bytes"], before + slot_bytes)
+        self.assertEqual(self.cache.stats()["contexts"], {"tinyllama": 2})
+
+    def test_a_full_memory_budget_recycles_a_context(self):
+        self.generate("What is the capital of France", session_key="a")
+        # (stub models are charged nothing; 0 would mean no budget at all)
+        self.use(mock.patch.object(MODEL_REGISTRY, "budget_bytes", MODEL_REGISTRY.used_bytes + 1))
+
+        self.generate("Name three primary colors", session_key="b")
+
+        self.assertEqual(self.cache.stats()["contexts"], {"tinyllama": 1})
+        self.assertEqual(self.cache.evictions, 1)
+
+
+class BackendSelectionTests(SimpleTestCase):
+    def setUp(self):
+        MODEL_REGISTRY.clear()
+        self.addCleanup(MODEL_REGISTRY.clear)
+        patcher = mock.patch.object(ai_model, "BACKEND_OVERRIDE", "")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_model_runs_on_the_backend_its_config_names(self):
+        with mock.patch.dict(AVAILABLE_MODELS["tinyllama"], {"backend": "stub"}):
+            self.assertIsInstance(model_backend("tinyllama"), StubBackend)
+            self.assertIsInstance(get_model("tinyllama"), StubModel)
+        self.assertIsInstance(model_backend("mistral"), CTransformersBackend)
+
+    def test_override_runs_every_model_on_one_backend(self):
+        with mock.patch.object(ai_model, "BACKEND_OVERRIDE", "stub"):
+            for model_type in ("mistral", "tinyllama"):
+                self.assertIsInstance(model_backend(model_type), StubBackend)
+                self.assertIsInstance(get_model(model_type), StubModel)
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            get_backend("no-such-engine")
+
+
+# ======================================================
+# ASYNC CHAT JOBS
+# ======================================================
+class CancellableChunks:
+    """A stream of word chunks that stops at the chunk after cancel()."""
+
+    def __init__(self, words: int, on_chunk=None):
+        self.words = words
+        self.on_chunk = on_chunk
+        self.stop_reason = None
+        self.stats = {}
+        self.produced = 0
+
+    def __iter__(self):
+        for i in range(self.words):
+            if self.stop_reason is not None:
+                return
+            self.produced += 1
+            if self.on_chunk is not None:
+                self.on_chunk(i)
+            yield f"w{i} "
+
+    def cancel(self, reason):
+        self.stop_reason = reason
+
+
+class ChatJobTests(SimpleTestCase):
+    def test_cancel_from_another_process_stops_at_the_next_chunk(self):
+        job = CHAT_JOBS.create(None, "tinyllama", owner_ip="10.0.0.1")
+
+        def cancel_elsewhere(i):
+            # As another web process would: only the flag in the shared store
+            if i == 2:
+                CHAT_JOBS.request_cancel(job["job_id"], "cancelled")
+
+        chunks = CancellableChunks(1000, on_chunk=cancel_elsewhere)
+        _run_chat_job(job, chunks, lambda text, stop_reason, stats: {"ai_response": text})
+
+        self.assertEqual(job["status"], DONE)
+        self.assertEqual(job["stop_reason"], "cancelled")
+        self.assertEqual(chunks.produced, 3)
+        self.assertEqual(job["result"]["ai_response"], "w0 w1 w2")
+
+    def test_guest_job_is_only_reachable_from_its_address(self):
+        job = CHAT_JOBS.create(None, "tinyllama", owner_ip="10.0.0.1")
+        url = f"/aibot/chat-job-status/?job_id={job['job_id']}"
+
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.2").status_code, 404)
+        self.assertEqual(self.client.post(
+            "/aibot/chat-cancel/", {"job_id": job["job_id"]},
+            content_type="application/json", REMOTE_ADDR="10.0.0.2",
+        ).status_code, 404)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+
+# ======================================================
+# BEARER TOKENS
+# ======================================================
+class JsonServer:
+    """Answers every request with `payload` as JSON and the given status."""
+
+    def __init__(self, payload, status: int = 200):
+        self.payload = payload
+        self.status = status
+
+    def __call__(self, request):
+        body = json.dumps(self.payload).encode()
+        request.send_response(self.status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def access_token(lifetime: timedelta = None, **claims) -> str:
+    token = AccessToken()
+    for name, value in claims.items():
+        token[name] = value
+    if lifetime is not None:
+        token.set_exp(lifetime=lifetime)
+    return str(token)
+
+
+class BearerTokenTests(SimpleTestCase):
+    profile = {"id": 7, "user_id": 3, "user": {"username": "jane", "email": "jane@example.com"}}
+
+    def setUp(self):
+        patcher = mock.patch.object(services, "TOKEN_CACHE", TokenCache(LocalCacheBackend()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_token_is_verified_without_the_auth_service(self):
+        token = access_token(user_id=3, profile_id=7)
+
+        with mock.patch.object(services, "fetch_profile") as fetch_profile:
+            validated, user_data = validate_bearer_token(f"Bearer {token}")
+
+        self.assertEqual(validated, token)
+        self.assertEqual(user_data, {"id": 7, "user_id": 3})
+        fetch_profile.assert_not_called()
+
+    def test_expired_token_is_rejected(self):
+        token = access_token(lifetime=timedelta(seconds=-1), user_id=3, profile_id=7)
+
+        with self.assertRaises(TokenValidationError):
+            validate_bearer_token(f"Bearer {token}")
+
+    def test_tampered_token_is_rejected(self):
+        header, payload, signature = access_token(user_id=3, profile_id=7).split(".")
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        claims["profile_id"] = 8
+        forged = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+
+        with self.assertRaises(TokenValidationError):
+            validate_bearer_token(f"Bearer {header}.{forged}.{signature}")
+
+    def test_missing_header_is_rejected(self):
+        with self.assertRaises(TokenValidationError):
+            validate_bearer_token("")
+
+    def test_profile_is_fetched_once_and_cached(self):
+        token = access_token(user_id=3, profile_id=7)
+
+        with StubServer(JsonServer(self.profile)) as server, \
+                mock.patch.dict("os.environ", {"AUTH_SERVICE_URL": server.url("/profile/")}):
+            first = validate_bearer_token(f"Bearer {token}", profile=True)[1]
+            second = validate_bearer_token(f"Bearer {token}", profile=True)[1]
+
+        self.assertEqual(first, self.profile)
+        self.assertEqual(second, self.profile)
+        self.assertEqual(server.count("GET"), 1)
+        self.assertEqual(server.requests[0][2]["Authorization"], f"Bearer {token}")
+
+    def test_verified_token_stays_authenticated_while_auth_service_is_down(self):
+        token = access_token(user_id=3, profile_id=7)
+        request = SimpleNamespace(META={"HTTP_AUTHORIZATION": f"Bearer {token}"})
+
+        @optional_bearer_token(profile=True)
+        def view(self, request):
+            return request
+
+        with StubServer(drop_connection) as server, \
+                mock.patch.dict("os.environ", {"AUTH_SERVICE_URL": server.url("/profile/")}):
+            view(None, request)
+
+        self.assertGreater(server.count("GET"), 0)
+        self.assertTrue(request.is_authenticated)
+        self.assertEqual(request.user_data, {"id": 7, "user_id": 3})
+
+    def test_token_rejected_by_auth_service_makes_a_guest(self):
+        token = access_token(user_id=3, profile_id=7)
+        request = SimpleNamespace(META={"HTTP_AUTHORIZATION": f"Bearer {token}"})
+
+        @optional_bearer_token(profile=True)
+        def view(self, request):
+            return request
+
+        with StubServer(JsonServer({"detail": "revoked"}, status=401)) as server, \
+                mock.patch.dict("os.environ", {"AUTH_SERVICE_URL": server.url("/profile/")}):
+            view(None, request)
+
+        self.assertFalse(request.is_authenticated)
+        self.assertIsNone(request.user_data)
+
+
+class ProfileServer:
+    """A stand-in auth service: GET returns the profile, PUT updates it."""
+
+    def __init__(self, profile: dict):
+        self.profile = json.loads(json.dumps(profile))
+
+    def __call__(self, request):
+        if request.command == "PUT":
+            length = int(request.headers.get("Content-Length") or 0)
+            self.profile.update(json.loads(request.rfile.read(length)))
+        JsonServer(self.profile)(request)
+
+
+class ProfileUpdateTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(services, "TOKEN_CACHE", TokenCache(LocalCacheBackend()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_update_drops_the_cached_profile(self):
+        token = access_token(user_id=3, profile_id=7)
+        request = SimpleNamespace(is_authenticated=True, token=token)
+
+        with StubServer(ProfileServer({"id": 7, "full_name": "Jane Doe"})) as server, \
+                mock.patch.dict("os.environ", {
+                    "AUTH_SERVICE_URL": server.url("/profile/"),
+                    "AUTH_PROFILE_UPDATE_URL": server.url("/profile/update/"),
+                }):
+            before = validate_bearer_token(f"Bearer {token}", profile=True)[1]
+            result = execute_update_profile(request, {"full_name": "Jane Roe"})
+            after = validate_bearer_token(f"Bearer {token}", profile=True)[1]
+
+        self.assertEqual(result, {"success": True})
+        self.assertEqual(before["full_name"], "Jane Doe")
+        self.assertEqual(after["full_name"], "Jane Roe")
+        self.assertEqual(server.count("GET"), 2)
+
+    def test_update_is_not_retried(self):
+        request = SimpleNamespace(is_authenticated=True, token=access_token(user_id=3, profile_id=7))
+
+        with StubServer(reply(503, b"busy")) as server, \
+                mock.patch.dict("os.environ", {"AUTH_PROFILE_UPDATE_URL": server.url("/profile/update/")}):
+            result = execute_update_profile(request, {"full_name": "Jane Roe"})
+
+        self.assertEqual(result, {"error": "busy"})
+        self.assertEqual(server.count("PUT"), 1)
+
+
+class HttpClientTests(SimpleTestCase):
+    def make_client(self, **settings):
+        settings = {"retries": 2, "backoff": 0.001, "failure_threshold": 2, "reset_seconds": 30.0, **settings}
+        return HttpClient("test", **settings)
+
+    def test_retries_bad_gateway_and_unavailable(self):
+        client = self.make_client()
+        with StubServer(in_sequence(reply(502), reply(503), reply(200))) as server:
+            response = client.get(server.url("/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.count("GET"), 3)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_retries_a_dropped_connection(self):
+        client = self.make_client()
+        with StubServer(in_sequence(drop_connection, reply(200))) as server:
+            response = client.get(server.url("/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.count("GET"), 2)
+
+    def test_post_is_not_retried(self):
+        client = self.make_client()
+        with StubServer(reply(503)) as server:
+            response = client.post(server.url("/"), data=b"{}")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.count("POST"), 1)
+
+    def test_a_call_counts_one_failure_however_often_it_was_tried(self):
+        client = self.make_client(failure_threshold=5)
+        with StubServer(reply(503)) as server:
+            client.get(server.url("/"))
+
+        self.assertEqual(server.count("GET"), 3)
+        self.assertEqual(client.breaker.failures, 1)
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+
+    def test_circuit_opens_after_threshold_and_fails_fast(self):
+        client = self.make_client(retries=0, failure_threshold=2, reset_seconds=30.0)
+        with StubServer(drop_connection) as server:
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    client.get(server.url("/"))
+            with self.assertRaises(CircuitOpenError) as raised:
+                client.get(server.url("/"))
+
+        self.assertEqual(server.count("GET"), 2)
+        self.assertEqual(client.breaker.state, client.breaker.OPEN)
+        self.assertEqual(raised.exception.upstream, "test")
+        self.assertGreater(raised.exception.retry_after, 29.0)
+        self.assertLessEqual(raised.exception.retry_after, 30.0)
+
+    def test_half_open_trial_closes_or_reopens_the_circuit(self):
+        client = self.make_client(retries=0, failure_threshold=1, reset_seconds=0.05)
+        with StubServer(in_sequence(reply(500), reply(500), reply(200))) as server:
+            client.get(server.url("/"))
+            self.assertEqual(client.breaker.state, client.breaker.OPEN)
+
+            time.sleep(0.06)
+            client.get(server.url("/"))  # failed trial
+            self.assertEqual(client.breaker.state, client.breaker.OPEN)
+            with self.assertRaises(CircuitOpenError):
+                client.get(server.url("/"))
+
+            time.sleep(0.06)
+            response = client.get(server.url("/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+        self.assertEqual(server.count("GET"), 3)
+
+    def test_interrupted_trial_lets_the_next_call_try(self):
+        client = self.make_client(retries=0, failure_threshold=1, reset_seconds=0.05)
+        with StubServer(reply(200)) as server:
+            client.breaker.record_failure()
+            time.sleep(0.06)
+            with mock.patch.object(client.session, "request", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    client.get(server.url("/"))
+            response = client.get(server.url("/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.breaker.state, client.breaker.CLOSED)
+
+    def test_unexpected_error_counts_as_a_failure(self):
+        client = self.make_client(failure_threshold=1)
+        with mock.patch.object(client.session, "request", side_effect=ValueError("bad header")):
+            with self.assertRaises(ValueError):
+                client.get("http://127.0.0.1:9/")
+
+        self.assertEqual(client.breaker.state, client.breaker.OPEN)
+
+
+class KeywordAutomatonTests(SimpleTestCase):
+    automaton = KeywordAutomaton({
+        "field": {"phone": "phone_number", "phone number": "phone_number", "number": "phone_number", "bio": "bio"},
+        "verb": {"set": "set"},
+    })
+
+    def test_matches_whole_words_only(self):
+        text = "reset the biology notes, then set bio"
+        found = self.automaton.find(text)
+
+        self.assertEqual([m.keyword for m in found], ["set", "bio"])
+        self.assertEqual([m.start for m in found], [text.rindex("set"), text.rindex("bio")])
+
+    def test_prefers_the_leftmost_longest_match(self):
+        found = self.automaton.find("Set my Phone Number")
+
+        self.assertEqual([m.keyword for m in found], ["set", "phone number"])
+        self.assertEqual(found[1].value, "phone_number")
+        self.assertEqual("Set my Phone Number"[found[1].start:found[1].end], "Phone Number")
+
+    def test_offsets_survive_case_folding(self):
+        text = "İ set bio"  # "İ".lower() is two characters long
+        found = self.automaton.find(text)
+
+        self.assertEqual([text[m.start:m.end] for m in found], ["set", "bio"])
+
+
+class ProfileUpdateParsingTests(SimpleTestCase):
+    def test_several_fields_after_explicit_breaks(self):
+        updates = parse_profile_updates(
+            "Set my name to Jane Doe, and also my phone number to 9876543210; gender to F")
+
+        self.assertEqual(updates, {"full_name": "Jane Doe", "phone_number": "9876543210", "gender": "F"})
+
+    def test_field_words_inside_a_value_do_not_split_it(self):
+        for bio in (
+            "Engineer who is about to move to Berlin",
+            "I answer the phone to help people",
+            "My name is Bob and I love to cook",
+        ):
+            with self.subTest(bio=bio):
+                intent = detect_intent(f"update my bio to {bio}")
+
+                self.assertEqual(intent["intent"], "UPDATE_PROFILE")
+                self.assertEqual(intent["data"]["updates"], {"bio": bio})
+
+    def test_repeated_field_does_not_overwrite(self):
+        updates = parse_profile_updates("update my bio to cats, and bio to dogs")
+
+        self.assertEqual(updates, {"bio": "cats, and bio to dogs"})
+
+    def test_missing_value_is_incomplete(self):
+        self.assertEqual(detect_intent("update my name to")["intent"], "INCOMPLETE_ACTION")
+        self.assertEqual(detect_intent("update my name")["intent"], "INCOMPLETE_ACTION")
+
+    def test_questions_are_chat(self):
+        self.assertEqual(detect_intent("can you change my name to Bob?")["intent"], "CHAT")
+
+
+class WeightedFairQueueTests(SimpleTestCase):
+    weights = {"authenticated": 4.0, "guest": 1.0}
+
+    def serve(self, queue: WeightedFairQueue, count: int) -> list:
+        served = []
+        for _ in range(count):
+            klass = queue.pop()
+            queue.charge(klass, 1.0)
+            served.append(klass)
+        return served
+
+    def test_classes_share_service_by_weight(self):
+        queue = WeightedFairQueue(self.weights)
+        for _ in range(100):
+            queue.push("authenticated", "authenticated")
+            queue.push("guest", "guest")
+
+        served = self.serve(queue, 50)
+
+        self.assertEqual(served.count("authenticated"), 40)
+        self.assertEqual(served.count("guest"), 10)
+
+    def test_idle_class_rejoins_without_saved_credit(self):
+        queue = WeightedFairQueue(self.weights)
+        for _ in range(100):
+            queue.push("guest", "guest")
+        self.serve(queue, 40)  # guests alone for a while
+
+        for _ in range(20):
+            queue.push("authenticated", "authenticated")
+        served = self.serve(queue, 10)
+
+        # The newcomer gets its share from now on, not 40 units of back pay
+        self.assertEqual(served.count("authenticated"), 8)
+        self.assertEqual(served.count("guest"), 2)
+
+    def test_rejects_weights_that_are_not_positive(self):
+        with self.assertRaises(ValueError):
+            WeightedFairQueue({"authenticated": 4.0, "guest": 0.0})
+
+
+class SlotArbiterTests(SimpleTestCase):
+    def waiter(self, arbiter: SlotArbiter, klass: str, order: list) -> threading.Thread:
+        def run():
+            with arbiter.slot(klass):
+                order.append(klass)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def wait_for_waiters(self, arbiter: SlotArbiter, count: int):
+        deadline = time.monotonic() + 5
+        while len(arbiter._waiting) < count:
+            self.assertLess(time.monotonic(), deadline, "waiters did not queue")
+            time.sleep(0.001)
+
+    def test_freed_slot_goes_to_the_heavier_class(self):
+        arbiter = SlotArbiter(1, {"authenticated": 4.0, "guest": 1.0})
+        order = []
+
+        with arbiter.slot("guest"):
+            threads = [self.waiter(arbiter, "guest", order)]
+            self.wait_for_waiters(arbiter, 1)
+            threads.append(self.waiter(arbiter, "authenticated", order))
+            self.wait_for_waiters(arbiter, 2)
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ["authenticated", "guest"])
+
+    def test_interrupted_wait_does_not_block_later_callers(self):
+        arbiter = SlotArbiter(1)
+        order = []
+
+        with arbiter.slot("guest"):
+            with mock.patch.object(arbiter._cond, "wait", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    with arbiter.slot("authenticated"):
+                        pass
+            thread = self.waiter(arbiter, "guest", order)
+            self.wait_for_waiters(arbiter, 1)
+        thread.join(5)
+
+        self.assertEqual(order, ["guest"])
+        self.assertEqual(len(arbiter._waiting), 0)
+
+
+class NearDuplicateCacheTests(SimpleTestCase):
+    sampling = {"temperature": 0.6, "top_p": 0.85}
+
+    def setUp(self):
+        self.cache = NearDuplicateCache(max_entries=8, ttl=60)
+
+    def lookup(self, message: str, threshold: float = 0.85, model_type: str = "tinyllama"):
+        return self.cache.get(message, model_type, self.sampling, threshold)
+
+    def store(self, message: str, answer: str, model_type: str = "tinyllama"):
+        self.cache.set(message, model_type, self.sampling, answer)
+
+    def test_similar_question_hits(self):
+        self.store("How does photosynthesis work in plants?", "With light.")
+
+        for question in (
+            "how does photosynthesis work in plants",
+            "Hey, how does photosynthesis work in plants please!",
+            "How does photosynthesis work in plant?",
+        ):
+            with self.subTest(question=question):
+                answer, similarity = self.lookup(question)
+                self.assertEqual(answer, "With light.")
+                self.assertGreaterEqual(similarity, 0.85)
+
+    def test_different_numbers_miss(self):
+        self.store("What is 2+2?", "4")
+
+        self.assertIsNone(self.lookup("What is 2+3?", threshold=0.1))
+        self.assertEqual(self.lookup("what is 2 + 2")[0], "4")
+
+    def test_question_below_the_threshold_misses(self):
+        self.store("How does photosynthesis work in plants?", "With light.")
+
+        self.assertIsNone(self.lookup("How does respiration work in animals?"))
+        self.assertIsNone(self.lookup("How does photosynthesis work in plants?", model_type="mistral"))
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_entries_expire(self):
+        with mock.patch.object(near_duplicate_cache.time, "monotonic", return_value=1000.0):
+            self.store("How does photosynthesis work in plants?", "With light.")
+        with mock.patch.object(near_duplicate_cache.time, "monotonic", return_value=1061.0):
+            self.assertIsNone(self.lookup("How does photosynthesis work in plants?"))
+
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        questions = [f"Tell me a fact about the animal number {i}" for i in range(8)]
+        for i, question in enumerate(questions):
+            self.store(question, f"fact {i}")
+        self.assertEqual(self.lookup(questions[0])[0], "fact 0")  # now the most recent
+
+        self.store("Tell me a fact about the animal number 8", "fact 8")
+
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.lookup(questions[0])[0], "fact 0")
+        self.assertIsNone(self.lookup(questions[1]))
+
+
+class ModelRegistryTests(SimpleTestCase):
+    sizes = {"a": 40, "b": 40, "c": 40}
+
+    def registry(self, budget_bytes: int = 100, pinned=()):
+        unloaded = []
+        registry = ModelRegistry(
+            loader=lambda model_type: SimpleNamespace(name=model_type),
+            size_of=self.sizes.__getitem__,
+            budget_bytes=budget_bytes,
+            pinned=pinned,
+            on_unload=unloaded.append,
+        )
+        return registry, unloaded
+
+    def loaded(self, registry) -> set:
+        return set(registry.stats()["loaded"])
+
+    def test_least_recently_used_model_is_evicted(self):
+        registry, unloaded = self.registry()
+        registry.get("a")
+        registry.get("b")
+        registry.get("a")  # b is now the least recently used
+
+        registry.get("c")
+
+        self.assertEqual(unloaded, ["b"])
+        self.assertEqual(self.loaded(registry), {"a", "c"})
+
+    def test_pinned_model_is_never_evicted(self):
+        registry, unloaded = self.registry(pinned=["a"])
+        registry.get("a")
+        registry.get("b")
+
+        registry.get("c")
+
+        self.assertEqual(unloaded, ["b"])
+
+    def test_leased_model_is_not_evicted(self):
+        registry, unloaded = self.registry()
+        with registry.use("a"):
+            registry.get("b")
+            registry.get("c")
+
+        self.assertEqual(unloaded, ["b"])
+        self.assertEqual(self.loaded(registry), {"a", "c"})
+
+    def test_load_fails_when_nothing_can_be_evicted_in_time(self):
+        registry, unloaded = self.registry(budget_bytes=60)
+        with mock.patch.object(model_registry, "EVICTION_WAIT_SECONDS", 0.05), registry.use("a"):
+            with self.assertRaises(ModelMemoryError):
+                registry.get("b")
+
+        self.assertEqual(unloaded, [])
+        self.assertEqual(self.loaded(registry), {"a"})
+
+    def test_charge_evicts_idle_models_or_refuses(self):
+        registry, unloaded = self.registry()
+        registry.get("a")
+        registry.get("b")
+
+        self.assertTrue(registry.charge("b", 50))
+        self.assertEqual(unloaded, ["a"])
+        self.assertFalse(registry.charge("b", 20))
+        self.assertEqual(registry.stats()["loaded"]["b"]["bytes"], 90)
+
+
+class ModelSizeTests(SimpleTestCase):
+    def test_size_comes_from_the_url_without_downloading(self):
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp)
+        config = ai_model.model_config("tinyllama")
+        kv_cache = config["kv_cache_bytes_per_token"] * config["context_length"]
+
+        with StubServer(FileServer(b"x" * 1000)) as server, \
+                mock.patch.object(ai_model, "MODEL_DIR", tmp), \
+                mock.patch.object(ai_model, "BACKEND_OVERRIDE", "ctransformers"), \
+                mock.patch.dict(ai_model._REMOTE_SIZES, clear=True), \
+                mock.patch.dict(AVAILABLE_MODELS["tinyllama"], {"url": server.url("/tiny.gguf")}), \
+                mock.patch.object(ai_model, "download_model") as download_model:
+            first = ai_model._model_memory_bytes("tinyllama")
+            second = ai_model._model_memory_bytes("tinyllama")
+
+        download_model.assert_not_called()
+        self.assertEqual(first, 1000 + kv_cache)
+        self.assertEqual(second, first)
+        self.assertEqual(server.count("HEAD"), 1)
 
-# Create your tests here.
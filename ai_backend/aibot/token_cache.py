@@ -0,0 +1,78 @@
+# ======================================================
+# aibot/token_cache.py
+# Cache of auth-service profiles by bearer token
+# ======================================================
+#
+# Profiles fetched from the auth service are kept for TOKEN_CACHE_TTL
+# seconds, but never past the token's own `exp`: an expired token must not
+# keep being served from the cache. Entries are keyed by a hash of the
+# token, so a shared cache never holds usable credentials.
+#
+# The local backend is bounded (least recently used entries go first).
+# With several web processes use AIBOT_TOKEN_CACHE_BACKEND=django so a
+# profile fetched by one worker is a hit in all of them.
+
+import os
+import time
+import hashlib
+
+from .cache_backends import CountingCache, get_cache_backend
+from .metrics import REGISTRY
+
+TOKEN_CACHE_BACKEND = os.getenv("AIBOT_TOKEN_CACHE_BACKEND", "local")
+TOKEN_CACHE_TTL = int(os.getenv("AIBOT_TOKEN_CACHE_TTL", "60"))  # seconds
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AIBOT_TOKEN_CACHE_MAX_ENTRIES", "4096"))
+
+
+class TokenCache(CountingCache):
+    """Profile payloads keyed by bearer token, with hit/miss/eviction stats."""
+
+    label = "Token cache"
+
+    def __init__(self, backend, ttl: int = TOKEN_CACHE_TTL):
+        super().__init__(backend)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(token: str) -> str:
+        return "token:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        """Returns the cached profile, or None on a miss."""
+        return self._lookup(self.make_key(token))
+
+    def set(self, token: str, user_data: dict, expires_at=None):
+        """
+        Stores a profile for at most `ttl` seconds, and not beyond
+        `expires_at` (the token's `exp`, a Unix timestamp) if known.
+        """
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl < 1:
+            return
+        self._store(self.make_key(token), user_data, ttl=ttl)
+
+    def delete(self, token: str):
+        """Forgets the profile cached for a token, e.g. after it was updated."""
+        self._discard(self.make_key(token))
+
+
+TOKEN_CACHE = TokenCache(
+    get_cache_backend(
+        TOKEN_CACHE_BACKEND,
+        max_entries=TOKEN_CACHE_MAX_ENTRIES,
+        default_ttl=TOKEN_CACHE_TTL,
+        prefix="aibot",
+    )
+)
+
+REGISTRY.counter_func(
+    "aibot_token_cache_total",
+    "Token cache lookups (hit / miss), stores and LRU evictions.",
+    ("event",),
+    lambda: {
+        (event,): TOKEN_CACHE.stats()[key]
+        for event, key in (("hit", "hits"), ("miss", "misses"), ("store", "stores"), ("eviction", "evictions"))
+    },
+)
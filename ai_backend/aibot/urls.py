@@ -1,12 +1,18 @@
 from django.urls import path
-from .views import  AIBotChatView,UserProfileView, AIBotChatDeleteView,AIBotChatSidebarView,AIBotChatDetailView
+from .views import  AIBotChatView,AIBotChatStreamView,UserProfileView, AIBotChatDeleteView,AIBotChatSidebarView,AIBotChatDetailView,ReadinessView,AIBotChatJobStatusView,AIBotChatJobResultView,AIBotChatCancelView,MetricsView
 
 urlpatterns = [
     #path('test-token/', TestTokenView.as_view(), name='test-token'),
     path('chat/', AIBotChatView.as_view(), name='chat'),
+    path('chat-stream/', AIBotChatStreamView.as_view(), name='chat-stream'),
+    path('chat-job-status/', AIBotChatJobStatusView.as_view(), name='chat-job-status'),
+    path('chat-job-result/', AIBotChatJobResultView.as_view(), name='chat-job-result'),
+    path('chat-cancel/', AIBotChatCancelView.as_view(), name='chat-cancel'),
     path('chat-sidebar/', AIBotChatSidebarView.as_view(), name='chat-sidebar'),
     path('chat-detail/', AIBotChatDetailView.as_view(), name='chat-detail'),
     path('del-aichat/',AIBotChatDeleteView.as_view(),name='del-aichat'),
     path("user-profile/", UserProfileView.as_view(), name="user-profile"),
+    path("ready/", ReadinessView.as_view(), name="ready"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 
 ]
@@ -3,7 +3,10 @@
 # API View Definitions (Django REST Framework)
 # ======================================================
 
+import json
+import math
 import logging
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -19,8 +22,22 @@ from .services import (
     execute_update_profile,
     PROFILE_FIELDS,
 )
+from .routing import route_model
+from .metrics import REGISTRY as METRICS, RATE_LIMITED
+from .rate_limit import check_rate_limit, client_ip
+from .chat_jobs import CHAT_JOBS, DONE, FAILED, cancel_chat_job, job_status, start_chat_job, touch_chat_job
 # Assuming aibot/ai_model.py exists with these functions/constants
-from .ai_model import generate_ai_response, AVAILABLE_MODELS 
+from .ai_model import (
+    generate_ai_response,
+    stream_ai_response,
+    InferenceOverloaded,
+    AVAILABLE_MODELS,
+    FALLBACK_RESPONSE,
+    STOP_CANCELLED,
+    STOP_DISCONNECT,
+    TRUNCATED_STOP_REASONS,
+    readiness,
+)
 
 
 logger = logging.getLogger("aibot.views")
@@ -31,18 +48,19 @@ from datetime import datetime
 
 
 # ======================================================
-# USER PROFILE VIEW (FAST: NO EXTRA NETWORK CALLS)
+# USER PROFILE VIEW
 # ======================================================
 
 class UserProfileView(APIView):
     """
-    Returns authenticated user profile data using cached/validated token data.
-    ZERO additional HTTP calls.
+    Returns authenticated user profile data. The only chat-side view that
+    needs the full profile, so the only one that fetches it from the auth
+    service (cached per token).
     """
     authentication_classes = []
     permission_classes = []
 
-    @require_bearer_token
+    @require_bearer_token(profile=True)
     def get(self, request):
         profile = request.user_data
 
@@ -54,6 +72,39 @@ class UserProfileView(APIView):
             "user_id": profile.get("id")
         })
 
+# ======================================================
+# READINESS VIEW (LOAD BALANCER HEALTH CHECK)
+# ======================================================
+
+class ReadinessView(APIView):
+    """
+    Returns 200 once every preloaded model is loaded and warm, 503 before.
+    The body lists the load state of each model.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        report = readiness()
+        return Response(
+            report,
+            status=status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+# ======================================================
+# METRICS VIEW (PROMETHEUS SCRAPE TARGET)
+# ======================================================
+
+class MetricsView(APIView):
+    """Inference counters and histograms of this process in the Prometheus text format."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return HttpResponse(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def format_duration(total_milliseconds):
     """
     Converts a total duration in milliseconds into a human-readable string
@@ -92,17 +143,300 @@ def format_duration(total_milliseconds):
 
 
 # ======================================================
-# CHAT INTERACTION VIEW (INTERACTION-BASED STORAGE)
+# CHAT HELPERS (SHARED BY BLOCKING AND STREAMING VIEWS)
 # ======================================================
 
+ACTION_INTENTS = {
+    "UPDATE_PROFILE",
+    "INCOMPLETE_ACTION",
+    "POSSIBLE_PROFILE_UPDATE",
+}
+
+
+def resolve_chat_user(request):
+    """
+    Returns (username, user_id, model_type) for the chat request.
+    Authenticated users default to Mistral and may pick another model;
+    guests are always served by TinyLlama.
+    """
+    if request.is_authenticated:
+        user = request.user_data.get("user", {})
+        username = user.get("username", "Unknown")
+        user_id = request.user_data.get("id")
+        default_model = "mistral"
+    else:
+        username = "Guest"
+        user_id = None
+        default_model = "tinyllama"
+
+    requested_model = request.data.get("model_type")
+    model_type = requested_model.lower() if requested_model else default_model
+
+    if model_type not in AVAILABLE_MODELS or not request.is_authenticated:
+        model_type = default_model
+
+    return username, user_id, model_type
+
+
+def request_priority(request):
+    """Scheduling class of a chat request (see fair_queue.PRIORITY_WEIGHTS)."""
+    return "authenticated" if request.is_authenticated else "guest"
 
 
+def classify_intent(message):
+    """Returns (intent_name, intent_data, intent_category, action_field)."""
+    intent_data = detect_intent(message)
+    intent_name = intent_data.get("intent", "CHAT")
+
+    intent_category = "action" if intent_name in ACTION_INTENTS else "chat"
+
+    action_field = None
+    if intent_category == "action":
+        data = intent_data.get("data", {})
+        # Comma-separated when one message updates several fields
+        action_field = ",".join(data.get("updates", {})) or data.get("field")
+    return intent_name, intent_data, intent_category, action_field
+
+
+def handle_action_intent(request, intent_name, intent_data):
+    """Builds the bot reply for profile-update intents (no LLM call)."""
+    if intent_name in {"INCOMPLETE_ACTION", "POSSIBLE_PROFILE_UPDATE"}:
+        return (
+            f"❌ {intent_data.get('reason', 'Invalid profile update request')}.\n\n"
+            "✅ Correct sentence examples:\n\n"
+            f"{build_examples()}"
+        )
+
+    data = intent_data.get("data", {})
+    updates = data.get("updates") or {data.get("field"): data.get("value")}
+
+    if not all(field in PROFILE_FIELDS for field in updates):
+        return (
+            "❌ This profile field cannot be updated.\n\n"
+            f"✅ Example:\n{build_examples()}"
+        )
+
+    # Nothing is changed unless every value is valid
+    errors = [(field, validate_field_value(field, value)) for field, value in updates.items()]
+    errors = [(field, error) for field, error in errors if error]
+    if errors:
+        return "\n\n".join(
+            f"❌ {error}\n\n✅ Correct example:\n{build_examples(field)}"
+            for field, error in errors
+        )
+
+    result = execute_update_profile(request, updates)
+    if len(updates) == 1:
+        field_cfg = PROFILE_FIELDS[next(iter(updates))]
+        failure, success = field_cfg["failure"], field_cfg["success"]
+    else:
+        labels = join_labels([PROFILE_FIELDS[field]["label"] for field in updates])
+        failure = f"❌ Failed to update your {labels}."
+        success = f"✅ Your {labels} have been updated successfully."
+
+    if "error" in result:
+        return (
+            f"{failure}\n\n"
+            f"ℹ Reason: {result['error']}"
+        )
+    return success
+
+
+def join_labels(labels):
+    """["name", "bio", "gender"] -> "name, bio and gender"."""
+    if len(labels) == 1:
+        return labels[0]
+    return ", ".join(labels[:-1]) + " and " + labels[-1]
+
+
+def build_interaction(*, message, user_timestamp_iso, ai_response, model_type,
+                      intent_name, intent_category, action_field, start_time,
+                      routing=None, stop_reason=None, inference=None):
+    """
+    Builds the v2 interaction record stored in AIConversation.conversation.
+    Answers cut short (deadline, cancel, disconnect) are stored as "truncated".
+    `inference` holds the model's own token counts and timings (see
+    GenerationResult.stats); time_taken_ms is the whole request.
+    """
+    end_time = time.time()
+    time_taken_ms = round((end_time - start_time) * 1000)
+
+    if intent_category == "action" and "❌" in ai_response:
+        interaction_status = "failed"
+    elif stop_reason in TRUNCATED_STOP_REASONS:
+        interaction_status = "truncated"
+    else:
+        interaction_status = "success"
+
+    return {
+        "schema_version": "v2",
+
+        "intent": intent_category,          # "chat" | "action"
+        "intent_type": intent_name,          # CHAT | UPDATE_PROFILE
+
+        "user_message": message,
+        "user_timestamp": user_timestamp_iso,
+
+        "ai_response": ai_response,
+        "ai_timestamp": datetime.now().isoformat(),
+
+        "model": model_type,
+        "routing": routing,                  # which model served it and why
+        "time_taken_ms": time_taken_ms,
+        "time_taken_formatted": format_duration(time_taken_ms),
+
+        "action_field": action_field,
+        "status": interaction_status,
+        "stop_reason": stop_reason,          # eos | length | deadline | cancelled | ...
+        "inference": inference,              # prompt/generated tokens, eval/decode ms, queue wait
+    }
+
+
+def chat_session_key(request, chat_id):
+    """Key that lets the inference layer reuse a chat's evaluated context."""
+    if request.is_authenticated and chat_id:
+        return f"chat:{chat_id}"
+    return None
+
+
+def overloaded_response(exc):
+    """503 answer for requests shed by the inference scheduler."""
+    response = Response(
+        {"error": "The AI model is busy. Please try again shortly."},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+def rate_limited_response(user_id, intent_category, retry_after):
+    """429 answer for clients that used up their rate limit."""
+    RATE_LIMITED.inc(client="guest" if user_id is None else "user", intent=intent_category)
+    retry_after = max(1, math.ceil(retry_after))
+    response = Response(
+        {"error": "Too many requests. Please slow down.", "retry_after": retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def build_response_data(request, username, interaction):
+    """Builds the JSON payload returned to the client for one interaction."""
+    return {
+        "user": username,
+        "ai_response": interaction["ai_response"],
+        "is_authenticated": request.is_authenticated,
+        "model_type": interaction["model"],
+        "degraded": bool(interaction["routing"] and interaction["routing"]["degraded"]),
+        "intent": interaction["intent_type"],
+        "intent_category": interaction["intent"],
+        "time_taken_ms": interaction["time_taken_ms"],
+        "time_taken_formatted": interaction["time_taken_formatted"],
+        "ai_response_timestamp": interaction["ai_timestamp"],
+        "truncated": interaction["status"] == "truncated",
+        "stop_reason": interaction["stop_reason"],
+        "inference": interaction["inference"],
+    }
+
+
+def load_conversation(request, chat_id, user_id):
+    """Returns the user's existing AIConversation for chat_id, or None."""
+    if not request.is_authenticated or not chat_id:
+        return None
+
+    try:
+        return AIConversation.objects.filter(
+            chat_id=chat_id,
+            user_id=user_id
+        ).first()
+    except Exception:
+        logger.exception("Failed to load conversation")
+        return None
+
+
+def chat_history(convo):
+    """
+    Earlier chat turns as (user_message, ai_response) pairs, oldest first.
+    Profile actions and failed generations are left out of the model context;
+    truncated answers stay in, as the user saw them.
+    """
+    if convo is None:
+        return []
+
+    turns = [
+        item for item in convo.conversation or []
+        if item.get("schema_version") == "v2"
+        and item.get("intent") == "chat"
+        and item.get("status") in ("success", "truncated")
+        and item.get("ai_response") not in (None, "", FALLBACK_RESPONSE)
+    ]
+    turns.sort(key=lambda x: x.get("user_timestamp", ""))
+    return [(item["user_message"], item["ai_response"]) for item in turns]
+
+
+def store_interaction(request, chat_id, user_id, username, interaction):
+    """
+    Appends the interaction to an existing chat or starts a new one.
+    Only authenticated users have their chats stored.
+
+    The chat is re-read here rather than reusing the copy loaded before
+    generation, so turns saved in the meantime are not overwritten.
+
+    Returns:
+        The chat_id the interaction was stored under, or None.
+    """
+    if not request.is_authenticated:
+        return None
+
+    try:
+        convo = None
+
+        if chat_id:
+            convo = AIConversation.objects.filter(
+                chat_id=chat_id,
+                user_id=user_id
+            ).first()
+
+        if convo:
+            convo.conversation.append(interaction)
+            convo.save()
+        else:
+            convo = AIConversation.objects.create(
+                user_id=user_id,
+                username=username,
+                is_authenticated=True,
+                conversation=[interaction],
+                ip_address=request.META.get("REMOTE_ADDR"),
+            )
+
+        return convo.chat_id
+
+    except Exception:
+        logger.exception("Failed to save conversation")
+        return None
+
+
+def finish_interaction(request, chat_id, user_id, username, interaction):
+    """Stores the interaction and returns the payload sent to the client."""
+    response_data = build_response_data(request, username, interaction)
+
+    stored_chat_id = store_interaction(request, chat_id, user_id, username, interaction)
+    if stored_chat_id is not None:
+        response_data["chat_id"] = stored_chat_id
+    return response_data
+
+
+# ======================================================
+# CHAT INTERACTION VIEW (INTERACTION-BASED STORAGE)
+# ======================================================
 
 class AIBotChatView(APIView):
     authentication_classes = []
     permission_classes = []
 
-    @optional_bearer_token
+    # The username is shown and stored, so the (cached) profile is needed
+    @optional_bearer_token(profile=True)
     def post(self, request):
         message = request.data.get("message")
         chat_id = request.data.get("chat_id")
@@ -121,170 +455,305 @@ class AIBotChatView(APIView):
         # -------------------------------
         # USER & MODEL SELECTION
         # -------------------------------
-        if request.is_authenticated:
-            user = request.user_data.get("user", {})
-            username = user.get("username", "Unknown")
-            user_id = request.user_data.get("id")
-            default_model = "mistral"
-        else:
-            username = "Guest"
-            user_id = None
-            default_model = "tinyllama"
-
-        requested_model = request.data.get("model_type")
-        model_type = requested_model.lower() if requested_model else default_model
-
-        if model_type not in AVAILABLE_MODELS or not request.is_authenticated:
-            model_type = default_model
+        username, user_id, model_type = resolve_chat_user(request)
 
         # -------------------------------
         # INTENT DETECTION
         # -------------------------------
         start_time = time.time()
 
-        intent_data = detect_intent(message)
-        intent_name = intent_data.get("intent", "CHAT")
+        intent_name, intent_data, intent_category, action_field = classify_intent(message)
 
-        ACTION_INTENTS = {
-            "UPDATE_PROFILE",
-            "INCOMPLETE_ACTION",
-            "POSSIBLE_PROFILE_UPDATE",
-        }
+        # -------------------------------
+        # INTENT HANDLING
+        # -------------------------------
+        convo = load_conversation(request, chat_id, user_id)
 
-        intent_category = "action" if intent_name in ACTION_INTENTS else "chat"
+        routing = None
+        if intent_category != "action":
+            routing = route_model(model_type, request.is_authenticated, message, max_tokens=256)
+            model_type = routing["model"]
 
-        action_field = (
-            intent_data.get("data", {}).get("field")
-            if intent_category == "action"
-            else None
+        # -------------------------------
+        # RATE LIMIT (charged for the model actually serving the message)
+        # -------------------------------
+        retry_after = check_rate_limit(
+            request, user_id, model_type, message, max_tokens=256,
+            is_action=intent_category == "action",
         )
+        if retry_after:
+            return rate_limited_response(user_id, intent_category, retry_after)
 
         # -------------------------------
-        # INTENT HANDLING
+        # ASYNC JOB MODE
         # -------------------------------
-        if intent_name in {"INCOMPLETE_ACTION", "POSSIBLE_PROFILE_UPDATE"}:
-            ai_response = (
-                f"❌ {intent_data.get('reason', 'Invalid profile update request')}.\n\n"
-                "✅ Correct sentence examples:\n\n"
-                f"{build_examples()}"
-            )
-
-        elif intent_name == "UPDATE_PROFILE":
-            field = action_field
-            value = intent_data.get("data", {}).get("value")
-            field_cfg = PROFILE_FIELDS.get(field)
-
-            if not field_cfg:
-                ai_response = (
-                    "❌ This profile field cannot be updated.\n\n"
-                    f"✅ Example:\n{build_examples()}"
-                )
-            else:
-                validation_error = validate_field_value(field, value)
-                if validation_error:
-                    ai_response = (
-                        f"❌ {validation_error}\n\n"
-                        f"✅ Correct example:\n{build_examples(field)}"
+        if request.data.get("async"):
+            chunks = None
+            if intent_category != "action":
+                # Queued now so an overloaded model still gets a 503
+                try:
+                    chunks = stream_ai_response(
+                        message=message,
+                        max_tokens=256,
+                        model_type=model_type,
+                        session_key=chat_session_key(request, chat_id),
+                        history=chat_history(convo),
+                        priority=request_priority(request),
                     )
-                else:
-                    result = execute_update_profile(request, field, value)
-                    if "error" in result:
-                        ai_response = (
-                            f"{field_cfg['failure']}\n\n"
-                            f"ℹ Reason: {result['error']}"
-                        )
-                    else:
-                        ai_response = field_cfg["success"]
+                except InferenceOverloaded as e:
+                    return overloaded_response(e)
+
+            def action_chunks():
+                yield handle_action_intent(request, intent_name, intent_data)
+
+            def finish(ai_response, stop_reason=None, inference=None):
+                interaction = build_interaction(
+                    message=message,
+                    user_timestamp_iso=user_timestamp_iso,
+                    ai_response=ai_response,
+                    model_type=model_type,
+                    intent_name=intent_name,
+                    intent_category=intent_category,
+                    action_field=action_field,
+                    start_time=start_time,
+                    routing=routing,
+                    stop_reason=stop_reason,
+                    inference=inference,
+                )
+                return finish_interaction(request, chat_id, user_id, username, interaction)
+
+            job = CHAT_JOBS.create(user_id, model_type, owner_ip=client_ip(request))
+            start_chat_job(job, chunks if chunks is not None else action_chunks(), finish)
+            return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
 
+        if intent_category == "action":
+            ai_response = handle_action_intent(request, intent_name, intent_data)
         else:
-            ai_response = generate_ai_response(
-                message=message,
-                max_tokens=256,
-                model_type=model_type,
-            )
+            try:
+                ai_response = generate_ai_response(
+                    message=message,
+                    max_tokens=256,
+                    model_type=model_type,
+                    session_key=chat_session_key(request, chat_id),
+                    history=chat_history(convo),
+                    priority=request_priority(request),
+                )
+            except InferenceOverloaded as e:
+                return overloaded_response(e)
 
         # -------------------------------
-        # TIMING
+        # BUILD INTERACTION OBJECT
         # -------------------------------
-        end_time = time.time()
-        time_taken_ms = round((end_time - start_time) * 1000)
-        time_taken_formatted = format_duration(time_taken_ms)
-        ai_response_timestamp_iso = datetime.now().isoformat()
+        interaction = build_interaction(
+            message=message,
+            user_timestamp_iso=user_timestamp_iso,
+            ai_response=ai_response,
+            model_type=model_type,
+            intent_name=intent_name,
+            intent_category=intent_category,
+            action_field=action_field,
+            start_time=start_time,
+            routing=routing,
+            stop_reason=getattr(ai_response, "stop_reason", None),
+            inference=getattr(ai_response, "stats", None),
+        )
 
         # -------------------------------
-        # BUILD INTERACTION OBJECT
+        # STORE CONVERSATION & RESPONSE PAYLOAD
         # -------------------------------
-        interaction = {
-            "schema_version": "v2",
+        response_data = finish_interaction(request, chat_id, user_id, username, interaction)
 
-            "intent": intent_category,          # "chat" | "action"
-            "intent_type": intent_name,          # CHAT | UPDATE_PROFILE
+        return Response(response_data)
 
-            "user_message": message,
-            "user_timestamp": user_timestamp_iso,
 
-            "ai_response": ai_response,
-            "ai_timestamp": ai_response_timestamp_iso,
+# ======================================================
+# CHAT STREAMING VIEW (SERVER-SENT EVENTS)
+# ======================================================
 
-            "model": model_type,
-            "time_taken_ms": time_taken_ms,
-            "time_taken_formatted": time_taken_formatted,
+def sse_event(event, payload):
+    """Formats one Server-Sent Events frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
-            "action_field": action_field,
-            "status": (
-                "failed"
-                if intent_category == "action" and "❌" in ai_response
-                else "success"
-            ),
-        }
 
-        # -------------------------------
-        # RESPONSE PAYLOAD
-        # -------------------------------
-        response_data = {
-            "user": username,
-            "ai_response": ai_response,
-            "is_authenticated": request.is_authenticated,
-            "model_type": model_type,
-            "intent": intent_name,
-            "intent_category": intent_category,
-            "time_taken_ms": time_taken_ms,
-            "time_taken_formatted": time_taken_formatted,
-            "ai_response_timestamp": ai_response_timestamp_iso,
-        }
+class AIBotChatStreamView(APIView):
+    """
+    Streaming variant of AIBotChatView.
 
-        # -------------------------------
-        # STORE CONVERSATION
-        # -------------------------------
-        if request.is_authenticated:
+    Emits `token` events while the model generates, then a single `done`
+    event carrying the same payload AIBotChatView returns. The finished
+    interaction is stored once the stream ends. If the client disconnects
+    the generation is cancelled and the partial answer stored as truncated.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    # The username is shown and stored, so the (cached) profile is needed
+    @optional_bearer_token(profile=True)
+    def post(self, request):
+        message = request.data.get("message")
+        chat_id = request.data.get("chat_id")
+        user_timestamp_iso = request.data.get(
+            "user_timestamp",
+            datetime.now().isoformat()
+        )
+
+        if not message:
+            return Response({"error": "Message is required"}, status=400)
+
+        username, user_id, model_type = resolve_chat_user(request)
+
+        start_time = time.time()
+        intent_name, intent_data, intent_category, action_field = classify_intent(message)
+
+        # Queue the generation before answering so an overloaded model
+        # still gets a proper 503 instead of a broken stream.
+        convo = load_conversation(request, chat_id, user_id)
+
+        routing = None
+        if intent_category != "action":
+            routing = route_model(model_type, request.is_authenticated, message, max_tokens=256)
+            model_type = routing["model"]
+
+        retry_after = check_rate_limit(
+            request, user_id, model_type, message, max_tokens=256,
+            is_action=intent_category == "action",
+        )
+        if retry_after:
+            return rate_limited_response(user_id, intent_category, retry_after)
+
+        chunk_stream = None
+        if intent_category != "action":
             try:
-                convo = None
-
-                if chat_id:
-                    convo = AIConversation.objects.filter(
-                        chat_id=chat_id,
-                        user_id=user_id
-                    ).first()
-
-                if convo:
-                    convo.conversation.append(interaction)
-                    convo.save()
-                else:
-                    convo = AIConversation.objects.create(
-                        user_id=user_id,
-                        username=username,
-                        is_authenticated=True,
-                        conversation=[interaction],
-                        ip_address=request.META.get("REMOTE_ADDR"),
-                    )
+                chunk_stream = stream_ai_response(
+                    message=message,
+                    max_tokens=256,
+                    model_type=model_type,
+                    session_key=chat_session_key(request, chat_id),
+                    history=chat_history(convo),
+                    priority=request_priority(request),
+                )
+            except InferenceOverloaded as e:
+                return overloaded_response(e)
 
-                response_data["chat_id"] = convo.chat_id
+        def store(ai_response, stop_reason=None, inference=None):
+            interaction = build_interaction(
+                message=message,
+                user_timestamp_iso=user_timestamp_iso,
+                ai_response=ai_response,
+                model_type=model_type,
+                intent_name=intent_name,
+                intent_category=intent_category,
+                action_field=action_field,
+                start_time=start_time,
+                routing=routing,
+                stop_reason=stop_reason,
+                inference=inference,
+            )
+            return finish_interaction(request, chat_id, user_id, username, interaction)
 
-            except Exception:
-                logger.exception("Failed to save conversation")
+        def event_stream():
+            if chunk_stream is None:
+                ai_response = handle_action_intent(request, intent_name, intent_data)
+                yield sse_event("token", {"text": ai_response})
+                yield sse_event("done", store(ai_response))
+                return
 
-        return Response(response_data)
+            chunks = []
+            try:
+                for chunk in chunk_stream:
+                    chunks.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            except GeneratorExit:
+                # The server closes the response when the client goes away
+                chunk_stream.cancel(STOP_DISCONNECT)
+                store("".join(chunks).strip(), STOP_DISCONNECT, chunk_stream.stats)
+                raise
+
+            yield sse_event("done", store("".join(chunks).strip(), chunk_stream.stop_reason, chunk_stream.stats))
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # keep nginx from buffering tokens
+        return response
+
+
+
+# ======================================================
+# ASYNC CHAT JOB VIEWS
+# ======================================================
+
+def load_chat_job(request, job_id):
+    """
+    Returns the job with that id, or None if it does not exist, has
+    expired or belongs to another user. Guest jobs are only reachable from
+    the address that started them.
+    """
+    job = CHAT_JOBS.get(job_id)
+    if job is None:
+        return None
+    if job["owner_id"] is not None:
+        if not request.is_authenticated or request.user_data.get("id") != job["owner_id"]:
+            return None
+    elif job.get("owner_ip") != client_ip(request):
+        return None
+    return job
+
+
+class AIBotChatJobStatusView(APIView):
+    """Progress of an async chat job: status and the answer so far."""
+    authentication_classes = []
+    permission_classes = []
+
+    @optional_bearer_token
+    def get(self, request):
+        job = load_chat_job(request, request.query_params.get("job_id"))
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
+        touch_chat_job(job)
+        return Response(job_status(job))
+
+
+class AIBotChatJobResultView(APIView):
+    """
+    Final payload of an async chat job (the same body /aibot/chat/ returns
+    synchronously). Answers 202 with the job status while it is running.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    @optional_bearer_token
+    def get(self, request):
+        job = load_chat_job(request, request.query_params.get("job_id"))
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
+        touch_chat_job(job)
+
+        if job["status"] == DONE:
+            return Response(job["result"])
+        if job["status"] == FAILED:
+            return Response(
+                {"error": "The AI response could not be generated.", **job_status(job)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
+
+
+class AIBotChatCancelView(APIView):
+    """
+    Stops an async chat job. The answer generated so far is stored as a
+    truncated interaction and becomes the job's result.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    @optional_bearer_token
+    def post(self, request):
+        job = load_chat_job(request, request.data.get("job_id"))
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
 
+        cancel_chat_job(job, STOP_CANCELLED)
+        return Response(job_status(CHAT_JOBS.get(job["job_id"]) or job), status=status.HTTP_202_ACCEPTED)
 
 
 # ======================================================
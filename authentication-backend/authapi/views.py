@@ -240,6 +240,11 @@ class LoginView(APIView):
             if user:
                 # Generate JWT tokens
                 refresh = RefreshToken.for_user(user)
+                # Copied into every access token; the AI chat service reads
+                # it after verifying the token instead of fetching the profile.
+                # Only ids go in: names and emails can change before it expires.
+                profile = Profile.objects.filter(user=user).only("id").first()
+                refresh["profile_id"] = profile.id if profile else None
                 return Response({
                     "message": "Login successful",
                     "access": str(refresh.access_token),
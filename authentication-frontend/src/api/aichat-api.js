@@ -3,7 +3,9 @@ import { getAccessToken } from "../utils/tokenmanager";
 
 const apiAI = axios.create({
   baseURL: "http://127.0.0.1:8001",
-  //timeout: 15000,
+  // Chat generations run as async jobs (see services/aibot.js), so every
+  // request to the AI backend is expected to answer quickly
+  timeout: 15000,
   headers: { "Content-Type": "application/json" },
 });
 
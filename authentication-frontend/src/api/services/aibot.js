@@ -5,3 +5,36 @@ export const getChatSidebar = () => apiAI.get("/aibot/chat-sidebar/");
 export const getChatDetail = (chat_id) => apiAI.get("/aibot/chat-detail/", );
 export const deleteChat = (chat_id) => apiAI.delete("/aibot/del-aichat/", );
 export const createNewChat = () => apiAI.post("/aibot/user-profile/");
+
+// Async chat jobs: the backend answers 202 with a job id right away and
+// the answer is polled for, so long generations never hit the timeout.
+export const startChatJob = (data) => apiAI.post("/aibot/chat/", { ...data, async: true });
+export const getChatJobStatus = (job_id) => apiAI.get("/aibot/chat-job-status/", { params: { job_id } });
+export const getChatJobResult = (job_id) => apiAI.get("/aibot/chat-job-result/", { params: { job_id } });
+// Stops the generation; the partial answer is kept as a truncated reply
+export const cancelChatJob = (job_id) => apiAI.post("/aibot/chat-cancel/", { job_id });
+
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_MAX_WAIT_MS = 5 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Polls a chat job until it finishes and returns the final payload (the
+// same body a synchronous /aibot/chat/ call returns). onProgress receives
+// each status update, including the partial answer.
+export const waitForChatJob = async (job_id, { onProgress } = {}) => {
+  const deadline = Date.now() + JOB_MAX_WAIT_MS;
+
+  while (Date.now() < deadline) {
+    const { data: job } = await getChatJobStatus(job_id);
+    if (onProgress) onProgress(job);
+
+    if (job.status === "done" || job.status === "failed") {
+      const res = await getChatJobResult(job_id);
+      return res.data;
+    }
+    await sleep(JOB_POLL_INTERVAL_MS);
+  }
+  cancelChatJob(job_id).catch(() => {});
+  throw new Error("Timed out waiting for the AI response");
+};
@@ -2,6 +2,7 @@ import React, { useEffect, useState, useRef } from "react";
 import { useAuth } from "../hooks/useAuth";
 import { useNavigate } from "react-router-dom";
 import apiAI from "../api/aichat-api";
+import { startChatJob, waitForChatJob } from "../api/services/aibot";
 
 const AVAILABLE_MODELS = ["tinyllama", "mistral"];
 
@@ -165,24 +166,25 @@ const Dashboard = () => {
         setError("");
 
         try {
-            const res = await apiAI.post("/aibot/chat/", {
+            const { data: job } = await startChatJob({
                 chat_id: selectedChatId,
                 message: content,
                 model_type: modelType,
                 user_timestamp: userTimestamp,
             });
+            const result = await waitForChatJob(job.job_id);
 
-            if (!selectedChatId && res.data.chat_id) {
-                setSelectedChatId(res.data.chat_id);
+            if (!selectedChatId && result.chat_id) {
+                setSelectedChatId(result.chat_id);
                 await loadSidebarChats();
             }
 
             const aiMsg = {
                 role: "assistant",
-                content: res.data.ai_response,
-                model: res.data.model_type,
-                time_taken: res.data.time_taken_ms,
-                timestamp: res.data.ai_response_timestamp,
+                content: result.ai_response,
+                model: result.model_type,
+                time_taken: result.time_taken_ms,
+                timestamp: result.ai_response_timestamp,
             };
 
             setMessages(prev => [...prev, aiMsg]);